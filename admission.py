@@ -0,0 +1,191 @@
+"""Admission control for the public write endpoints.
+
+Anonymous POSTs to /submit_feedback and /register/<event_id> each take the
+SQLite write lock, and a single script could keep it busy for everyone.
+Before such a request runs it must pass two checks:
+
+* a token bucket per client and endpoint (ADMISSION_RATES), refused with
+  429 and a Retry-After of when the next token is due;
+* a limit on database writes running at once in this process
+  (ADMISSION_MAX_CONCURRENT_WRITES). A request waits at most
+  ADMISSION_QUEUE_SECONDS for a slot and is then refused with 503, rather
+  than queuing on the write lock until the server times it out.
+
+The bucket is checked by @limit before the body is read. The view takes a
+write slot itself (acquire_write / release_write) only around its INSERT,
+once the form and any upload have been received, so slow uploads cannot
+hold every slot.
+
+Identical feedback messages seen recently are accepted but not stored again.
+
+State is kept per worker process, so with N workers a client gets up to N
+times its rate. Behind a reverse proxy set ADMISSION_PROXY_HOPS so clients
+are told apart by their forwarded address rather than the proxy's.
+"""
+import hashlib
+import math
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from flask import current_app, jsonify, request
+
+WRITE_METHODS = ('POST', 'PUT', 'PATCH', 'DELETE')
+
+
+class TokenBuckets:
+    """One token bucket per key: `burst` requests at once, refilled at `burst / per_seconds` a second."""
+
+    def __init__(self, burst, per_seconds, max_keys=10000):
+        self.burst = burst
+        self.rate = burst / per_seconds
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()  # key -> (tokens, updated), least recently seen first
+        self._lock = threading.Lock()
+
+    def take(self, key, now=None):
+        """Take a token for `key`; return 0 if one was available, else seconds until the next one."""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            tokens, updated = self._buckets.pop(key, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - updated) * self.rate)
+            wait = 0.0
+            if tokens >= 1:
+                tokens -= 1
+            else:
+                wait = (1 - tokens) / self.rate
+            self._buckets[key] = (tokens, now)
+            # A forgotten client comes back with a full bucket, which is where it would be by then anyway.
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+            return wait
+
+
+class DuplicateWindow:
+    """Hashes of the last `size` texts seen within `seconds`."""
+
+    def __init__(self, size, seconds):
+        self.size = size
+        self.seconds = seconds
+        self._seen = OrderedDict()  # digest -> time first seen, oldest first
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _digest(text):
+        # Case and whitespace changes do not make a message new.
+        return hashlib.sha256(' '.join(text.lower().split()).encode('utf-8')).digest()
+
+    def seen(self, text, now=None):
+        """Record `text` and return True if it was already seen inside the window.
+
+        Recording happens here, in the same locked step as the check, so two
+        concurrent copies cannot both pass; call forget() if `text` then
+        fails to be stored.
+        """
+        now = time.monotonic() if now is None else now
+        digest = self._digest(text)
+        with self._lock:
+            while self._seen and (len(self._seen) >= self.size or next(iter(self._seen.values())) < now - self.seconds):
+                self._seen.popitem(last=False)
+            if digest in self._seen:
+                return True
+            self._seen[digest] = now
+            return False
+
+    def forget(self, text):
+        with self._lock:
+            self._seen.pop(self._digest(text), None)
+
+
+class Admission:
+    def __init__(self, config):
+        self.buckets = {name: TokenBuckets(burst, per_seconds)
+                        for name, (burst, per_seconds) in config['ADMISSION_RATES'].items()}
+        self.writes = threading.BoundedSemaphore(config['ADMISSION_MAX_CONCURRENT_WRITES'])
+        self.queue_seconds = config['ADMISSION_QUEUE_SECONDS']
+        self.feedback = DuplicateWindow(config['FEEDBACK_DUPLICATE_WINDOW'], config['FEEDBACK_DUPLICATE_SECONDS'])
+
+
+def client_key():
+    hops = current_app.config['ADMISSION_PROXY_HOPS']
+    if hops:
+        # The address the outermost trusted proxy saw; anything left of it is client-supplied.
+        route = request.access_route
+        return route[-hops] if len(route) >= hops else route[0]
+    return request.remote_addr or 'unknown'
+
+
+def _refuse(status, message, retry_after):
+    if request.headers.get('X-Requested-With') == 'XMLHttpRequest' or 'application/json' in request.headers.get('Accept', ''):
+        response = jsonify({'success': False, 'message': message})
+    else:
+        response = current_app.response_class(message, mimetype='text/plain')
+    response.status_code = status
+    response.headers['Retry-After'] = str(max(1, math.ceil(retry_after)))
+    return response
+
+
+def limit(name):
+    """Admit write requests to a view through the `name` token bucket."""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            admission = current_app.extensions.get('admission')
+            if admission is None or request.method not in WRITE_METHODS:
+                return view(*args, **kwargs)
+
+            wait = admission.buckets[name].take(client_key())
+            if wait:
+                return _refuse(429, 'Too many submissions. Please wait a moment and try again.', wait)
+            return view(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def acquire_write():
+    """Take a write slot, waiting at most ADMISSION_QUEUE_SECONDS; False if none came free.
+
+    Call it after the request body has been read, and release_write() once
+    the write is committed. A refused request answers with busy().
+    """
+    admission = current_app.extensions.get('admission')
+    return admission is None or admission.writes.acquire(timeout=admission.queue_seconds)
+
+
+def release_write():
+    admission = current_app.extensions.get('admission')
+    if admission is not None:
+        admission.writes.release()
+
+
+def busy():
+    return _refuse(503, 'The server is busy. Please try again in a few seconds.', 1)
+
+
+def is_duplicate_feedback(message):
+    admission = current_app.extensions.get('admission')
+    return admission is not None and admission.feedback.seen(message)
+
+
+def forget_feedback(message):
+    """Undo is_duplicate_feedback() for a message that was not stored after all."""
+    admission = current_app.extensions.get('admission')
+    if admission is not None:
+        admission.feedback.forget(message)
+
+
+def init_app(app):
+    app.config.setdefault('ADMISSION_ENABLED', True)
+    # Endpoint -> (burst, per seconds). Registration is keyed by address too, and a
+    # whole lecture hall on campus NAT or event Wi-Fi shares one, so its bucket is
+    # sized for a room registering at once; the write-concurrency cap below is what
+    # protects the database from a single flooding script.
+    app.config.setdefault('ADMISSION_RATES', {'feedback': (5, 60), 'register': (600, 60)})
+    app.config.setdefault('ADMISSION_MAX_CONCURRENT_WRITES', 4)
+    app.config.setdefault('ADMISSION_QUEUE_SECONDS', 0.25)
+    app.config.setdefault('ADMISSION_PROXY_HOPS', 0)
+    app.config.setdefault('FEEDBACK_DUPLICATE_WINDOW', 1000)
+    app.config.setdefault('FEEDBACK_DUPLICATE_SECONDS', 3600)
+    if app.config['ADMISSION_ENABLED']:
+        app.extensions['admission'] = Admission(app.config)
@@ -1,75 +1,108 @@
-from flask import Flask, render_template, request, redirect, url_for, session, flash, jsonify, send_from_directory
-import sqlite3
+from flask import Blueprint, Flask, Response, current_app, render_template, request, redirect, url_for, session, flash, jsonify
 import os
-import secrets
-import string
-from werkzeug.utils import secure_filename
 from datetime import datetime
 
-app = Flask(__name__)
-app.secret_key = 'super_secret_key_123'
+import admission
+import assets
+import audit
+import backup
+import bulk
+import cache
+import db
+import exports
+import images
+import live
+import metrics
+import migrations
+import pagination
+import proof_storage
+import registrations
+import search
+import tickets
+import upload_gc
+from audit import log_activity
+from cache import cached_page, cached_query
+from db import get_db_connection
 
 # --- 1. SET ABSOLUTE PATHS ---
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 DB_PATH = os.path.join(BASE_DIR, 'database.db')
 UPLOAD_FOLDER = os.path.join(BASE_DIR, 'static', 'uploads')
-
-app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
-os.makedirs(UPLOAD_FOLDER, exist_ok=True)
-
 PAYMENT_PROOF_FOLDER = os.path.join(UPLOAD_FOLDER, 'payment_proofs')
-os.makedirs(PAYMENT_PROOF_FOLDER, exist_ok=True)
-
-def get_db_connection():
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    return conn
 
-def init_registration_table():
-    """Create event_registrations table if it doesn't exist"""
-    conn = get_db_connection()
-    conn.execute('''
-        CREATE TABLE IF NOT EXISTS event_registrations (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            event_id INTEGER NOT NULL,
-            name TEXT NOT NULL,
-            dept_no TEXT NOT NULL,
-            class_section TEXT NOT NULL,
-            phone TEXT,
-            registration_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (event_id) REFERENCES events (id)
-        )
-    ''')
-    conn.commit()
-    conn.close()
-
-# Initialize registration table on startup
-init_registration_table()
-
-def log_activity(action):
-    try:
-        conn = get_db_connection()
-        conn.execute('INSERT INTO activity_logs (action) VALUES (?)', (action,))
-        conn.commit()
+bp = Blueprint('main', __name__)
+
+def create_app(config=None):
+    """Build and configure the application.
+
+    Nothing here touches the database: the schema is brought up to date once
+    per deploy with `flask db-migrate` (or the server's on_starting hook), not
+    by every worker as it boots.
+    """
+    app = Flask(__name__)
+    app.secret_key = 'super_secret_key_123'
+    app.config['DATABASE'] = DB_PATH
+    app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
+    app.config['PAYMENT_PROOF_FOLDER'] = PAYMENT_PROOF_FOLDER
+    # Larger bodies are refused before they are read. Sized for multi-photo gallery
+    # uploads; the registration form sets its own, smaller cap (proof_storage.limit_request).
+    app.config['MAX_CONTENT_LENGTH'] = 256 * 1024 * 1024
+    if config:
+        app.config.update(config)
+    os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
+    os.makedirs(app.config['PAYMENT_PROOF_FOLDER'], exist_ok=True)
+
+    # One pooled connection per request, returned to the pool on teardown.
+    db.init_app(app)
+    # Audit events are batched and written by a background thread.
+    audit.init_app(app)
+    # Resized WebP/JPEG copies of uploaded images, built off the request thread.
+    images.init_app(app)
+    # Rendered public pages are served from memory until the tables behind them change.
+    cache.init_app(app)
+    # Payment proofs are streamed to disk under their content hash, with a size cap.
+    proof_storage.init_app(app)
+    # `flask db-migrate`
+    migrations.init_app(app)
+    # Per-endpoint latency and SQL timings on /metrics, plus a slow-request log.
+    metrics.init_app(app)
+    # Fingerprinted, precompressed CSS/JS (`flask build-assets`) served as immutable.
+    assets.init_app(app)
+    # Per-client rate limits and a write-concurrency cap on the public forms.
+    admission.init_app(app)
+    # `flask gc-uploads`: incremental cleanup of files no row refers to.
+    upload_gc.init_app(app)
+    # Compressed online snapshots of the database (`flask backup-db`, `flask restore-db`), on a timer.
+    backup.init_app(app)
+    # QR-coded ticket passes (and optional confirmation mails), built by a worker pool.
+    tickets.init_app(app)
+    # New feedback, registrations and log entries pushed to open admin pages (/admin/stream).
+    live.init_app(app)
+
+    def refresh_image_pages(filename):
+        # Cached pages list srcset variants, so rebuild them once new variants exist.
+        conn = db.connect(app.config['DATABASE'])
+        cache.bump_versions(conn, ('events', 'gallery'))
         conn.close()
-    except Exception as e:
-        print(f"Log Error: {e}")
+
+    app.extensions['image_pipeline'].on_complete = refresh_image_pages
+    app.register_blueprint(bp)
+    return app
 
 # --- ROUTES ---
 
-@app.route('/')
+@bp.route('/')
+@cached_page('events', 'gallery')
 def home():
     try:
-        conn = get_db_connection()
-        recent_events = conn.execute('SELECT * FROM events ORDER BY event_date DESC LIMIT 3').fetchall()
-        recent_photos = conn.execute('SELECT * FROM gallery ORDER BY upload_date DESC LIMIT 6').fetchall()
-        conn.close()
+        recent_events = cached_query(['events'], 'SELECT * FROM events ORDER BY event_date DESC LIMIT 3')
+        recent_photos = cached_query(['gallery'], 'SELECT * FROM gallery ORDER BY upload_date DESC LIMIT 6')
         return render_template('index.html', recent_events=recent_events, recent_photos=recent_photos)
     except Exception as e:
         print(f"Database Error: {e}")
         return render_template('index.html', recent_events=[], recent_photos=[])
 
-@app.route('/login', methods=['GET', 'POST'])
+@bp.route('/login', methods=['GET', 'POST'])
 def login():
     error = None
     if request.method == 'POST':
@@ -78,12 +111,11 @@ def login():
         
         conn = get_db_connection()
         user = conn.execute('SELECT * FROM users WHERE username = ?', (username,)).fetchone()
-        conn.close()
 
         if user and user['password'] == password:
             session['admin'] = True
             log_activity(f"User logged in: {username}")
-            return redirect(url_for('dashboard'))
+            return redirect(url_for('main.dashboard'))
         else:
             log_activity(f"Failed login attempt for: {username}")
             error = 'invalid'  # Pass error type to template
@@ -91,40 +123,68 @@ def login():
     return render_template('login.html', error=error)
 
 # --- ONLY ONE LOGOUT FUNCTION HERE ---
-@app.route('/logout')
+@bp.route('/logout')
 def logout():
     if session.get('admin'):
         log_activity("User logged out")
     session.pop('admin', None)
-    return redirect(url_for('home'))
+    return redirect(url_for('main.home'))
 
-@app.route('/dashboard')
+@bp.route('/dashboard')
 def dashboard():
-    if not session.get('admin'): return redirect(url_for('login'))
+    if not session.get('admin'): return redirect(url_for('main.login'))
+    # Only the shell is rendered here; each section loads itself from dashboard_section().
     conn = get_db_connection()
-    events = conn.execute('SELECT * FROM events ORDER BY event_date DESC').fetchall()
-    photos = conn.execute('SELECT * FROM gallery ORDER BY upload_date DESC').fetchall()
-    materials = conn.execute('SELECT * FROM materials ORDER BY upload_date DESC').fetchall()
-    
-    # Get registration counts
-    # FIXED: Counting from hackathon_registrations explicitly for the Hackathon event
-    hackathon_count = conn.execute('SELECT COUNT(*) FROM hackathon_registrations').fetchone()[0]
-    
-    registrations = {}
-    for event in events:
-        # Assign the hackathon count to the event (assuming this is the hackathon event)
-        # If there are multiple events, this might need refinement, but for now this links the dashboard 
-        # to the actual data we are manipulating.
-        registrations[event['id']] = hackathon_count
-    
-    # Get anonymous feedback messages (newest first)
-    feedback_messages = conn.execute('SELECT * FROM feedback ORDER BY timestamp DESC').fetchall()
-    
-    conn.close()
-    return render_template('dashboard.html', events=events, photos=photos, materials=materials, registrations=registrations, feedback_messages=feedback_messages)
+    since = live.current_cursor(conn)
+    counts = {row['table_name']: row['row_count'] for row in conn.execute('SELECT * FROM table_counts')}
+    return render_template('dashboard.html', counts=counts, since=since)
+
+@bp.route('/admin/stream')
+def admin_stream():
+    if not session.get('admin'):
+        return jsonify({'error': 'Unauthorized'}), 403
+    # A reconnecting EventSource sends the id of the last event it got; a page passes the cursor it was built from.
+    cursor = live.parse_cursor(request.headers.get('Last-Event-ID') or request.args.get('since'))
+    if 'application/json' in request.headers.get('Accept', ''):
+        return jsonify(live.poll(get_db_connection(), cursor))
+    return live.stream_response(cursor)
+
+# Section name -> (table, columns, sort column) for the dashboard's JSON endpoints.
+DASHBOARD_SECTIONS = {
+    'events': ('events', 'id, title, event_date, event_manager', 'event_date'),
+    'photos': ('gallery', 'id, image_file, caption, upload_date', 'upload_date'),
+    'materials': ('materials', 'id, title, subject, target_year, semester, file_link, upload_date', 'upload_date'),
+    'feedback': ('feedback', 'id, message, timestamp', 'timestamp'),
+}
+
+@bp.route('/dashboard/api/<section>')
+def dashboard_section(section):
+    if not session.get('admin'):
+        return jsonify({'error': 'Unauthorized'}), 403
+    if section not in DASHBOARD_SECTIONS:
+        return jsonify({'error': 'Unknown section'}), 404
+
+    table, columns, sort_column = DASHBOARD_SECTIONS[section]
+    conn = get_db_connection()
+    rows, next_cursor = pagination.fetch_page(conn, table, columns, sort_column,
+                                              cursor=request.args.get('cursor'),
+                                              limit=pagination.clamp_limit(request.args.get('limit')))
+    items = [dict(row) for row in rows]
+
+    if section == 'events':
+        # One indexed lookup per listed event in the trigger-maintained stats table.
+        totals = registrations.event_totals(conn, [item['id'] for item in items])
+        for item in items:
+            item['registrations'] = totals[item['id']]
+    elif section == 'photos':
+        for item in items:
+            item['image_url'] = images.image_url(item['image_file'], width=320)
+
+    return jsonify({'items': items, 'next_cursor': next_cursor})
 
 # --- ANONYMOUS FEEDBACK (Student Voice) ---
-@app.route('/submit_feedback', methods=['POST'])
+@bp.route('/submit_feedback', methods=['POST'])
+@admission.limit('feedback')
 def submit_feedback():
     message = request.form.get('message', '').strip()
     
@@ -133,15 +193,26 @@ def submit_feedback():
         if request.headers.get('X-Requested-With') == 'XMLHttpRequest' or request.content_type == 'application/x-www-form-urlencoded':
             return jsonify({'success': False, 'message': 'Please enter a message'}), 400
         flash('Please enter a message', 'error')
-        return redirect(url_for('home'))
+        return redirect(url_for('main.home'))
     
     try:
-        conn = get_db_connection()
-        conn.execute('INSERT INTO feedback (message) VALUES (?)', (message,))
-        conn.commit()
-        conn.close()
-        
-        log_activity("New anonymous feedback submitted")
+        # A repeated message is acknowledged like a new one but not stored twice.
+        if not admission.is_duplicate_feedback(message):
+            if not admission.acquire_write():
+                admission.forget_feedback(message)
+                return admission.busy()
+            try:
+                conn = get_db_connection()
+                conn.execute('INSERT INTO feedback (message) VALUES (?)', (message,))
+                conn.commit()
+            except Exception:
+                # Not stored, so the user's retry of this message must not count as a duplicate.
+                admission.forget_feedback(message)
+                raise
+            finally:
+                admission.release_write()
+
+            log_activity("New anonymous feedback submitted")
         
         # Return JSON for AJAX requests
         if request.headers.get('X-Requested-With') == 'XMLHttpRequest' or 'application/json' in request.headers.get('Accept', ''):
@@ -149,63 +220,61 @@ def submit_feedback():
         
         # Regular redirect for non-AJAX requests
         flash('Thank you for your feedback! Your voice matters.', 'success')
-        return redirect(url_for('home'))
+        return redirect(url_for('main.home'))
     except Exception as e:
         if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
             return jsonify({'success': False, 'message': 'An error occurred'}), 500
         flash('An error occurred. Please try again.', 'error')
-        return redirect(url_for('home'))
+        return redirect(url_for('main.home'))
 
-@app.route('/clear_inbox', methods=['POST'])
+@bp.route('/clear_inbox', methods=['POST'])
 def clear_inbox():
     if not session.get('admin'):
-        return redirect(url_for('login'))
+        return redirect(url_for('main.login'))
     
     try:
         conn = get_db_connection()
         count = conn.execute('SELECT COUNT(*) FROM feedback').fetchone()[0]
         conn.execute('DELETE FROM feedback')
         conn.commit()
-        conn.close()
         
         log_activity(f"Cleared {count} feedback message(s) from inbox")
         flash(f'Successfully deleted {count} feedback message(s).', 'success')
     except Exception as e:
         flash('An error occurred while clearing the inbox.', 'error')
     
-    return redirect(url_for('dashboard'))
+    return redirect(url_for('main.dashboard'))
 
 # --- EVENTS ---
-@app.route('/events')
+@bp.route('/events')
+@cached_page('events')
 def events():
-    conn = get_db_connection()
-    events = conn.execute('SELECT * FROM events ORDER BY event_date DESC').fetchall()
-    conn.close()
+    events = cached_query(['events'], 'SELECT * FROM events ORDER BY event_date DESC')
     return render_template('events.html', events=events)
 
 # --- EVENT REGISTRATION ---
-@app.route('/register/<int:event_id>', methods=['GET', 'POST'])
+@bp.route('/register/<int:event_id>', methods=['GET', 'POST'])
+@admission.limit('register')
 def register_event(event_id):
     conn = get_db_connection()
     event = conn.execute('SELECT * FROM events WHERE id = ?', (event_id,)).fetchone()
     
     if not event:
-        conn.close()
         flash('Event not found', 'error')
-        return redirect(url_for('events'))
+        return redirect(url_for('main.events'))
     
     # --- REPLACED WITH HACKATHON LOGIC ---
     if request.method == 'POST':
+        proof_storage.limit_request()
         full_name = request.form.get('full_name')
         email = request.form.get('email')
         phone_number = request.form.get('phone_number')
         participation_type = request.form.get('participation_type', 'Solo')
         college_selection = request.form.get('college_selection')
         
-        # Generate Ticket ID
-        # Format: HT-XXXXXX (6 random digits)
-        ticket_id = 'HT-' + ''.join(secrets.choice(string.digits) for _ in range(6))
-        
+        # A retried or double-clicked submission carries the same key and lands on the same row.
+        idempotency_key = request.form.get('idempotency_key') or None
+
         # Logic for College Name
         if college_selection == 'other':
             college_name = request.form.get('other_college_name').strip()
@@ -213,81 +282,119 @@ def register_event(event_id):
             college_name = "St. Joseph's College (Autonomous)"
             
         # File Handling
+        proof_store = current_app.extensions['proof_store']
         payment_proof_file = request.files.get('payment_proof')
         if payment_proof_file and payment_proof_file.filename != '':
-            filename = secure_filename(f"{datetime.now().timestamp()}_{payment_proof_file.filename}")
-            payment_proof_file.save(os.path.join(PAYMENT_PROOF_FOLDER, filename))
+            try:
+                filename, proof_created = proof_store.save(payment_proof_file)
+            except proof_storage.ProofRejected as e:
+                flash(str(e), 'error')
+                return render_template('hackathon_register.html', event=event, idempotency_key=idempotency_key)
         else:
             flash('Payment proof is required!', 'error')
-            return render_template('hackathon_register.html', event=event)
-
+            return render_template('hackathon_register.html', event=event, idempotency_key=idempotency_key)
+
+        fields = {'event_id': event_id, 'full_name': full_name, 'email': email, 'phone_number': phone_number, 'college_name': college_name,
+                  'payment_proof': filename, 'participation_type': participation_type}
+        # The form and the proof are in by now, so the write slot only covers the INSERT.
+        if not admission.acquire_write():
+            if proof_created and not registrations.proof_in_use(conn, filename):
+                proof_store.delete(filename)
+            return admission.busy()
         try:
-            conn = get_db_connection()
-            cursor = conn.execute('INSERT INTO hackathon_registrations (full_name, email, phone_number, college_name, payment_proof, participation_type, ticket_id) VALUES (?, ?, ?, ?, ?, ?, ?)',
-                         (full_name, email, phone_number, college_name, filename, participation_type, ticket_id))
-            new_reg_id = cursor.lastrowid
-            conn.commit()
-            conn.close()
-            return redirect(url_for('registration_success', event_id=event_id, reg_id=new_reg_id))
-        except Exception as e:
-            print(e)
+            new_reg_id, created = registrations.create_registration(conn, fields, idempotency_key)
+        except Exception:
+            current_app.logger.exception('Registration failed for event %s', event_id)
+            created = False
+            new_reg_id = None
+        finally:
+            admission.release_write()
+
+        # A file this request wrote but no row ended up using would never be cleaned up.
+        if proof_created and not created and not registrations.proof_in_use(conn, filename):
+            proof_store.delete(filename)
+        if new_reg_id is None:
             flash('An error occurred during registration.', 'error')
-            return render_template('hackathon_register.html', event=event)
-
-    conn.close()
-    return render_template('hackathon_register.html', event=event)
-
-
-@app.route('/registration-success/<int:event_id>')
+            return render_template('hackathon_register.html', event=event, idempotency_key=idempotency_key)
+        if created:
+            # The pass and the confirmation mail are made by a worker; the success page does not wait for them.
+            ticket_id = conn.execute('SELECT ticket_id FROM hackathon_registrations WHERE id = ?',
+                                     (new_reg_id,)).fetchone()['ticket_id']
+            log_activity(f"New registration: {ticket_id}")
+            tickets.queue_pass(conn, ticket_id, mail_to=email,
+                               pass_url=url_for('main.ticket_pass', ticket_id=ticket_id,
+                                                token=tickets.pass_token(ticket_id), fmt='pdf', _external=True))
+        # A retried submission (same idempotency key) lands here too and gets the same page.
+        tickets.remember_registration(new_reg_id)
+        return redirect(url_for('main.registration_success', event_id=event_id, reg_id=new_reg_id))
+
+    return render_template('hackathon_register.html', event=event,
+                           idempotency_key=registrations.new_idempotency_key())
+
+
+@bp.route('/registration-success/<int:event_id>')
 def registration_success(event_id):
-    reg_id = request.args.get('reg_id')
+    reg_id = request.args.get('reg_id', type=int)
     ticket_id = None
     
     conn = get_db_connection()
     event = conn.execute('SELECT * FROM events WHERE id = ?', (event_id,)).fetchone()
     
-    if reg_id:
+    # reg_id is sequential: only the session that registered gets the ticket and its signed pass URLs.
+    if reg_id and tickets.owns_registration(reg_id):
         reg_data = conn.execute('SELECT ticket_id FROM hackathon_registrations WHERE id = ?', (reg_id,)).fetchone()
         if reg_data:
             ticket_id = reg_data['ticket_id']
-            
-    conn.close()
-    return render_template('hackathon_success.html', event=event, reg_id=reg_id, ticket_id=ticket_id)
 
+    pass_urls, pass_ready = {}, False
+    artifacts = current_app.extensions['ticket_artifacts']
+    if ticket_id and artifacts.enabled:
+        token = tickets.pass_token(ticket_id)
+        pass_urls = {fmt: url_for('main.ticket_pass', ticket_id=ticket_id, token=token, fmt=fmt)
+                     for fmt in artifacts.formats()}
+        pass_ready = artifacts.ready(ticket_id)
+    return render_template('hackathon_success.html', event=event, reg_id=reg_id, ticket_id=ticket_id,
+                           pass_urls=pass_urls, pass_ready=pass_ready)
+
+
+@bp.route('/ticket/<ticket_id>/<token>.<fmt>')
+def ticket_pass(ticket_id, token, fmt):
+    return tickets.send_pass(get_db_connection(), ticket_id, token, fmt)
 
-@app.route('/event-registrations/<int:event_id>')
+
+@bp.route('/event-registrations/<int:event_id>')
 def view_event_registrations(event_id):
-    if not session.get('admin'): return redirect(url_for('login'))
+    if not session.get('admin'): return redirect(url_for('main.login'))
     conn = get_db_connection()
     event = conn.execute('SELECT * FROM events WHERE id = ?', (event_id,)).fetchone()
-    # Fetch Hackathon Registrations instead of generic ones
-    registrations = conn.execute(
-        'SELECT * FROM hackathon_registrations ORDER BY registration_date DESC'
-    ).fetchall()
-    conn.close()
-    return render_template('event_registrations.html', event=event, registrations=registrations)
-
-@app.route('/add_event', methods=['POST'])
+    if event is None:
+        return redirect(url_for('main.dashboard'))
+    page = registrations.list_registrations(conn, request.args, event_id=event_id)
+    return render_template('event_registrations.html', event=event, page=page, registrations=page.rows,
+                           stats=registrations.event_stats(conn, event_id),
+                           grid=request.args.get('view') == 'grid',
+                           **registration_page_urls(page, 'main.view_event_registrations', event_id=event_id))
+
+@bp.route('/add_event', methods=['POST'])
 def add_event():
-    if not session.get('admin'): return redirect(url_for('login'))
+    if not session.get('admin'): return redirect(url_for('main.login'))
     image = request.files.get('image_file')
     filename = ""
     if image and image.filename != '':
-        filename = secure_filename(image.filename)
-        image.save(os.path.join(app.config['UPLOAD_FOLDER'], filename))
+        filename = images.save_upload(image, current_app.config['UPLOAD_FOLDER'])
+        current_app.extensions['image_pipeline'].submit(filename)
     
     conn = get_db_connection()
     conn.execute('INSERT INTO events (title, event_date, event_manager, contact_number, description, image_file) VALUES (?, ?, ?, ?, ?, ?)',
                  (request.form['title'], request.form['event_date'], request.form['event_manager'], 
                   request.form['contact_number'], request.form['description'], filename))
     conn.commit()
-    conn.close()
     log_activity(f"Added event: {request.form['title']}")
-    return redirect(url_for('dashboard'))
+    return redirect(url_for('main.dashboard'))
 
-@app.route('/edit_event/<int:event_id>', methods=['GET', 'POST'])
+@bp.route('/edit_event/<int:event_id>', methods=['GET', 'POST'])
 def edit_event(event_id):
-    if not session.get('admin'): return redirect(url_for('login'))
+    if not session.get('admin'): return redirect(url_for('main.login'))
     conn = get_db_connection()
     
     if request.method == 'POST':
@@ -295,191 +402,260 @@ def edit_event(event_id):
                      (request.form['title'], request.form['event_date'], request.form['event_manager'], 
                       request.form['contact_number'], request.form['description'], event_id))
         conn.commit()
-        conn.close()
-        return redirect(url_for('dashboard'))
+        return redirect(url_for('main.dashboard'))
         
     event = conn.execute('SELECT * FROM events WHERE id = ?', (event_id,)).fetchone()
-    conn.close()
     return render_template('edit_event.html', event=event)
 
-@app.route('/delete_event/<int:event_id>', methods=['POST'])
+@bp.route('/delete_event/<int:event_id>', methods=['POST'])
 def delete_event(event_id):
-    if not session.get('admin'): return redirect(url_for('login'))
+    if not session.get('admin'): return redirect(url_for('main.login'))
     conn = get_db_connection()
-    conn.execute('DELETE FROM event_registrations WHERE event_id = ?', (event_id,))
-    conn.execute('DELETE FROM events WHERE id = ?', (event_id,))
-    conn.commit()
-    conn.close()
-    return redirect(url_for('dashboard'))
+    try:
+        registrations.delete_event(conn, event_id)
+    except registrations.EventHasRegistrations as e:
+        # Its registrations (and their payment proofs) are never deleted along with it.
+        flash(f'This event still has {e.args[0]} registration(s). Delete them first, then the event.', 'error')
+        return redirect(url_for('main.view_event_registrations', event_id=event_id))
+    return redirect(url_for('main.dashboard'))
 
 # --- GALLERY ---
-@app.route('/gallery')
+@bp.route('/gallery')
+@cached_page('gallery')
 def gallery():
-    conn = get_db_connection()
-    photos = conn.execute('SELECT * FROM gallery ORDER BY upload_date DESC').fetchall()
-    conn.close()
+    photos = cached_query(['gallery'], 'SELECT * FROM gallery ORDER BY upload_date DESC')
     return render_template('gallery.html', photos=photos)
 
-@app.route('/upload_photo', methods=['POST'])
+@bp.route('/upload_photo', methods=['POST'])
 def upload_photo():
-    if not session.get('admin'): return redirect(url_for('login'))
-    image = request.files.get('image_file')
-    if image and image.filename != '':
-        filename = secure_filename(image.filename)
-        image.save(os.path.join(app.config['UPLOAD_FOLDER'], filename))
-        conn = get_db_connection()
-        conn.execute('INSERT INTO gallery (image_file, caption) VALUES (?, ?)', (filename, request.form['caption']))
-        conn.commit()
-        conn.close()
-    return redirect(url_for('dashboard'))
-
-@app.route('/edit_photo/<int:photo_id>', methods=['GET', 'POST'])
+    if not session.get('admin'): return redirect(url_for('main.login'))
+    # Several photos may be selected at once; they share the caption.
+    report = bulk.upload_photos(get_db_connection(), request.files.getlist('image_file'), request.form.get('caption', ''))
+    if report['uploaded']:
+        log_activity(f"Uploaded {report['uploaded']} photo(s) to the gallery")
+    if 'application/json' in request.headers.get('Accept', ''):
+        return jsonify(report)
+    return redirect(url_for('main.dashboard'))
+
+@bp.route('/edit_photo/<int:photo_id>', methods=['GET', 'POST'])
 def edit_photo(photo_id):
-    if not session.get('admin'): return redirect(url_for('login'))
+    if not session.get('admin'): return redirect(url_for('main.login'))
     conn = get_db_connection()
     if request.method == 'POST':
         conn.execute('UPDATE gallery SET caption=? WHERE id=?', (request.form['caption'], photo_id))
         conn.commit()
-        conn.close()
-        return redirect(url_for('dashboard'))
+        return redirect(url_for('main.dashboard'))
     photo = conn.execute('SELECT * FROM gallery WHERE id = ?', (photo_id,)).fetchone()
-    conn.close()
     return render_template('edit_photo.html', photo=photo)
 
-@app.route('/delete_photo/<int:photo_id>', methods=['POST'])
+@bp.route('/delete_photo/<int:photo_id>', methods=['POST'])
 def delete_photo(photo_id):
-    if not session.get('admin'): return redirect(url_for('login'))
-    conn = get_db_connection()
-    conn.execute('DELETE FROM gallery WHERE id = ?', (photo_id,))
-    conn.commit()
-    conn.close()
-    return redirect(url_for('dashboard'))
+    if not session.get('admin'): return redirect(url_for('main.login'))
+    # Also removes the image and its variants once no other photo or event uses them.
+    bulk.delete_items(get_db_connection(), 'photos', [photo_id])
+    return redirect(url_for('main.dashboard'))
+
+# --- BULK ACTIONS ---
+@bp.route('/admin/bulk/<kind>/delete', methods=['POST'])
+def bulk_delete(kind):
+    if not session.get('admin'): return redirect(url_for('main.login'))
+    if kind not in bulk.BULK_TABLES:
+        return "Unknown item type", 404
+    ids = bulk.parse_ids(request.form.getlist('ids'))
+    report = bulk.delete_items(get_db_connection(), kind, ids)
+    if report['deleted']:
+        log_activity(f"Bulk deleted {report['deleted']} {kind}")
+    if 'application/json' in request.headers.get('Accept', ''):
+        return jsonify(report)
+    message = f"Deleted {report['deleted']} of {len(ids)} selected {kind}."
+    if report['not_found']:
+        message += f" {report['not_found']} no longer existed."
+    if report['file_errors']:
+        message += f" {len(report['file_errors'])} file(s) could not be removed."
+    flash(message, 'success' if report['deleted'] else 'error')
+    return redirect(request.referrer or url_for('main.dashboard'))
 
 # --- MATERIALS ---
-@app.route('/materials')
+@bp.route('/materials')
+@cached_page('materials')
 def materials():
+    # Only the first page is rendered; search and "Load more" go through /search.
+    year = request.args.get('year') or None
+    materials, next_cursor = search.browse_materials(get_db_connection(), year=year)
+    return render_template('materials.html', materials=materials, next_cursor=next_cursor, year=year)
+
+# --- SEARCH ---
+@bp.route('/search')
+def search_api():
+    query = request.args.get('q', '').strip()
+    kind = request.args.get('type')
+    year = request.args.get('year') or None
+    cursor = request.args.get('cursor')
+    limit = pagination.clamp_limit(request.args.get('limit'), default=24)
     conn = get_db_connection()
-    materials = conn.execute('SELECT * FROM materials ORDER BY upload_date DESC').fetchall()
-    conn.close()
-    return render_template('materials.html', materials=materials)
 
-@app.route('/add_material', methods=['POST'])
+    if not query and kind == 'material':
+        # No search text: newest materials, keyset-paginated.
+        results, next_cursor = search.browse_materials(conn, year=year, cursor=cursor, limit=limit)
+    else:
+        # Ranked results page by offset; the cursor is the next offset.
+        offset = search.parse_offset(cursor)
+        results, has_more = search.search(conn, query, kind=kind, year=year, offset=offset, limit=limit)
+        next_cursor = str(offset + limit) if has_more and offset + limit <= search.MAX_OFFSET else None
+
+    return jsonify({'results': results, 'next_cursor': next_cursor})
+
+@bp.route('/add_material', methods=['POST'])
 def add_material():
-    if not session.get('admin'): return redirect(url_for('login'))
+    if not session.get('admin'): return redirect(url_for('main.login'))
     conn = get_db_connection()
     conn.execute('INSERT INTO materials (title, subject, target_year, semester, file_link) VALUES (?, ?, ?, ?, ?)',
                  (request.form['title'], request.form['subject'], request.form['target_year'], 
                   request.form['semester'], request.form['file_link']))
     conn.commit()
-    conn.close()
-    return redirect(url_for('dashboard'))
+    return redirect(url_for('main.dashboard'))
 
-@app.route('/edit_material/<int:id>', methods=['GET', 'POST'])
+@bp.route('/edit_material/<int:id>', methods=['GET', 'POST'])
 def edit_material(id):
-    if not session.get('admin'): return redirect(url_for('login'))
+    if not session.get('admin'): return redirect(url_for('main.login'))
     conn = get_db_connection()
     if request.method == 'POST':
         conn.execute('UPDATE materials SET title=?, subject=?, target_year=?, semester=?, file_link=? WHERE id=?',
                      (request.form['title'], request.form['subject'], request.form['target_year'], 
                       request.form['semester'], request.form['file_link'], id))
         conn.commit()
-        conn.close()
-        return redirect(url_for('dashboard'))
+        return redirect(url_for('main.dashboard'))
     material = conn.execute('SELECT * FROM materials WHERE id = ?', (id,)).fetchone()
-    conn.close()
     return render_template('edit_material.html', material=material)
 
-@app.route('/delete_material/<int:id>', methods=['POST'])
+@bp.route('/delete_material/<int:id>', methods=['POST'])
 def delete_material(id):
-    if not session.get('admin'): return redirect(url_for('login'))
+    if not session.get('admin'): return redirect(url_for('main.login'))
     conn = get_db_connection()
     conn.execute('DELETE FROM materials WHERE id = ?', (id,))
     conn.commit()
-    conn.close()
-    return redirect(url_for('dashboard'))
+    return redirect(url_for('main.dashboard'))
 
 # --- LOGS ---
-@app.route('/logs')
+@bp.route('/logs')
 def view_logs():
-    if not session.get('admin'): return redirect(url_for('login'))
+    if not session.get('admin'): return redirect(url_for('main.login'))
+    filters = {
+        'action_type': request.args.get('type', ''),
+        'date_from': request.args.get('from', ''),
+        'date_to': request.args.get('to', ''),
+    }
     conn = get_db_connection()
     try:
-        logs = conn.execute('SELECT * FROM activity_logs ORDER BY timestamp DESC').fetchall()
-    except:
-        logs = []
-    conn.close()
-    return render_template('logs.html', logs=logs)
-
-
-# --- HACKATHON REGISTRATION ---
-def init_hackathon_table():
-    """Create hackathon_registrations table if it doesn't exist"""
-    conn = get_db_connection()
-    conn.execute('''
-        CREATE TABLE IF NOT EXISTS hackathon_registrations (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            full_name TEXT NOT NULL,
-            email TEXT NOT NULL,
-            phone_number TEXT NOT NULL,
-            college_name TEXT NOT NULL,
-            college_name TEXT NOT NULL,
-            payment_proof TEXT NOT NULL,
-            participation_type TEXT DEFAULT 'Solo',
-            registration_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-    conn.commit()
-    conn.close()
+        logs, next_cursor = audit.fetch_logs(conn, cursor=request.args.get('cursor'), **filters)
+    except Exception as e:
+        print(f"Log Query Error: {e}")
+        logs, next_cursor = [], None
+    return render_template('logs.html', logs=logs, next_cursor=next_cursor,
+                           action_types=audit.ACTION_TYPES, filters=filters)
 
-init_hackathon_table()
 
 # --- 3. SERVE PAYMENT PROOFS ---
-@app.route('/payment-proof/<filename>')
+@bp.route('/payment-proof/<path:filename>')
 def serve_payment_proof(filename):
     if not session.get('admin'):
         return "Unauthorized", 403
-    return send_from_directory(PAYMENT_PROOF_FOLDER, filename)
+    return proof_storage.send_proof(filename)
 
+@bp.route('/payment-proof/thumb/<path:filename>')
+def serve_payment_proof_thumb(filename):
+    if not session.get('admin'):
+        return "Unauthorized", 403
+    return proof_storage.send_proof(filename, thumbnail=True)
 
 
-@app.route('/admin/registrations')
+
+@bp.route('/admin/registrations')
 def admin_registrations():
-    if not session.get('admin'): return redirect(url_for('login'))
+    if not session.get('admin'): return redirect(url_for('main.login'))
     conn = get_db_connection()
-    registrations = conn.execute('SELECT * FROM hackathon_registrations ORDER BY registration_date DESC').fetchall()
-    conn.close()
-    return render_template('admin_registrations.html', registrations=registrations)
-
-@app.route('/delete_registration/<int:id>', methods=['POST'])
+    # Read before the page, so a registration committed meanwhile arrives over the stream instead of going missing.
+    since = live.current_cursor(conn)
+    page = registrations.list_registrations(conn, request.args)
+    filtered = bool(registrations.registration_filters(request.args)[0])
+    return render_template('admin_registrations.html', page=page, registrations=page.rows,
+                           grid=request.args.get('view') == 'grid', since=since, filtered=filtered,
+                           **registration_page_urls(page, 'main.admin_registrations'))
+
+def registration_page_urls(page, endpoint, **values):
+    """Links to the next page, the first page and the list/grid views that keep the current filters and sort."""
+    args = request.args.to_dict()
+    cursor = args.pop('cursor', None)
+    view = args.pop('view', None)
+    return {
+        'next_url': url_for(endpoint, **values, **args, view=view, cursor=page.next_cursor) if page.next_cursor else None,
+        'first_url': url_for(endpoint, **values, **args, view=view) if cursor else None,
+        'list_url': url_for(endpoint, **values, **args, cursor=cursor),
+        'grid_url': url_for(endpoint, **values, **args, cursor=cursor, view='grid'),
+    }
+
+@bp.route('/admin/registrations/api')
+def registrations_api():
+    if not session.get('admin'):
+        return jsonify({'error': 'Unauthorized'}), 403
+    page = registrations.list_registrations(get_db_connection(), request.args,
+                                            limit=pagination.clamp_limit(request.args.get('limit'),
+                                                                         default=registrations.PAGE_SIZE))
+    items = []
+    for row in page.rows:
+        item = dict(row)
+        if item['payment_proof']:
+            item['proof_url'] = url_for('main.serve_payment_proof', filename=item['payment_proof'])
+            item['thumbnail_url'] = url_for('main.serve_payment_proof_thumb', filename=item['payment_proof'])
+        items.append(item)
+    return jsonify({'items': items, 'next_cursor': page.next_cursor, 'sort': page.sort,
+                    'total': page.total, 'total_exact': page.exact})
+
+@bp.route('/admin/registrations/export.<fmt>')
+def export_registrations(fmt):
+    if not session.get('admin'): return redirect(url_for('main.login'))
+    if fmt not in exports.FORMATS:
+        return "Unknown export format", 404
+    log_activity(f"Exported registrations as {fmt.upper()}")
+    filename = f"registrations-{datetime.now():%Y%m%d-%H%M}.{fmt}"
+    # Rows are streamed from a cursor; no Content-Length, so the body goes out chunked.
+    return Response(exports.export_registrations(current_app.config['DATABASE'], fmt, request.args),
+                    mimetype=exports.FORMATS[fmt],
+                    headers={'Content-Disposition': f'attachment; filename="{filename}"',
+                             'X-Accel-Buffering': 'no'})
+
+@bp.route('/delete_registration/<int:id>', methods=['POST'])
 def delete_registration(id):
     if not session.get('admin'):
-        return redirect(url_for('login'))
+        return redirect(url_for('main.login'))
     
     event_id = request.form.get('event_id')
     
     try:
         conn = get_db_connection()
-        # Get filename to delete file
-        reg = conn.execute('SELECT payment_proof FROM hackathon_registrations WHERE id = ?', (id,)).fetchone()
-        if reg:
-            # Delete file
-            file_path = os.path.join(PAYMENT_PROOF_FOLDER, reg['payment_proof'])
-            if os.path.exists(file_path):
-                os.remove(file_path)
-            
-            # Delete record
-            conn.execute('DELETE FROM hackathon_registrations WHERE id = ?', (id,))
-            conn.commit()
+        deleted, unused_proof = registrations.delete_registration(conn, id)
+        if deleted:
+            # Identical proofs share one stored file; it is only removed once nothing points at it.
+            if unused_proof:
+                current_app.extensions['proof_store'].delete(unused_proof)
             flash('Registration deleted successfully', 'success')
         
-        conn.close()
     except Exception as e:
         print(f"Delete Error: {e}")
         flash('Error deleting registration', 'error')
         
     if event_id:
-        return redirect(url_for('view_event_registrations', event_id=event_id))
-    return redirect(url_for('dashboard'))
+        return redirect(url_for('main.view_event_registrations', event_id=event_id))
+    return redirect(url_for('main.dashboard'))
+
+@bp.app_errorhandler(413)
+def upload_too_large(e):
+    # The limit that applied to this request: the registration form's or the app-wide one.
+    flash(f"Upload is too large (limit {request.max_content_length // (1024 * 1024)} MB).", 'error')
+    return redirect(request.referrer or url_for('main.home'))
 
 if __name__ == '__main__':
+    app = create_app()
+    # The development server is a single process, so it can migrate on start-up itself.
+    migrations.run(app.config['DATABASE'])
     app.run(debug=True)
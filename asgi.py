@@ -0,0 +1,473 @@
+"""ASGI entry point: the same application, with slow clients kept off the worker threads.
+
+    flask db-migrate                                   # once per deploy
+    uvicorn asgi:app --workers 4 --limit-concurrency 5000
+
+Under WSGI every request holds a worker thread from the first byte of its
+upload to the last byte of its response, so a few hundred students on slow
+mobile connections can occupy every thread on registration day. Here the
+event loop does the waiting:
+
+* Request bodies are received asynchronously into a spooled temp file
+  (blocking writes only once it spills to disk, on the file executor), and
+  the Flask view runs on a thread only once the whole body is in. A body
+  over MAX_CONTENT_LENGTH is not read; the view sees the declared length and
+  answers 413 as usual.
+* Response bodies are pulled from the view's iterable one chunk at a time on
+  a thread and sent asynchronously, with the server's flow control in
+  between, so a slow download holds no thread while the client catches up.
+* Payment proofs and ticket passes, the largest responses, are served by
+  native async handlers that read the file on the file executor and answer
+  conditional and single-range requests themselves. Anything unusual (not
+  logged in, missing file, thumbnails, PROOF_SENDFILE set) falls through to
+  the Flask view. These two handlers bypass the Flask request hooks, so they
+  do not show up on /metrics.
+* The admin live-update stream (/admin/stream) is served natively as well:
+  the browser waits on an asyncio queue fed by the process's ChangeHub, so
+  an open dashboard holds no thread and LIVE_MAX_STREAMS does not apply.
+
+AsyncDatabase runs SQLite work for async handlers on its own small executor,
+with one connection per thread, so queries never block the event loop and
+never compete with the view threads for a pooled connection.
+"""
+import asyncio
+import email.utils
+import hmac
+import mimetypes
+import os
+import re
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.cookies import SimpleCookie
+from urllib.parse import parse_qs
+
+import db
+import live
+import tickets
+from app import create_app
+
+CHUNK_SIZE = 64 * 1024
+# Request bodies up to this size stay in memory; larger ones spill to a temp file.
+SPOOL_BYTES = 1024 * 1024
+_RANGE = re.compile(r'^bytes=(\d*)-(\d*)$')
+_TICKET_PASS = re.compile(r'^/ticket/([^/]+)/([0-9a-f]+)\.(\w+)$')
+
+
+class AsyncDatabase:
+    """Awaitable SQLite access on a dedicated thread executor; each thread keeps one connection."""
+
+    def __init__(self, path, threads=4):
+        self.path = path
+        self._executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='async-db')
+        self._local = threading.local()
+        self._connections = []
+        self._lock = threading.Lock()
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = db.connect(self.path)
+            with self._lock:
+                self._connections.append(conn)
+        return conn
+
+    async def run(self, work, *args):
+        """Return work(conn, *args), run on a database thread."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, lambda: work(self._connection(), *args))
+
+    async def fetchone(self, sql, params=()):
+        return await self.run(lambda conn: conn.execute(sql, params).fetchone())
+
+    async def fetchall(self, sql, params=()):
+        return await self.run(lambda conn: conn.execute(sql, params).fetchall())
+
+    async def write(self, work):
+        """Return work(conn), run inside db.write_transaction on a database thread."""
+        return await self.run(lambda conn: db.write_transaction(conn, lambda: work(conn)))
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+        with self._lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections.clear()
+
+
+class FileWrapper:
+    """wsgi.file_wrapper: werkzeug's send_file() hands the open file here; read it in large chunks."""
+
+    def __init__(self, file, buffer_size=CHUNK_SIZE):
+        self.file = file
+        self.buffer_size = max(buffer_size, CHUNK_SIZE)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        data = self.file.read(self.buffer_size)
+        if not data:
+            raise StopIteration
+        return data
+
+    def close(self):
+        self.file.close()
+
+
+def _header(scope, name):
+    for key, value in scope['headers']:
+        if key == name:
+            return value.decode('latin-1')
+    return None
+
+
+async def _watch_disconnect(receive, disconnected):
+    # Once the body has been read, the only message left to receive is the disconnect.
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            disconnected.set()
+            return
+
+
+class AsgiApp:
+    def __init__(self, flask_app):
+        self.flask_app = flask_app
+        config = flask_app.config
+        config.setdefault('ASGI_VIEW_THREADS', 32)
+        config.setdefault('ASGI_FILE_THREADS', 8)
+        config.setdefault('ASGI_DB_THREADS', 4)
+        self.views = self.files = self.db = None
+
+    def _start(self):
+        config = self.flask_app.config
+        self.views = ThreadPoolExecutor(max_workers=config['ASGI_VIEW_THREADS'], thread_name_prefix='asgi-view')
+        self.files = ThreadPoolExecutor(max_workers=config['ASGI_FILE_THREADS'], thread_name_prefix='asgi-file')
+        self.db = AsyncDatabase(config['DATABASE'], threads=config['ASGI_DB_THREADS'])
+
+    def _stop(self):
+        for executor in (self.views, self.files):
+            executor.shutdown(wait=True)
+        self.db.close()
+        self.flask_app.extensions['audit_writer'].stop()
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self._lifespan(receive, send)
+        if scope['type'] != 'http':
+            return
+        if self.views is None:  # servers that skip the lifespan protocol
+            self._start()
+        if scope['method'] in ('GET', 'HEAD') and await self._native(scope, receive, send):
+            return
+        await self._wsgi(scope, receive, send)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                self._start()
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                self._stop()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    # --- FLASK VIEWS ON THREADS ---
+
+    async def _read_body(self, scope, receive):
+        """Receive the whole request body; return (file, length), or (None, declared length) if too large."""
+        loop = asyncio.get_running_loop()
+        limit = self.flask_app.config.get('MAX_CONTENT_LENGTH')
+        declared = _header(scope, b'content-length')
+        if limit and declared and declared.isdigit() and int(declared) > limit:
+            return None, int(declared)
+        body = tempfile.SpooledTemporaryFile(max_size=SPOOL_BYTES)
+        size = 0
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                body.close()
+                raise ConnectionAbortedError
+            chunk = message.get('body', b'')
+            size += len(chunk)
+            if limit and size > limit:
+                body.close()
+                return None, size
+            if chunk:
+                if size > SPOOL_BYTES:
+                    # On disk by now: keep the blocking write off the event loop.
+                    await loop.run_in_executor(self.files, body.write, chunk)
+                else:
+                    body.write(chunk)
+            if not message.get('more_body'):
+                break
+        body.seek(0)
+        return body, size
+
+    def _environ(self, scope, body, length):
+        server = scope.get('server') or ('localhost', 80)
+        environ = {
+            'REQUEST_METHOD': scope['method'],
+            'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+            'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+            'QUERY_STRING': scope['query_string'].decode('latin-1'),
+            'SERVER_NAME': server[0],
+            'SERVER_PORT': str(server[1]),
+            'SERVER_PROTOCOL': f"HTTP/{scope['http_version']}",
+            'REMOTE_ADDR': scope['client'][0] if scope.get('client') else '',
+            'CONTENT_LENGTH': str(length),
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': scope.get('scheme', 'http'),
+            # A body that was too large is not read; the view answers 413 from CONTENT_LENGTH alone.
+            'wsgi.input': body if body is not None else tempfile.SpooledTemporaryFile(0),
+            'wsgi.errors': sys.stderr,
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': True,
+            'wsgi.run_once': False,
+            'wsgi.file_wrapper': FileWrapper,
+        }
+        for key, value in scope['headers']:
+            name = key.decode('latin-1').upper().replace('-', '_')
+            value = value.decode('latin-1')
+            if name in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+                if name == 'CONTENT_TYPE':
+                    environ[name] = value
+                continue
+            name = 'HTTP_' + name
+            if name in environ:
+                value = environ[name] + ('; ' if name == 'HTTP_COOKIE' else ',') + value
+            environ[name] = value
+        return environ
+
+    async def _wsgi(self, scope, receive, send):
+        loop = asyncio.get_running_loop()
+        try:
+            body, length = await self._read_body(scope, receive)
+        except ConnectionAbortedError:
+            return
+        environ = self._environ(scope, body, length)
+        started = {}
+
+        def start_response(status, headers, exc_info=None):
+            started['status'], started['headers'] = status, headers
+            return lambda data: started.setdefault('written', []).append(data)
+
+        disconnected = asyncio.Event()
+        watcher = asyncio.create_task(_watch_disconnect(receive, disconnected))
+        result = None
+        try:
+            result = await loop.run_in_executor(self.views, self.flask_app, environ, start_response)
+            iterator = iter(result)
+            chunk = await loop.run_in_executor(self.views, next, iterator, None)
+            await send({'type': 'http.response.start', 'status': int(started['status'].split(' ', 1)[0]),
+                        'headers': [(k.lower().encode('latin-1'), v.encode('latin-1'))
+                                    for k, v in started['headers']]})
+            for data in started.pop('written', ()):
+                await send({'type': 'http.response.body', 'body': data, 'more_body': True})
+            while chunk is not None and not disconnected.is_set():
+                if chunk:
+                    await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+                chunk = await loop.run_in_executor(self.views, next, iterator, None)
+            await send({'type': 'http.response.body', 'body': b'', 'more_body': False})
+        finally:
+            watcher.cancel()
+            if hasattr(result, 'close'):
+                await loop.run_in_executor(self.views, result.close)
+            if body is not None:
+                body.close()
+
+    # --- NATIVE ASYNC ROUTES ---
+
+    async def _native(self, scope, receive, send):
+        """Serve proofs, ticket passes and the live stream without a view thread; False hands the request to Flask."""
+        path = scope['path']
+        if path == '/admin/stream':
+            return await self._live_stream(scope, receive, send)
+        if path.startswith('/payment-proof/') and not path.startswith('/payment-proof/thumb/'):
+            return await self._proof(scope, receive, send, path[len('/payment-proof/'):])
+        match = _TICKET_PASS.match(path)
+        if match:
+            return await self._ticket_pass(scope, receive, send, *match.groups())
+        return False
+
+    def _is_admin(self, scope):
+        app = self.flask_app
+        cookies = SimpleCookie()
+        cookies.load(_header(scope, b'cookie') or '')
+        morsel = cookies.get(app.config['SESSION_COOKIE_NAME'])
+        serializer = app.session_interface.get_signing_serializer(app)
+        if morsel is None or serializer is None:
+            return False
+        try:
+            data = serializer.loads(morsel.value, max_age=int(app.permanent_session_lifetime.total_seconds()))
+        except Exception:
+            return False
+        return bool(data.get('admin'))
+
+    async def _proof(self, scope, receive, send, relative_path):
+        app = self.flask_app
+        if app.config['PROOF_SENDFILE'] or not self._is_admin(scope):
+            return False
+        path = app.extensions['proof_store'].path_for(relative_path)
+        if path is None:
+            return False
+        return await self._send_file(scope, receive, send, path, mimetypes.guess_type(path)[0],
+                                     f"private, max-age={app.config['PROOF_MAX_AGE']}")
+
+    async def _ticket_pass(self, scope, receive, send, ticket_id, token, fmt):
+        app = self.flask_app
+        artifacts = app.extensions['ticket_artifacts']
+        if (not artifacts.enabled or fmt not in artifacts.formats()
+                or not hmac.compare_digest(token, tickets.ticket_token(app.secret_key, ticket_id))):
+            return False
+        headers = [(b'content-disposition', f'attachment; filename="ticket-{ticket_id}.pdf"'.encode('latin-1'))
+                   ] if fmt == 'pdf' else []
+        if await self._send_file(scope, receive, send, artifacts.path_for(ticket_id, fmt), tickets.FORMATS[fmt],
+                                 f"private, max-age={app.config['TICKET_MAX_AGE']}, immutable", headers):
+            return True
+        details = await self.db.run(tickets.ticket_details, ticket_id)
+        if details is None:
+            return False
+        artifacts.submit(details)
+        await _respond(send, 202, b'The pass is being prepared.',
+                       [(b'retry-after', b'1'), (b'cache-control', b'no-store')])
+        return True
+
+    async def _live_stream(self, scope, receive, send):
+        # Polling clients, HEAD requests and anyone not logged in are answered by the Flask view.
+        if (scope['method'] == 'HEAD' or 'application/json' in (_header(scope, b'accept') or '')
+                or not self._is_admin(scope)):
+            return False
+        app = self.flask_app
+        loop = asyncio.get_running_loop()
+        since = parse_qs(scope['query_string'].decode('latin-1')).get('since', [None])[0]
+        follower = live.Follower(live.parse_cursor(_header(scope, b'last-event-id') or since))
+        inbox = asyncio.Queue(maxsize=live.MAX_QUEUE)
+
+        def put(batch):
+            try:
+                inbox.put_nowait(batch)
+            except asyncio.QueueFull:
+                follower.behind = True
+
+        def deliver(batch):  # called on the hub thread
+            loop.call_soon_threadsafe(put, batch)
+
+        hub = app.extensions['live_hub']
+        await loop.run_in_executor(None, hub.subscribe, deliver)
+        disconnect = asyncio.create_task(_watch_disconnect(receive, asyncio.Event()))
+        try:
+            await send({'type': 'http.response.start', 'status': 200, 'headers': [
+                (b'content-type', b'text/event-stream; charset=utf-8'),
+                (b'cache-control', b'no-cache'),
+                (b'x-accel-buffering', b'no'),
+            ]})
+            await send({'type': 'http.response.body', 'body': f'retry: {live.RETRY_MS}\n\n'.encode(), 'more_body': True})
+            # Streams end now and then, like the WSGI ones, so a server restart never waits on them for long.
+            deadline = time.monotonic() + app.config['LIVE_STREAM_SECONDS']
+            behind = True
+            while not disconnect.done() and time.monotonic() < deadline:
+                if behind:
+                    while not inbox.empty():
+                        inbox.get_nowait()
+                    messages = await self.db.run(follower.catch_up)
+                else:
+                    get = asyncio.ensure_future(inbox.get())
+                    wait = min(live.HEARTBEAT, max(deadline - time.monotonic(), 0))
+                    done, _ = await asyncio.wait({get, disconnect}, timeout=wait,
+                                                 return_when=asyncio.FIRST_COMPLETED)
+                    if get not in done:
+                        get.cancel()
+                        if not disconnect.done():
+                            await send({'type': 'http.response.body', 'body': b': keepalive\n\n', 'more_body': True})
+                        continue
+                    messages = follower.accept(get.result())
+                if messages:
+                    body = ''.join(live.sse_message(*message) for message in messages)
+                    await send({'type': 'http.response.body', 'body': body.encode('utf-8'), 'more_body': True})
+                behind = follower.behind
+            if not disconnect.done():
+                await send({'type': 'http.response.body', 'body': b'', 'more_body': False})
+        finally:
+            disconnect.cancel()
+            hub.unsubscribe(deliver)
+        return True
+
+    async def _send_file(self, scope, receive, send, path, mimetype, cache_control, extra_headers=()):
+        """Stream a file with ETag, Last-Modified and single-range support; False if it does not exist."""
+        loop = asyncio.get_running_loop()
+        try:
+            f = await loop.run_in_executor(self.files, open, path, 'rb')
+        except (FileNotFoundError, IsADirectoryError, NotADirectoryError):
+            return False
+        try:
+            info = os.fstat(f.fileno())
+            etag = f'"{int(info.st_mtime)}-{info.st_size}"'
+            headers = [
+                (b'etag', etag.encode('latin-1')),
+                (b'last-modified', email.utils.formatdate(info.st_mtime, usegmt=True).encode('latin-1')),
+                (b'cache-control', cache_control.encode('latin-1')),
+                (b'accept-ranges', b'bytes'),
+                (b'x-content-type-options', b'nosniff'),
+                *extra_headers,
+            ]
+            if etag in (_header(scope, b'if-none-match') or ''):
+                await _respond(send, 304, b'', headers)
+                return True
+
+            status, start, end = 200, 0, info.st_size
+            match = _RANGE.match(_header(scope, b'range') or '')
+            if match and (_header(scope, b'if-range') or etag) == etag and any(match.groups()):
+                first, last = match.groups()
+                if first:
+                    start, end = int(first), min(int(last) + 1 if last else info.st_size, info.st_size)
+                else:  # bytes=-N: the last N bytes
+                    start = max(0, info.st_size - int(last))
+                if start >= end:
+                    await _respond(send, 416, b'', [(b'content-range', f'bytes */{info.st_size}'.encode('latin-1'))])
+                    return True
+                status = 206
+                headers.append((b'content-range', f'bytes {start}-{end - 1}/{info.st_size}'.encode('latin-1')))
+
+            headers += [(b'content-type', (mimetype or 'application/octet-stream').encode('latin-1')),
+                        (b'content-length', str(end - start).encode('latin-1'))]
+            await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+            if scope['method'] == 'HEAD':
+                await send({'type': 'http.response.body', 'body': b'', 'more_body': False})
+                return True
+
+            disconnected = asyncio.Event()
+            watcher = asyncio.create_task(_watch_disconnect(receive, disconnected))
+            try:
+                await loop.run_in_executor(self.files, f.seek, start)
+                remaining = end - start
+                while not disconnected.is_set():
+                    chunk = await loop.run_in_executor(self.files, f.read, min(CHUNK_SIZE, remaining)) if remaining else b''
+                    remaining -= len(chunk)
+                    # A file truncated while it is being sent ends the response early.
+                    more = remaining > 0 and bool(chunk)
+                    await send({'type': 'http.response.body', 'body': chunk, 'more_body': more})
+                    if not more:
+                        break
+            finally:
+                watcher.cancel()
+            return True
+        finally:
+            await loop.run_in_executor(self.files, f.close)
+
+
+async def _respond(send, status, body, headers=()):
+    headers = list(headers)
+    if status != 304:
+        headers.append((b'content-length', str(len(body)).encode('latin-1')))
+    if body:
+        headers.append((b'content-type', b'text/plain; charset=utf-8'))
+    await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+    await send({'type': 'http.response.body', 'body': body, 'more_body': False})
+
+
+app = AsgiApp(create_app())
@@ -0,0 +1,179 @@
+"""Fingerprinted, precompressed CSS/JS.
+
+`flask build-assets` (or `python assets.py`) minifies every file in
+SOURCES, writes it to static/dist/ under a content-hashed name together
+with .gz and .br copies, and records the mapping in static/dist/manifest.json.
+Templates link assets with asset_url('css/base.css'); once a build exists
+that points at /assets/base.<hash>.css, served with a one-year immutable
+Cache-Control and the best encoding the browser accepts, so a repeat visit
+fetches no CSS or JS at all. Without a build, asset_url() falls back to the
+plain file under static/, which is what development uses.
+"""
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import re
+
+import click
+from flask import current_app, request, send_from_directory, url_for
+
+try:
+    import brotli
+except ImportError:  # Optional; without it only gzip copies are written.
+    brotli = None
+
+try:
+    import rcssmin
+    import rjsmin
+except ImportError:  # Optional; the conservative minifiers below are used instead.
+    rcssmin = rjsmin = None
+
+# Paths relative to the static folder.
+SOURCES = ('css/base.css', 'css/style.css', 'js/base.js', 'js/live.js')
+DIST_FOLDER = 'dist'
+MANIFEST = 'manifest.json'
+IMMUTABLE = 'public, max-age=31536000, immutable'
+# Content-hashed uploads (images.save_upload and their variants) never change either.
+HASHED_UPLOAD = re.compile(r'^uploads/(variants/)?[0-9a-f]{20}(_w\d+)?\.\w+$')
+
+
+def minify_css(text):
+    if rcssmin:
+        return rcssmin.cssmin(text)
+    text = re.sub(r'/\*.*?\*/', '', text, flags=re.S)
+    text = re.sub(r'\s+', ' ', text)
+    # Never touch spaces around + - * / (calc) or before ':' (descendant pseudo-class selectors).
+    text = re.sub(r'\s*([{};,>])\s*', r'\1', text)
+    text = re.sub(r':\s+', ':', text)
+    return text.replace(';}', '}').strip()
+
+
+def minify_js(text):
+    """Drop comment-only lines, indentation and blank lines; line breaks stay, so ASI is unaffected."""
+    if rjsmin:
+        return rjsmin.jsmin(text)
+    lines = []
+    for line in text.splitlines():
+        stripped = line.strip()
+        if not stripped or stripped.startswith('//'):
+            continue
+        lines.append(stripped)
+    return '\n'.join(lines) + '\n'
+
+
+MINIFIERS = {'.css': minify_css, '.js': minify_js}
+
+
+def build(static_folder, clean=False):
+    """Build every asset in SOURCES and return the manifest."""
+    dist = os.path.join(static_folder, DIST_FOLDER)
+    os.makedirs(dist, exist_ok=True)
+    manifest = {}
+    for source in SOURCES:
+        with open(os.path.join(static_folder, source), encoding='utf-8') as f:
+            text = f.read()
+        stem, ext = os.path.splitext(os.path.basename(source))
+        data = MINIFIERS[ext](text).encode('utf-8')
+        name = f"{stem}.{hashlib.sha256(data).hexdigest()[:12]}{ext}"
+        _write(os.path.join(dist, name), data)
+        # mtime=0 keeps the gzip output byte-identical between builds.
+        _write(os.path.join(dist, name + '.gz'), gzip.compress(data, compresslevel=9, mtime=0))
+        if brotli:
+            _write(os.path.join(dist, name + '.br'), brotli.compress(data, quality=11))
+        manifest[source] = name
+
+    _write(os.path.join(dist, MANIFEST), json.dumps(manifest, indent=2, sort_keys=True).encode('utf-8'))
+    if clean:
+        # Keep the files this build references; older hashes are still in use
+        # by pages rendered before a deploy, so only prune on request.
+        keep = {MANIFEST} | {n + suffix for n in manifest.values() for suffix in ('', '.gz', '.br')}
+        for name in os.listdir(dist):
+            if name not in keep:
+                os.remove(os.path.join(dist, name))
+    return manifest
+
+
+def _write(path, data):
+    tmp_path = f"{path}.{os.getpid()}.part"
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+class Manifest:
+    """manifest.json, re-read when the file changes (a build during development)."""
+
+    def __init__(self, path):
+        self.path = path
+        self._mtime = None
+        self._entries = {}
+
+    def get(self, source):
+        try:
+            mtime = os.path.getmtime(self.path)
+        except OSError:
+            return None
+        if mtime != self._mtime:
+            with open(self.path, encoding='utf-8') as f:
+                self._entries = json.load(f)
+            self._mtime = mtime
+        return self._entries.get(source)
+
+
+def asset_url(source):
+    """URL of the built, fingerprinted copy of a static asset, or the plain file if none is built."""
+    built = current_app.extensions['asset_manifest'].get(source)
+    if built:
+        return url_for('assets', filename=built)
+    return url_for('static', filename=source)
+
+
+def serve_asset(filename):
+    dist = os.path.join(current_app.static_folder, DIST_FOLDER)
+    accepted = request.accept_encodings
+    encoding = None
+    for candidate, suffix in (('br', '.br'), ('gzip', '.gz')):
+        if accepted[candidate] and os.path.exists(os.path.join(dist, filename + suffix)):
+            encoding = candidate
+            break
+    served = filename + {'br': '.br', 'gzip': '.gz', None: ''}[encoding]
+    response = send_from_directory(dist, served, mimetype=mimetypes.guess_type(filename)[0], max_age=31536000)
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    response.headers['Cache-Control'] = IMMUTABLE
+    return response
+
+
+def _static_cache_headers(response):
+    if request.endpoint == 'static' and response.status_code in (200, 206, 304):
+        if HASHED_UPLOAD.match(request.view_args.get('filename', '')):
+            response.headers['Cache-Control'] = IMMUTABLE
+        else:
+            # Legacy uploads and the favicon may be replaced in place: keep them
+            # for an hour, then revalidate with the ETag.
+            response.headers['Cache-Control'] = 'public, max-age=3600'
+    return response
+
+
+def init_app(app):
+    app.extensions['asset_manifest'] = Manifest(os.path.join(app.static_folder, DIST_FOLDER, MANIFEST))
+    app.add_template_global(asset_url)
+    app.add_url_rule('/assets/<path:filename>', 'assets', serve_asset)
+    app.after_request(_static_cache_headers)
+
+    @app.cli.command('build-assets')
+    @click.option('--clean', is_flag=True, help='Delete built files the new manifest does not reference.')
+    def build_assets_command(clean):
+        """Minify, fingerprint and precompress CSS/JS into static/dist/."""
+        for source, name in build(app.static_folder, clean=clean).items():
+            click.echo(f'{source} -> {DIST_FOLDER}/{name}')
+        if brotli is None:
+            click.echo('brotli is not installed; only gzip copies were written.')
+
+
+if __name__ == '__main__':
+    for source, name in build(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static')).items():
+        print(f'{source} -> {DIST_FOLDER}/{name}')
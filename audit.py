@@ -0,0 +1,248 @@
+import atexit
+import logging
+import os
+import queue
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+import click
+from flask import current_app
+
+import db
+import pagination
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+# Filter values for the /logs page, matched as a prefix of the action text.
+ACTION_TYPES = {
+    'login': 'User logged in',
+    'logout': 'User logged out',
+    'failed_login': 'Failed login attempt',
+    'event': 'Added event',
+    'registration': 'New registration',
+    'feedback': 'New anonymous feedback',
+    'inbox': 'Cleared',
+    'upload': 'Uploaded',
+    'bulk_delete': 'Bulk deleted',
+    'export': 'Exported registrations',
+}
+
+
+def _utc_timestamp():
+    # Same format as SQLite's CURRENT_TIMESTAMP, taken when the event happens
+    # rather than when the batch reaches the disk.
+    return datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+
+
+class AuditWriter:
+    """Background writer for activity_logs.
+
+    Request threads only put events on a bounded queue. One writer thread
+    collects them and commits a whole batch in a single transaction once
+    `batch_size` events are waiting or `flush_interval` seconds have passed,
+    so a burst of logins costs one fsync instead of one per request.
+    """
+
+    def __init__(self, path, max_queue=10000, batch_size=200, flush_interval=0.5, put_timeout=0.1,
+                 retention_days=None, archive_path=None, archive_interval=3600):
+        self.path = path
+        self.max_queue = max_queue
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.put_timeout = put_timeout
+        self.retention_days = retention_days
+        self.archive_path = archive_path
+        self.archive_interval = archive_interval
+        self._next_archive = 0
+        self._lock = threading.Lock()
+        self._queue = None
+        self._thread = None
+        self._pid = None
+
+    def _ensure_started(self):
+        # Threads do not survive fork(), so each worker process starts its own.
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid():
+                return
+            self._queue = queue.Queue(maxsize=self.max_queue)
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='audit-writer', daemon=True)
+            self._thread.start()
+
+    def log(self, action):
+        self._ensure_started()
+        event = (action, _utc_timestamp())
+        try:
+            self._queue.put(event, timeout=self.put_timeout)
+        except queue.Full:
+            # Backpressure: the writer is behind, so this caller pays for its own row.
+            logger.warning('Audit queue full, writing synchronously')
+            self._write([event])
+
+    def flush(self):
+        """Block until every queued event has been committed."""
+        if self._queue is not None and self._pid == os.getpid():
+            self._queue.join()
+
+    def stop(self, timeout=5.0):
+        """Drain the queue and stop the writer thread."""
+        if self._thread is None or self._pid != os.getpid():
+            return
+        self._queue.put(_STOP)
+        self._thread.join(timeout)
+        self._thread = None
+
+    def _run(self):
+        conn = db.connect(self.path)
+        try:
+            while True:
+                batch = []
+                stopping = False
+                item = self._queue.get()
+                deadline = time.monotonic() + self.flush_interval
+                while True:
+                    if item is _STOP:
+                        self._queue.task_done()
+                        stopping = True
+                        break
+                    batch.append(item)
+                    timeout = deadline - time.monotonic()
+                    if len(batch) >= self.batch_size or timeout <= 0:
+                        break
+                    try:
+                        item = self._queue.get(timeout=timeout)
+                    except queue.Empty:
+                        break
+                if batch:
+                    self._write(batch, conn)
+                    for _ in batch:
+                        self._queue.task_done()
+                if stopping:
+                    return
+                self._apply_retention(conn)
+        finally:
+            conn.close()
+
+    def _apply_retention(self, conn):
+        # The writer is the only thread inserting logs, so it also trims them.
+        if not self.retention_days or not self.archive_path or time.monotonic() < self._next_archive:
+            return
+        self._next_archive = time.monotonic() + self.archive_interval
+        try:
+            moved = archive_logs(conn, self.archive_path, self.retention_days)
+            if moved:
+                logger.info('Archived %d activity log row(s)', moved)
+        except Exception:
+            logger.exception('Activity log archiving failed')
+
+    def _write(self, batch, conn=None):
+        own_conn = conn is None
+        if own_conn:
+            conn = db.connect(self.path)
+        try:
+            with conn:
+                conn.executemany('INSERT INTO activity_logs (action, timestamp) VALUES (?, ?)', batch)
+        except Exception:
+            logger.exception('Failed to write %d audit event(s)', len(batch))
+        finally:
+            if own_conn:
+                conn.close()
+
+
+def fetch_logs(conn, cursor=None, action_type=None, date_from=None, date_to=None, limit=50):
+    """Return one page of logs (newest first) and the cursor for the next page.
+
+    Pages are keyed on (timestamp, id) so every page is an index range scan on
+    idx_activity_logs_timestamp, no matter how deep into the history it is.
+    """
+    where = []
+    params = []
+    if action_type in ACTION_TYPES:
+        where.append("action LIKE ? || '%'")
+        params.append(ACTION_TYPES[action_type])
+    if date_from:
+        where.append('timestamp >= ?')
+        params.append(date_from)
+    if date_to:
+        # Inclusive end date: everything before the start of the next day.
+        try:
+            end = datetime.strptime(date_to, '%Y-%m-%d') + timedelta(days=1)
+            where.append('timestamp < ?')
+            params.append(end.strftime('%Y-%m-%d'))
+        except ValueError:
+            pass
+    return pagination.fetch_page(conn, 'activity_logs', 'id, action, timestamp', 'timestamp',
+                                 cursor=cursor, limit=limit, where=where, params=params)
+
+
+def archive_logs(conn, archive_path, older_than_days, batch_size=1000):
+    """Move log rows older than the retention window into an archive database.
+
+    The archive is attached to the live connection and rows are moved in
+    small transactions, so the write lock is only held for one batch at a time.
+    Returns the number of rows moved.
+    """
+    cutoff = (datetime.now(timezone.utc) - timedelta(days=older_than_days)).strftime('%Y-%m-%d %H:%M:%S')
+    conn.execute('ATTACH DATABASE ? AS archive', (archive_path,))
+    moved = 0
+    try:
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS archive.activity_logs (
+                id INTEGER PRIMARY KEY,
+                action TEXT NOT NULL,
+                timestamp TIMESTAMP
+            )
+        ''')
+        while True:
+            with conn:
+                ids = [row[0] for row in conn.execute(
+                    'SELECT id FROM main.activity_logs WHERE timestamp < ? ORDER BY timestamp LIMIT ?',
+                    (cutoff, batch_size))]
+                if not ids:
+                    break
+                placeholders = ','.join('?' * len(ids))
+                conn.execute(f'INSERT OR IGNORE INTO archive.activity_logs (id, action, timestamp) '
+                             f'SELECT id, action, timestamp FROM main.activity_logs WHERE id IN ({placeholders})', ids)
+                conn.execute(f'DELETE FROM main.activity_logs WHERE id IN ({placeholders})', ids)
+            moved += len(ids)
+    finally:
+        conn.execute('DETACH DATABASE archive')
+    return moved
+
+
+def log_activity(action):
+    """Queue an audit event; it is committed by the background writer."""
+    current_app.extensions['audit_writer'].log(action)
+
+
+def init_app(app):
+    app.config.setdefault('AUDIT_QUEUE_SIZE', 10000)
+    app.config.setdefault('AUDIT_BATCH_SIZE', 200)
+    app.config.setdefault('AUDIT_FLUSH_INTERVAL', 0.5)
+    # Rows older than this many days move to LOG_ARCHIVE_PATH (None keeps everything).
+    app.config.setdefault('LOG_RETENTION_DAYS', 365)
+    app.config.setdefault('LOG_ARCHIVE_PATH', os.path.join(app.root_path, 'logs_archive.db'))
+    writer = AuditWriter(app.config['DATABASE'],
+                         max_queue=app.config['AUDIT_QUEUE_SIZE'],
+                         batch_size=app.config['AUDIT_BATCH_SIZE'],
+                         flush_interval=app.config['AUDIT_FLUSH_INTERVAL'],
+                         retention_days=app.config['LOG_RETENTION_DAYS'],
+                         archive_path=app.config['LOG_ARCHIVE_PATH'])
+    app.extensions['audit_writer'] = writer
+    atexit.register(writer.stop)
+
+    @app.cli.command('archive-logs')
+    @click.option('--days', type=int, default=None, help='Retention window (defaults to LOG_RETENTION_DAYS).')
+    def archive_logs_command(days):
+        """Move old activity_logs rows into the archive database."""
+        conn = db.connect(app.config['DATABASE'])
+        try:
+            moved = archive_logs(conn, app.config['LOG_ARCHIVE_PATH'], days or app.config['LOG_RETENTION_DAYS'])
+        finally:
+            conn.close()
+        click.echo(f'Archived {moved} log row(s) to {app.config["LOG_ARCHIVE_PATH"]}')
@@ -0,0 +1,317 @@
+"""Online backups of the database: compressed, rotated, verified snapshots.
+
+    flask backup-db [--keep 14]        # one snapshot now (cron-friendly)
+    flask list-backups
+    flask restore-db <snapshot|latest> [--yes]
+
+A snapshot is taken with SQLite's online backup API, a few hundred pages per
+step with a short pause between steps, from a connection holding one read
+transaction. Under WAL a reader never blocks writers, so registrations keep
+committing while the copy runs; and because the snapshot stays fixed, their
+commits do not restart the copy (which they would after every step
+otherwise). The copy is integrity-checked, switched out of WAL mode, gzipped
+into BACKUP_FOLDER as <db>-<UTC time>.db.gz and the oldest snapshots beyond
+BACKUP_KEEP are deleted.
+
+With BACKUP_INTERVAL set, each app process runs a scheduler thread that
+takes a snapshot once the newest one is older than the interval; a lock
+file makes sure only one process does so at a time.
+
+A restore decompresses and checks the snapshot, saves the current database
+as a "pre-restore" snapshot, copies the snapshot in through the backup API
+(so the live file and its WAL stay consistent) and compares row counts.
+"""
+import gzip
+import logging
+import os
+import re
+import shutil
+import sqlite3
+import threading
+import time
+from datetime import datetime, timezone
+
+import click
+
+import db
+import migrations
+
+try:
+    import fcntl
+except ImportError:  # Windows: the development server is one process anyway.
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+PAGES_PER_STEP = 256
+STEP_PAUSE = 0.005
+TEMP_SUFFIX = '.part'
+LOCK_FILE = '.backup.lock'
+# Seconds a new process waits before its first check, so start-up is not slowed down.
+STARTUP_DELAY = 60
+_SNAPSHOT = re.compile(r'^(?P<stem>.+)-(?P<taken>\d{8}-\d{6})(?P<label>-[a-z-]+)?\.db\.gz$')
+
+
+class BackupError(Exception):
+    pass
+
+
+def snapshot_name(db_path, label=None, now=None):
+    stem = os.path.splitext(os.path.basename(db_path))[0]
+    taken = (now or datetime.now(timezone.utc)).strftime('%Y%m%d-%H%M%S')
+    return f"{stem}-{taken}{'-' + label if label else ''}.db.gz"
+
+
+def list_snapshots(folder, db_path=None):
+    """Snapshot paths in `folder`, newest first (only those of `db_path`, if given)."""
+    stem = os.path.splitext(os.path.basename(db_path))[0] if db_path else None
+    try:
+        names = os.listdir(folder)
+    except FileNotFoundError:
+        return []
+    matches = [(m.group('taken'), name) for name in names
+               for m in [_SNAPSHOT.match(name)] if m and (stem is None or m.group('stem') == stem)]
+    return [os.path.join(folder, name) for _, name in sorted(matches, reverse=True)]
+
+
+def check_database(path):
+    """Return the user_version of a database file, or raise BackupError if it is damaged."""
+    conn = sqlite3.connect(path)
+    try:
+        result = conn.execute('PRAGMA quick_check').fetchone()[0]
+        if result != 'ok':
+            raise BackupError(f'{os.path.basename(path)} failed its integrity check: {result}')
+        return conn.execute('PRAGMA user_version').fetchone()[0]
+    except sqlite3.DatabaseError as e:
+        raise BackupError(f'{os.path.basename(path)} is not a usable database: {e}') from e
+    finally:
+        conn.close()
+
+
+def copy_database(db_path, target, pages=PAGES_PER_STEP, pause=STEP_PAUSE):
+    """Copy a live database to `target` without blocking its writers."""
+    source = db.connect(db_path)
+    dest = sqlite3.connect(target)
+    try:
+        # One read transaction for the whole copy: a fixed snapshot to copy from.
+        source.execute('BEGIN')
+        source.execute('SELECT COUNT(*) FROM sqlite_master').fetchone()
+        # The progress callback runs between steps; sleeping there lets request threads in.
+        source.backup(dest, pages=pages, progress=lambda status, remaining, total: time.sleep(pause))
+        source.rollback()
+        # The copy inherits WAL mode; a standalone file is easier to ship and restore.
+        dest.execute('PRAGMA journal_mode=DELETE')
+    finally:
+        dest.close()
+        source.close()
+
+
+def _gzip(source, target):
+    with open(source, 'rb') as f, open(target, 'wb') as raw:
+        with gzip.GzipFile(filename=os.path.basename(source), mode='wb', fileobj=raw, compresslevel=6) as out:
+            shutil.copyfileobj(f, out, 1024 * 1024)
+        raw.flush()
+        os.fsync(raw.fileno())
+
+
+def _remove(*paths):
+    for path in paths:
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def create_snapshot(db_path, folder, keep=None, label=None, pages=PAGES_PER_STEP, pause=STEP_PAUSE):
+    """Write a verified, compressed snapshot of `db_path` to `folder` and rotate old ones.
+
+    Returns {'path', 'bytes', 'database_bytes', 'schema_version', 'seconds', 'removed'}.
+    """
+    started = time.perf_counter()
+    os.makedirs(folder, exist_ok=True)
+    name = snapshot_name(db_path, label)
+    final_path = os.path.join(folder, name)
+    copy_path = final_path[:-len('.gz')] + TEMP_SUFFIX
+    gzip_path = final_path + TEMP_SUFFIX
+    try:
+        copy_database(db_path, copy_path, pages=pages, pause=pause)
+        version = check_database(copy_path)
+        database_bytes = os.path.getsize(copy_path)
+        _gzip(copy_path, gzip_path)
+        os.replace(gzip_path, final_path)
+    finally:
+        _remove(copy_path, gzip_path)
+    removed = rotate(folder, db_path, keep) if keep else []
+    return {'path': final_path, 'bytes': os.path.getsize(final_path), 'database_bytes': database_bytes,
+            'schema_version': version, 'seconds': time.perf_counter() - started, 'removed': removed}
+
+
+def rotate(folder, db_path, keep):
+    """Delete all but the `keep` newest scheduled snapshots; labelled ones (pre-restore) are left alone."""
+    scheduled = [path for path in list_snapshots(folder, db_path)
+                 if not _SNAPSHOT.match(os.path.basename(path)).group('label')]
+    removed = scheduled[keep:]
+    _remove(*removed)
+    return removed
+
+
+def _row_counts(conn):
+    tables = [row[0] for row in conn.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%' "
+        "AND sql NOT LIKE 'CREATE VIRTUAL TABLE%' ORDER BY name")]
+    return {table: conn.execute(f'SELECT COUNT(*) FROM "{table}"').fetchone()[0] for table in tables}
+
+
+def restore_snapshot(db_path, snapshot, folder, latest_version=None):
+    """Replace the contents of `db_path` with `snapshot` after checking it.
+
+    The current contents are saved as a pre-restore snapshot first. Returns
+    {'snapshot', 'pre_restore', 'schema_version', 'tables'}.
+    """
+    copy_path = os.path.join(folder, os.path.basename(snapshot)[:-len('.gz')] + TEMP_SUFFIX)
+    try:
+        try:
+            with gzip.open(snapshot, 'rb') as f, open(copy_path, 'wb') as out:
+                shutil.copyfileobj(f, out, 1024 * 1024)
+        except (OSError, EOFError) as e:
+            raise BackupError(f'{os.path.basename(snapshot)} could not be decompressed: {e}') from e
+        version = check_database(copy_path)
+        if latest_version is not None and version > latest_version:
+            raise BackupError(f'The snapshot has schema version {version}, newer than this code ({latest_version}).')
+
+        pre_restore = create_snapshot(db_path, folder, label='pre-restore')['path']
+        source = sqlite3.connect(copy_path)
+        live = db.connect(db_path)
+        try:
+            cache_versions = dict(live.execute('SELECT tag, version FROM cache_versions').fetchall())
+            # One step: the live database is locked for the (short) copy and never seen half-restored.
+            source.backup(live)
+            # Pages cached from the newer data must not match the older versions now on disk.
+            with live:
+                for tag, seen in cache_versions.items():
+                    live.execute('UPDATE cache_versions SET version = MAX(version, ?) + 1 WHERE tag = ?', (seen, tag))
+            expected, restored = _row_counts(source), _row_counts(live)
+        finally:
+            live.close()
+            source.close()
+        if restored != expected:
+            raise BackupError(f'Row counts differ after the restore; {os.path.basename(pre_restore)} '
+                              f'has the previous contents.')
+        check_database(db_path)
+    finally:
+        _remove(copy_path)
+    return {'snapshot': snapshot, 'pre_restore': pre_restore, 'schema_version': version, 'tables': restored}
+
+
+class BackupScheduler:
+    """Background thread that keeps the newest snapshot younger than `interval` seconds."""
+
+    def __init__(self, db_path, folder, interval, keep):
+        self.db_path = db_path
+        self.folder = folder
+        self.interval = interval
+        self.keep = keep
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+
+    def ensure_started(self):
+        # Threads do not survive fork(), so each worker process starts its own.
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid != os.getpid():
+                self._thread = threading.Thread(target=self._run, name='backup-scheduler', daemon=True)
+                self._thread.start()
+                self._pid = os.getpid()
+
+    def seconds_until_due(self):
+        snapshots = [path for path in list_snapshots(self.folder, self.db_path)
+                     if not _SNAPSHOT.match(os.path.basename(path)).group('label')]
+        if not snapshots:
+            return 0
+        return max(0.0, os.path.getmtime(snapshots[0]) + self.interval - time.time())
+
+    def run_if_due(self):
+        """Take a snapshot if one is due and no other process is taking one; return its report or None."""
+        os.makedirs(self.folder, exist_ok=True)
+        with open(os.path.join(self.folder, LOCK_FILE), 'w') as lock:
+            if fcntl is not None:
+                try:
+                    fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    return None
+            if self.seconds_until_due() > 0:
+                return None
+            report = create_snapshot(self.db_path, self.folder, keep=self.keep)
+            logger.info('Database snapshot %s (%.1f MB) written in %.1fs', os.path.basename(report['path']),
+                        report['bytes'] / 1024 / 1024, report['seconds'])
+            return report
+
+    def _run(self):
+        time.sleep(STARTUP_DELAY)
+        while True:
+            try:
+                self.run_if_due()
+                delay = self.seconds_until_due()
+            except Exception:
+                logger.exception('Scheduled database backup failed')
+                delay = self.interval
+            # Re-check at least every few minutes: another process may have taken the snapshot.
+            time.sleep(min(max(delay, 1), 300))
+
+
+def init_app(app):
+    app.config.setdefault('BACKUP_FOLDER', os.path.join(app.root_path, 'backups'))
+    app.config.setdefault('BACKUP_KEEP', 14)
+    # Seconds between scheduled snapshots; None or 0 leaves scheduling to cron and `flask backup-db`.
+    app.config.setdefault('BACKUP_INTERVAL', 6 * 3600)
+    if app.config['BACKUP_INTERVAL']:
+        scheduler = BackupScheduler(app.config['DATABASE'], app.config['BACKUP_FOLDER'],
+                                    app.config['BACKUP_INTERVAL'], app.config['BACKUP_KEEP'])
+        app.extensions['backup_scheduler'] = scheduler
+        app.before_request(scheduler.ensure_started)
+
+    @app.cli.command('backup-db')
+    @click.option('--keep', type=int, default=None, help='Snapshots to keep (defaults to BACKUP_KEEP).')
+    def backup_db_command(keep):
+        """Write a compressed snapshot of the live database."""
+        report = create_snapshot(app.config['DATABASE'], app.config['BACKUP_FOLDER'],
+                                 keep=keep or app.config['BACKUP_KEEP'])
+        click.echo(f"{report['path']}: {report['database_bytes'] / 1024 / 1024:.1f} MB database, "
+                   f"{report['bytes'] / 1024 / 1024:.1f} MB compressed, schema version "
+                   f"{report['schema_version']}, {report['seconds']:.1f}s")
+        for path in report['removed']:
+            click.echo(f'  removed {os.path.basename(path)}')
+
+    @app.cli.command('list-backups')
+    def list_backups_command():
+        """List snapshots of the database, newest first."""
+        for path in list_snapshots(app.config['BACKUP_FOLDER'], app.config['DATABASE']):
+            click.echo(f'{os.path.basename(path)}  {os.path.getsize(path) / 1024 / 1024:.1f} MB')
+
+    @app.cli.command('restore-db')
+    @click.argument('snapshot')
+    @click.option('--yes', is_flag=True, help='Do not ask for confirmation.')
+    def restore_db_command(snapshot, yes):
+        """Replace the database with a snapshot (a path, a name in BACKUP_FOLDER, or "latest")."""
+        folder = app.config['BACKUP_FOLDER']
+        if snapshot == 'latest':
+            snapshots = list_snapshots(folder, app.config['DATABASE'])
+            if not snapshots:
+                raise click.ClickException(f'No snapshots in {folder}.')
+            snapshot = snapshots[0]
+        elif not os.path.exists(snapshot):
+            snapshot = os.path.join(folder, snapshot)
+        if not os.path.exists(snapshot):
+            raise click.ClickException(f'{snapshot} does not exist.')
+        if not yes:
+            click.confirm(f'Replace {app.config["DATABASE"]} with {os.path.basename(snapshot)}?', abort=True)
+        try:
+            report = restore_snapshot(app.config['DATABASE'], snapshot, folder,
+                                      latest_version=migrations.latest_version())
+        except BackupError as e:
+            raise click.ClickException(str(e))
+        click.echo(f"Restored {os.path.basename(snapshot)} (schema version {report['schema_version']}, "
+                   f"{sum(report['tables'].values())} rows in {len(report['tables'])} tables).")
+        click.echo(f"The previous contents are in {os.path.basename(report['pre_restore'])}.")
+        # An older snapshot is brought up to the current schema straight away.
+        migrations.run(app.config['DATABASE'])
@@ -0,0 +1,321 @@
+"""Route-level latency/throughput benchmark against a seeded database.
+
+    python benchmarks/seed.py                                # once: build benchmarks/bench.db
+    python benchmarks/bench_routes.py --save baseline.json   # record a baseline
+    python benchmarks/bench_routes.py --baseline baseline.json
+
+Every route is driven twice:
+    client      sequential requests through the Flask test client (no network,
+                pure application cost)
+    concurrent  --concurrency threads issuing real HTTP requests against a
+                threaded local server for --seconds
+
+For each it reports p50/p95/p99 latency and throughput, plus the peak RSS of
+the process. With --baseline, a route whose p95 is more than --tolerance
+slower (and at least --min-delta-ms slower), whose throughput drops by more
+than --tolerance, or a peak RSS that grows by more than --tolerance fails
+the run with exit status 1.
+"""
+import argparse
+import http.client
+import io
+import itertools
+import json
+import logging
+import os
+import platform
+import shutil
+import struct
+import sys
+import tempfile
+import threading
+import time
+import zlib
+from urllib.parse import urlencode
+
+try:
+    import resource
+except ImportError:  # Windows: peak RSS is not reported.
+    resource = None
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from werkzeug.serving import make_server  # noqa: E402
+
+import backup  # noqa: E402
+import db  # noqa: E402
+from app import create_app  # noqa: E402
+
+DEFAULT_DB = os.path.join(ROOT, 'benchmarks', 'bench.db')
+
+# name -> (method, path, needs admin session)
+ROUTES = {
+    'home': ('GET', '/', False),
+    'events': ('GET', '/events', False),
+    'gallery': ('GET', '/gallery', False),
+    'materials': ('GET', '/materials', False),
+    'search': ('GET', '/search?q=data+struct', False),
+    'register_form': ('GET', '/register/{event_id}', False),
+    'register_post': ('POST', '/register/{event_id}', False),
+    'dashboard': ('GET', '/dashboard', True),
+    'dashboard_events': ('GET', '/dashboard/api/events', True),
+    'logs': ('GET', '/logs', True),
+    'admin_registrations': ('GET', '/admin/registrations', True),
+    'admin_registrations_sorted': ('GET', '/admin/registrations?sort=name', True),
+    'admin_registrations_filtered': ('GET', '/admin/registrations?type=Team&ticket=HT-1', True),
+    'registrations_api': ('GET', '/admin/registrations/api?college=National+College', True),
+    'event_registrations': ('GET', '/event-registrations/{event_id}', True),
+}
+
+_counter = itertools.count()
+_counter_lock = threading.Lock()
+
+
+def _unique():
+    with _counter_lock:
+        return next(_counter)
+
+
+def tiny_png(n):
+    """A valid 1x1 PNG whose colour encodes n, so every proof has a new hash."""
+    def chunk(kind, data):
+        return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data) & 0xffffffff)
+    pixel = b'\x00' + bytes(((n >> 16) & 255, (n >> 8) & 255, n & 255))
+    return (b'\x89PNG\r\n\x1a\n' + chunk(b'IHDR', struct.pack('>IIBBBBB', 1, 1, 8, 2, 0, 0, 0))
+            + chunk(b'IDAT', zlib.compress(pixel)) + chunk(b'IEND', b''))
+
+
+def registration_form(n):
+    return {'full_name': f'Bench Student {n}', 'email': f'bench{n}@example.com', 'phone_number': '9876543210',
+            'college_selection': 'sjc', 'participation_type': 'Solo', 'idempotency_key': f'bench-{os.getpid()}-{n}'}
+
+
+def multipart(fields, file_field, filename, content):
+    boundary = f'bench{os.getpid()}{_unique()}'
+    parts = [f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode()
+             for name, value in fields.items()]
+    parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{file_field}"; filename="{filename}"\r\n'
+                 f'Content-Type: image/png\r\n\r\n'.encode() + content + b'\r\n')
+    parts.append(f'--{boundary}--\r\n'.encode())
+    return b''.join(parts), f'multipart/form-data; boundary={boundary}'
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = max(0, min(len(sorted_values) - 1, round(pct / 100 * len(sorted_values) + 0.5) - 1))
+    return sorted_values[index]
+
+
+def summarize(latencies, elapsed):
+    values = sorted(latencies)
+    return {'requests': len(values),
+            'p50_ms': round(percentile(values, 50) * 1000, 3),
+            'p95_ms': round(percentile(values, 95) * 1000, 3),
+            'p99_ms': round(percentile(values, 99) * 1000, 3),
+            'rps': round(len(values) / elapsed, 1) if elapsed else 0.0}
+
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes.
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def run_client(app, name, method, path, admin, max_requests, seconds, warmup=3):
+    client = app.test_client()
+    if admin:
+        client.post('/login', data={'username': 'admin', 'password': 'admin123'})
+
+    def once():
+        if method == 'POST':
+            n = _unique()
+            data = dict(registration_form(n), payment_proof=(io.BytesIO(tiny_png(n)), 'proof.png'))
+            response = client.post(path, data=data, content_type='multipart/form-data')
+        else:
+            response = client.get(path)
+        response.get_data()
+        if response.status_code >= 400:
+            raise RuntimeError(f'{name}: {method} {path} returned {response.status_code}')
+
+    for _ in range(warmup):
+        once()
+    latencies = []
+    started = time.perf_counter()
+    deadline = started + seconds
+    while len(latencies) < max_requests and time.perf_counter() < deadline:
+        t0 = time.perf_counter()
+        once()
+        latencies.append(time.perf_counter() - t0)
+    return summarize(latencies, time.perf_counter() - started)
+
+
+def http_login(port):
+    conn = http.client.HTTPConnection('127.0.0.1', port)
+    conn.request('POST', '/login', urlencode({'username': 'admin', 'password': 'admin123'}),
+                 {'Content-Type': 'application/x-www-form-urlencoded'})
+    response = conn.getresponse()
+    response.read()
+    conn.close()
+    return response.getheader('Set-Cookie', '').split(';')[0]
+
+
+def run_concurrent(port, name, method, path, cookie, concurrency, seconds):
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+    deadline = time.perf_counter() + seconds
+
+    def worker():
+        local = []
+        while time.perf_counter() < deadline:
+            headers = {'Cookie': cookie} if cookie else {}
+            body = None
+            if method == 'POST':
+                n = _unique()
+                body, content_type = multipart(registration_form(n), 'payment_proof', 'proof.png', tiny_png(n))
+                headers['Content-Type'] = content_type
+            t0 = time.perf_counter()
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+            try:
+                conn.request(method, path, body, headers)
+                response = conn.getresponse()
+                response.read()
+            finally:
+                conn.close()
+            local.append(time.perf_counter() - t0)
+            if response.status >= 400:
+                errors.append(response.status)
+                break
+        with lock:
+            latencies.extend(local)
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    if errors:
+        raise RuntimeError(f'{name}: {method} {path} returned {errors[0]}')
+    return summarize(latencies, time.perf_counter() - started)
+
+
+def compare(results, baseline, tolerance, min_delta_ms):
+    """Return a list of regression messages (empty if none)."""
+    failures = []
+    for name, modes in results['routes'].items():
+        for mode, current in modes.items():
+            before = baseline.get('routes', {}).get(name, {}).get(mode)
+            if not before:
+                continue
+            slower = current['p95_ms'] - before['p95_ms']
+            if slower > min_delta_ms and current['p95_ms'] > before['p95_ms'] * (1 + tolerance):
+                failures.append(f"{name}/{mode}: p95 {before['p95_ms']:.1f} -> {current['p95_ms']:.1f} ms")
+            if before['rps'] and current['rps'] < before['rps'] * (1 - tolerance):
+                failures.append(f"{name}/{mode}: throughput {before['rps']:.0f} -> {current['rps']:.0f} req/s")
+    if results.get('peak_rss_mb') and baseline.get('peak_rss_mb'):
+        if results['peak_rss_mb'] > baseline['peak_rss_mb'] * (1 + tolerance):
+            failures.append(f"peak RSS {baseline['peak_rss_mb']} -> {results['peak_rss_mb']} MB")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark every route against a seeded database.')
+    parser.add_argument('--db', default=DEFAULT_DB, help='database built by benchmarks/seed.py')
+    parser.add_argument('--routes', help='comma-separated subset of: ' + ', '.join(ROUTES))
+    parser.add_argument('--requests', type=int, default=200, help='max sequential requests per route')
+    parser.add_argument('--seconds', type=float, default=5.0, help='time budget per route and mode')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--no-concurrent', action='store_true', help='only run the test-client pass')
+    parser.add_argument('--no-page-cache', action='store_true', help='disable the in-memory page cache')
+    parser.add_argument('--admission', action='store_true',
+                        help='keep per-client rate limits on (every request comes from one address, so most POSTs get 429)')
+    parser.add_argument('--backup', action='store_true',
+                        help='take online snapshots back to back for the whole run, to measure their effect on writes')
+    parser.add_argument('--save', help='write results as JSON (e.g. a new baseline)')
+    parser.add_argument('--baseline', help='compare against this JSON and fail on regressions')
+    parser.add_argument('--tolerance', type=float, default=0.20)
+    parser.add_argument('--min-delta-ms', type=float, default=2.0, help='ignore p95 changes smaller than this')
+    args = parser.parse_args()
+
+    if not os.path.exists(args.db):
+        parser.error(f'{args.db} does not exist; run benchmarks/seed.py first')
+    names = args.routes.split(',') if args.routes else list(ROUTES)
+
+    # Registrations write proofs; keep them (and the database changes) out of the real tree.
+    workdir = tempfile.mkdtemp(prefix='bench-')
+    db_path = os.path.join(workdir, 'bench.db')
+    shutil.copyfile(args.db, db_path)
+    app = create_app({'DATABASE': db_path,
+                      'UPLOAD_FOLDER': os.path.join(workdir, 'uploads'),
+                      'PAYMENT_PROOF_FOLDER': os.path.join(workdir, 'uploads', 'payment_proofs'),
+                      'PAGE_CACHE_ENABLED': not args.no_page_cache,
+                      'ADMISSION_ENABLED': args.admission,
+                      'BACKUP_FOLDER': os.path.join(workdir, 'backups'),
+                      'BACKUP_INTERVAL': None,
+                      'TICKET_FOLDER': os.path.join(workdir, 'tickets')})
+    conn = db.connect(db_path)
+    event_id = conn.execute('SELECT id FROM events ORDER BY id LIMIT 1').fetchone()[0]
+    conn.close()
+
+    results = {'meta': {'python': platform.python_version(), 'platform': platform.platform(),
+                        'db': os.path.basename(args.db), 'concurrency': args.concurrency,
+                        'page_cache': not args.no_page_cache, 'admission': args.admission,
+                        'backup': args.backup},
+               'routes': {}}
+    server = None
+    backups_done = threading.Event()
+    try:
+        if args.backup:
+            def backup_loop():
+                while not backups_done.is_set():
+                    backup.create_snapshot(db_path, app.config['BACKUP_FOLDER'], keep=1)
+            threading.Thread(target=backup_loop, daemon=True).start()
+        print(f"{'route':<30}{'mode':<12}{'n':>7}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'req/s':>10}")
+        if not args.no_concurrent:
+            # One access-log line per request would dominate the output (and the timings).
+            logging.getLogger('werkzeug').setLevel(logging.ERROR)
+            server = make_server('127.0.0.1', 0, app, threaded=True)
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+            cookie = http_login(server.port)
+        for name in names:
+            method, path, admin = ROUTES[name]
+            path = path.format(event_id=event_id)
+            modes = {'client': run_client(app, name, method, path, admin, args.requests, args.seconds)}
+            if server:
+                modes['concurrent'] = run_concurrent(server.port, name, method, path, cookie if admin else None,
+                                                     args.concurrency, args.seconds)
+            results['routes'][name] = modes
+            for mode, stats in modes.items():
+                print(f"{name:<30}{mode:<12}{stats['requests']:>7}{stats['p50_ms']:>10.2f}"
+                      f"{stats['p95_ms']:>10.2f}{stats['p99_ms']:>10.2f}{stats['rps']:>10.1f}")
+    finally:
+        backups_done.set()
+        if server:
+            server.shutdown()
+        app.extensions['audit_writer'].stop()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    results['peak_rss_mb'] = peak_rss_mb()
+    if results['peak_rss_mb'] is not None:
+        print(f"peak RSS: {results['peak_rss_mb']} MB")
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"Saved results to {args.save}")
+    if args.baseline:
+        with open(args.baseline) as f:
+            failures = compare(results, json.load(f), args.tolerance, args.min_delta_ms)
+        for failure in failures:
+            print(f"REGRESSION {failure}")
+        if failures:
+            sys.exit(1)
+        print(f"No regressions against {args.baseline} (tolerance {args.tolerance:.0%}).")
+
+
+if __name__ == '__main__':
+    main()
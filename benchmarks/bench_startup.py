@@ -0,0 +1,77 @@
+"""Cold-start benchmark: how long a fresh worker takes to import, build the app and serve.
+
+Each sample runs in a new interpreter so nothing is warm:
+
+    python benchmarks/bench_startup.py [--runs 7] [--path /] [--json out.json]
+
+Reported per phase (median and best of the runs):
+    import         import app.py and everything it pulls in
+    create_app     build the application (no database work)
+    first_request  first GET: pool connection, template compile, empty page cache
+    second_request the same GET again, warm
+    migrate_check  reading user_version to see whether migrations are pending
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SAMPLE = r'''
+import json, sys, time
+t0 = time.perf_counter()
+import app as app_module
+t1 = time.perf_counter()
+app = app_module.create_app()
+t2 = time.perf_counter()
+client = app.test_client()
+status = client.get(sys.argv[1]).status_code
+t3 = time.perf_counter()
+client.get(sys.argv[1])
+t4 = time.perf_counter()
+import db, migrations
+conn = db.connect(app.config['DATABASE'])
+migrations.pending(conn)
+conn.close()
+t5 = time.perf_counter()
+print(json.dumps({'status': status, 'import': t1 - t0, 'create_app': t2 - t1,
+                  'first_request': t3 - t2, 'second_request': t4 - t3, 'migrate_check': t5 - t4}))
+'''
+
+PHASES = ('import', 'create_app', 'first_request', 'second_request', 'migrate_check')
+
+
+def sample(path):
+    out = subprocess.run([sys.executable, '-c', SAMPLE, path], cwd=ROOT, check=True,
+                         capture_output=True, text=True).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Cold-start and first-request latency.')
+    parser.add_argument('--runs', type=int, default=7)
+    parser.add_argument('--path', default='/')
+    parser.add_argument('--json', help='also write the results to this file')
+    args = parser.parse_args()
+
+    samples = [sample(args.path) for _ in range(args.runs)]
+    if any(s['status'] != 200 for s in samples):
+        print(f"warning: GET {args.path} returned {samples[0]['status']}; is the database migrated?")
+    results = {}
+    print(f"{'phase':<16}{'median ms':>12}{'best ms':>12}")
+    for phase in PHASES:
+        values = [s[phase] * 1000 for s in samples]
+        results[phase] = {'median_ms': round(statistics.median(values), 2), 'best_ms': round(min(values), 2)}
+        print(f"{phase:<16}{results[phase]['median_ms']:>12.2f}{results[phase]['best_ms']:>12.2f}")
+    total = sum(results[p]['median_ms'] for p in ('import', 'create_app', 'first_request'))
+    print(f"{'cold start':<16}{total:>12.2f}")
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'runs': args.runs, 'path': args.path, 'phases': results}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
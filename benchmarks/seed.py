@@ -0,0 +1,123 @@
+"""Generate a synthetic database at realistic volumes for the benchmarks.
+
+    python benchmarks/seed.py [--db benchmarks/bench.db] [--registrations 100000] [--logs 50000]
+                              [--photos 5000] [--materials 10000] [--events 50] [--feedback 2000]
+
+The file is recreated from scratch, migrated to the latest schema and filled
+with deterministic data (fixed random seed), so two runs produce the same
+database and benchmark numbers stay comparable. The admin user is
+admin/admin123, as in setup_database.py.
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import db  # noqa: E402
+import migrations  # noqa: E402
+
+DEFAULT_DB = os.path.join(ROOT, 'benchmarks', 'bench.db')
+DEFAULTS = {'registrations': 100000, 'logs': 50000, 'photos': 5000, 'materials': 10000,
+            'events': 50, 'feedback': 2000}
+
+WORDS = ('algorithms data structures operating systems networks database compiler theory python java '
+         'web design machine learning statistics calculus physics electronics hackathon workshop seminar '
+         'cloud security robotics graphics mobile quiz exam notes lab manual unit chapter').split()
+COLLEGES = ("St. Joseph's College (Autonomous)", 'National College', 'Bishop Heber College',
+            'Holy Cross College', 'Jamal Mohamed College')
+YEARS = ('1st Year', '2nd Year', '3rd Year')
+ACTIONS = ('User logged in: admin', 'Added event: {}', 'New registration: {}', 'New anonymous feedback received',
+           'Failed login attempt for: {}', 'Exported registrations as CSV')
+BATCH = 5000
+
+
+def words(rng, n):
+    return ' '.join(rng.choice(WORDS) for _ in range(n)).capitalize()
+
+
+def timestamps(rng, count, days):
+    """`count` sortable timestamps spread over the last `days` days, oldest first."""
+    end = datetime(2026, 1, 1)
+    start = end - timedelta(days=days)
+    span = (end - start).total_seconds()
+    return sorted((start + timedelta(seconds=rng.random() * span)).strftime('%Y-%m-%d %H:%M:%S')
+                  for _ in range(count))
+
+
+def insert(conn, sql, rows):
+    for i in range(0, len(rows), BATCH):
+        conn.executemany(sql, rows[i:i + BATCH])
+
+
+def seed(path, counts, rng_seed=42):
+    rng = random.Random(rng_seed)
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+    conn = db.connect(path)
+    migrations.migrate(conn)
+    timings = {}
+
+    def timed(name, sql, rows):
+        started = time.perf_counter()
+        with conn:
+            insert(conn, sql, rows)
+        timings[name] = (len(rows), time.perf_counter() - started)
+
+    with conn:
+        conn.execute("INSERT OR IGNORE INTO users (username, password) VALUES ('admin', 'admin123')")
+
+    timed('events', 'INSERT INTO events (title, description, event_date, event_manager, contact_number, image_file) '
+                    'VALUES (?, ?, ?, ?, ?, ?)',
+          [(words(rng, 3), words(rng, 40), ts[:10], words(rng, 2), '9876543210', f'event{i}.jpg')
+           for i, ts in enumerate(timestamps(rng, counts['events'], 365))])
+    timed('photos', 'INSERT INTO gallery (image_file, caption, upload_date) VALUES (?, ?, ?)',
+          [(f'photo{i}.jpg', words(rng, 6), ts) for i, ts in enumerate(timestamps(rng, counts['photos'], 730))])
+    timed('materials', 'INSERT INTO materials (title, subject, target_year, semester, file_link, upload_date) '
+                       'VALUES (?, ?, ?, ?, ?, ?)',
+          [(words(rng, 4), words(rng, 2), rng.choice(YEARS), rng.randint(1, 6), f'https://example.com/m/{i}', ts)
+           for i, ts in enumerate(timestamps(rng, counts['materials'], 730))])
+    timed('feedback', 'INSERT INTO feedback (message, timestamp) VALUES (?, ?)',
+          [(words(rng, 20), ts) for ts in timestamps(rng, counts['feedback'], 365)])
+    timed('logs', 'INSERT INTO activity_logs (action, timestamp) VALUES (?, ?)',
+          [(rng.choice(ACTIONS).format(words(rng, 2)), ts) for ts in timestamps(rng, counts['logs'], 300)])
+    # Ticket ids are unique, so draw them without replacement.
+    tickets = rng.sample(range(1000000), counts['registrations'])
+    timed('registrations', 'INSERT INTO hackathon_registrations (event_id, full_name, email, phone_number, '
+                           'college_name, payment_proof, participation_type, registration_date, ticket_id) '
+                           'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+          [(rng.randint(1, counts['events']), words(rng, 2).title(), f'student{i}@example.com', f'9{rng.randint(100000000, 999999999)}',
+            rng.choice(COLLEGES), f'{i % 256:02x}/{i // 256 % 256:02x}/proof{i}.png', rng.choice(('Solo', 'Team')),
+            ts, f'HT-{tickets[i]:06d}')
+           for i, ts in enumerate(timestamps(rng, counts['registrations'], 60))])
+
+    started = time.perf_counter()
+    conn.execute('ANALYZE')
+    conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+    timings['analyze'] = (0, time.perf_counter() - started)
+    conn.close()
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Seed a benchmark database.')
+    parser.add_argument('--db', default=DEFAULT_DB)
+    parser.add_argument('--seed', type=int, default=42)
+    for name, default in DEFAULTS.items():
+        parser.add_argument(f'--{name}', type=int, default=default)
+    args = parser.parse_args()
+
+    counts = {name: getattr(args, name) for name in DEFAULTS}
+    timings = seed(args.db, counts, args.seed)
+    for name, (rows, seconds) in timings.items():
+        print(f"{name:<15}{rows:>9} rows {seconds:>8.2f}s")
+    print(f"Seeded {args.db} ({os.path.getsize(args.db) / 1024 / 1024:.1f} MB)")
+
+
+if __name__ == '__main__':
+    main()
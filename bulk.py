@@ -0,0 +1,168 @@
+"""Bulk admin operations: multi-select deletes and multi-file photo uploads.
+
+Every batch writes its rows in one BEGIN IMMEDIATE transaction, so a
+hundred deletions cost one commit and one fsync instead of a hundred.
+File work (removing payment proofs and photos no row refers to any more,
+hashing and storing uploads) is spread over a small thread pool once the
+transaction is done. Each call returns a report with one result per item.
+"""
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import current_app
+
+import db
+import images
+from proof_storage import sniff_image_type
+
+# ?kind -> table. Files in the uploads folder are shared by content hash,
+# so one is only removed when none of the (table, column) pairs listed
+# under FILE_REFERENCES mentions it any more.
+BULK_TABLES = {
+    'registrations': 'hackathon_registrations',
+    'photos': 'gallery',
+    'materials': 'materials',
+    'feedback': 'feedback',
+}
+FILE_REFERENCES = {
+    'registrations': (('hackathon_registrations', 'payment_proof'),),
+    'photos': (('gallery', 'image_file'), ('events', 'image_file')),
+}
+MAX_ITEMS = 1000
+# Well below SQLite's bound-parameter limit.
+CHUNK_SIZE = 500
+FILE_WORKERS = 4
+
+_executor = None
+_executor_pid = None
+_executor_lock = threading.Lock()
+
+
+def _pool():
+    # Worker threads do not survive fork(), so each process gets its own pool.
+    global _executor, _executor_pid
+    with _executor_lock:
+        if _executor is None or _executor_pid != os.getpid():
+            _executor = ThreadPoolExecutor(max_workers=FILE_WORKERS, thread_name_prefix='bulk-files')
+            _executor_pid = os.getpid()
+        return _executor
+
+
+def _chunks(items):
+    for i in range(0, len(items), CHUNK_SIZE):
+        yield items[i:i + CHUNK_SIZE]
+
+
+def parse_ids(values):
+    """Integer ids from a multi-value form field, deduplicated, in order, at most MAX_ITEMS."""
+    ids = []
+    for value in values:
+        try:
+            item_id = int(value)
+        except (TypeError, ValueError):
+            continue
+        if item_id not in ids:
+            ids.append(item_id)
+    return ids[:MAX_ITEMS]
+
+
+def unreferenced_files(conn, kind, names):
+    """The subset of `names` that no row in FILE_REFERENCES[kind] still points at."""
+    names = list(names)
+    in_use = set()
+    for chunk in _chunks(names):
+        placeholders = ','.join('?' * len(chunk))
+        for table, column in FILE_REFERENCES[kind]:
+            in_use.update(row[0] for row in conn.execute(
+                f'SELECT DISTINCT {column} FROM {table} WHERE {column} IN ({placeholders})', chunk))
+    return [name for name in names if name not in in_use]
+
+
+def _file_remover(kind):
+    if kind == 'registrations':
+        return current_app.extensions['proof_store'].delete
+    return current_app.extensions['image_pipeline'].delete
+
+
+def _remove_file(remove, name):
+    try:
+        remove(name)
+        return None
+    except OSError as e:
+        return str(e)
+
+
+def delete_items(conn, kind, ids):
+    """Delete rows of `kind` by id in one transaction, then their unused files in parallel.
+
+    Returns {'results': [{'id', 'status'}], 'deleted', 'not_found', 'files_removed', 'file_errors'}.
+    """
+    table = BULK_TABLES[kind]
+    file_column = FILE_REFERENCES[kind][0][1] if kind in FILE_REFERENCES else None
+    columns = f'id, {file_column}' if file_column else 'id'
+
+    def work():
+        found = {}
+        for chunk in _chunks(ids):
+            placeholders = ','.join('?' * len(chunk))
+            for row in conn.execute(f'SELECT {columns} FROM {table} WHERE id IN ({placeholders})', chunk):
+                found[row['id']] = row[file_column] if file_column else None
+            conn.execute(f'DELETE FROM {table} WHERE id IN ({placeholders})', chunk)
+        files = unreferenced_files(conn, kind, {f for f in found.values() if f}) if file_column else []
+        return found, files
+
+    found, files = db.write_transaction(conn, work)
+
+    file_errors = []
+    if files:
+        remove = _file_remover(kind)
+        for name, error in zip(files, _pool().map(lambda name: _remove_file(remove, name), files)):
+            if error:
+                file_errors.append({'file': name, 'error': error})
+    return {
+        'results': [{'id': item_id, 'status': 'deleted' if item_id in found else 'not found'} for item_id in ids],
+        'deleted': len(found),
+        'not_found': len(ids) - len(found),
+        'files_removed': len(files) - len(file_errors),
+        'file_errors': file_errors,
+    }
+
+
+def _store_photo(file_storage, folder):
+    head = file_storage.stream.read(64)
+    file_storage.stream.seek(0)
+    if sniff_image_type(head) is None:
+        return None
+    return images.save_upload(file_storage, folder)
+
+
+def upload_photos(conn, files, caption):
+    """Store several gallery photos with one shared caption; the rows are inserted in one transaction.
+
+    Returns {'results': [{'file', 'status', 'image_file'}], 'uploaded'}.
+    """
+    files = [f for f in files if f and f.filename][:MAX_ITEMS]
+    folder = current_app.config['UPLOAD_FOLDER']
+    stored = list(_pool().map(lambda f: _store_photo(f, folder), files))
+
+    results, new_files = [], []
+    for file_storage, image_file in zip(files, stored):
+        if image_file is None:
+            status = 'not an image'
+        elif image_file in new_files:
+            status = 'duplicate'
+        else:
+            status = 'uploaded'
+            new_files.append(image_file)
+        results.append({'file': file_storage.filename, 'status': status, 'image_file': image_file})
+
+    if new_files:
+        def work():
+            conn.executemany('INSERT INTO gallery (image_file, caption) VALUES (?, ?)',
+                             [(image_file, caption) for image_file in new_files])
+        db.write_transaction(conn, work)
+        pipeline = current_app.extensions['image_pipeline']
+        for image_file in new_files:
+            pipeline.submit(image_file)
+    return {'results': results, 'uploaded': len(new_files)}
@@ -0,0 +1,131 @@
+import functools
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from flask import current_app, request, session
+
+from db import get_db_connection
+
+# Tables whose contents appear on public pages. Any INSERT/UPDATE/DELETE on
+# one of them bumps its version in cache_versions, which invalidates every
+# cached page and query result tagged with that table, in every worker process.
+CACHED_TABLES = ('events', 'gallery', 'materials')
+
+
+def init_schema(conn):
+    conn.execute('CREATE TABLE IF NOT EXISTS cache_versions (tag TEXT PRIMARY KEY, version INTEGER NOT NULL DEFAULT 0)')
+    for table in CACHED_TABLES:
+        conn.execute('INSERT OR IGNORE INTO cache_versions (tag, version) VALUES (?, 0)', (table,))
+        for event in ('INSERT', 'UPDATE', 'DELETE'):
+            conn.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS trg_{table}_cache_{event.lower()} AFTER {event} ON {table}
+                BEGIN UPDATE cache_versions SET version = version + 1 WHERE tag = '{table}'; END
+            ''')
+
+
+def bump_versions(conn, tags):
+    """Invalidate everything tagged with `tags` without touching the tables themselves."""
+    with conn:
+        conn.executemany('UPDATE cache_versions SET version = version + 1 WHERE tag = ?', [(tag,) for tag in tags])
+
+
+class PageCache:
+    """In-memory LRU cache with a TTL, keyed by request and tagged by table.
+
+    Each entry remembers the table versions it was built from; a lookup
+    whose current versions differ is a miss and drops the entry.
+    """
+
+    def __init__(self, max_entries=256, ttl=300):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, versions):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires, entry_versions, value = entry
+            if expires < time.monotonic() or entry_versions != versions:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, versions, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, versions, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+def current_versions(tags):
+    rows = get_db_connection().execute(
+        f"SELECT tag, version FROM cache_versions WHERE tag IN ({','.join('?' * len(tags))})", tags)
+    return tuple(sorted((row['tag'], row['version']) for row in rows))
+
+
+def cached_query(tags, sql, params=()):
+    """Run a read-only query, reusing the rows until one of `tags` changes."""
+    cache = current_app.extensions['page_cache']
+    key = ('query', sql, tuple(params))
+    versions = current_versions(tags)
+    rows = cache.get(key, versions)
+    if rows is None:
+        rows = [dict(row) for row in get_db_connection().execute(sql, params)]
+        cache.set(key, versions, rows)
+    return rows
+
+
+class CachedPage:
+    def __init__(self, body, mimetype):
+        self.body = body
+        self.mimetype = mimetype
+        self.etag = hashlib.sha1(body).hexdigest()
+
+    def to_response(self):
+        response = current_app.response_class(self.body, mimetype=self.mimetype)
+        response.set_etag(self.etag)
+        # Browsers may keep the page but must revalidate; unchanged pages cost a 304.
+        response.headers['Cache-Control'] = 'no-cache'
+        response.vary.add('Cookie')
+        return response.make_conditional(request)
+
+
+def cached_page(*tags):
+    """Serve a public GET view from memory until one of `tags` (table names) changes."""
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            if request.method != 'GET' or not current_app.config.get('PAGE_CACHE_ENABLED', True):
+                return view(*args, **kwargs)
+            cache = current_app.extensions['page_cache']
+            # The navbar differs for admins, so they get their own copy.
+            key = ('page', request.endpoint, request.full_path, bool(session.get('admin')))
+            versions = current_versions(tags)
+            page = cache.get(key, versions)
+            if page is None:
+                response = current_app.make_response(view(*args, **kwargs))
+                if response.status_code != 200 or response.direct_passthrough:
+                    return response
+                page = CachedPage(response.get_data(), response.mimetype)
+                cache.set(key, versions, page)
+            return page.to_response()
+        return wrapper
+    return decorator
+
+
+def init_app(app):
+    app.config.setdefault('PAGE_CACHE_ENABLED', True)
+    app.config.setdefault('PAGE_CACHE_SIZE', 256)
+    app.config.setdefault('PAGE_CACHE_TTL', 300)
+    app.extensions['page_cache'] = PageCache(app.config['PAGE_CACHE_SIZE'], app.config['PAGE_CACHE_TTL'])
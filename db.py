@@ -0,0 +1,144 @@
+import os
+import queue
+import random
+import sqlite3
+import threading
+import time
+
+from flask import g, current_app
+
+# Applied once to every new connection. WAL lets readers keep going while a
+# registration is being written, busy_timeout makes writers wait for the lock
+# instead of failing straight away with "database is locked".
+PRAGMAS = (
+    'PRAGMA journal_mode=WAL',
+    'PRAGMA busy_timeout=5000',
+    'PRAGMA synchronous=NORMAL',
+    'PRAGMA cache_size=-8000',
+    'PRAGMA temp_store=MEMORY',
+)
+
+# Compiled statements kept per connection. Since connections are reused,
+# the same SELECT/INSERT is only prepared once per pooled connection.
+STATEMENT_CACHE_SIZE = 256
+POOL_SIZE = 8
+# How many times a write transaction is retried once busy_timeout has run out.
+WRITE_ATTEMPTS = 3
+
+
+def connect(path, factory=None):
+    """Open a new tuned connection. Used directly by scripts and worker threads.
+
+    `factory` is an optional sqlite3.Connection subclass (see metrics.TracedConnection).
+    """
+    conn = sqlite3.connect(path, timeout=5.0, check_same_thread=False,
+                           cached_statements=STATEMENT_CACHE_SIZE, factory=factory or sqlite3.Connection)
+    conn.row_factory = sqlite3.Row
+    for pragma in PRAGMAS:
+        conn.execute(pragma)
+    return conn
+
+
+def is_busy(error):
+    message = str(error)
+    return 'database is locked' in message or 'database table is locked' in message or 'busy' in message
+
+
+def write_transaction(conn, work, attempts=WRITE_ATTEMPTS):
+    """Run work() inside BEGIN IMMEDIATE and commit, returning its result.
+
+    Taking the write lock up front means the transaction can never fail
+    half-way with SQLITE_BUSY after it has read something. If the lock stays
+    busy past busy_timeout, the whole transaction is retried after a short
+    jittered backoff, up to `attempts` times.
+    """
+    for attempt in range(attempts):
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            result = work()
+            conn.commit()
+            return result
+        except sqlite3.OperationalError as e:
+            if conn.in_transaction:
+                conn.rollback()
+            if not is_busy(e) or attempt == attempts - 1:
+                raise
+            time.sleep(min(0.05 * 2 ** attempt, 1.0) * random.uniform(0.5, 1.5))
+        except BaseException:
+            if conn.in_transaction:
+                conn.rollback()
+            raise
+
+
+class ConnectionPool:
+    """Small LIFO pool of connections to one database file."""
+
+    def __init__(self, path, size=POOL_SIZE, factory=None):
+        self.path = path
+        self.size = size
+        self.factory = factory
+        self.pid = os.getpid()
+        self._idle = queue.LifoQueue(maxsize=size)
+
+    def acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            return connect(self.path, self.factory)
+
+    def release(self, conn):
+        if conn.in_transaction:
+            conn.rollback()
+        try:
+            self._idle.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+    def close_all(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(path, factory=None):
+    key = (path, factory)
+    pool = _pools.get(key)
+    # Connections must never be shared across a fork (prefork servers).
+    if pool is None or pool.pid != os.getpid():
+        with _pools_lock:
+            pool = _pools.get(key)
+            if pool is None or pool.pid != os.getpid():
+                pool = ConnectionPool(path, factory=factory)
+                _pools[key] = pool
+    return pool
+
+
+def _request_pool():
+    return get_pool(current_app.config['DATABASE'], current_app.config['DB_CONNECTION_FACTORY'])
+
+
+def get_db_connection():
+    """Return the connection for the current request, checking one out of the pool on first use."""
+    if 'db' not in g:
+        g.db = _request_pool().acquire()
+    return g.db
+
+
+def close_db(e=None):
+    """Hand the request's connection back to the pool (uncommitted work is rolled back)."""
+    conn = g.pop('db', None)
+    if conn is not None:
+        _request_pool().release(conn)
+
+
+def init_app(app):
+    app.config.setdefault('DATABASE', os.path.join(app.root_path, 'database.db'))
+    # Class used for request connections; metrics.init_app swaps in a tracing one.
+    app.config.setdefault('DB_CONNECTION_FACTORY', None)
+    app.teardown_appcontext(close_db)
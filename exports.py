@@ -0,0 +1,166 @@
+"""Streaming exports of hackathon registrations.
+
+Rows are read from a cursor in small batches and written straight into the
+response, so memory use stays flat whether there are ten registrants or
+fifty thousand.
+"""
+import csv
+import io
+import json
+import re
+import zipfile
+from xml.sax.saxutils import escape
+
+import db
+import registrations
+
+EXPORT_COLUMNS = ('id', 'event_id', 'ticket_id', 'full_name', 'email', 'phone_number', 'college_name',
+                  'participation_type', 'payment_proof', 'registration_date')
+BATCH_SIZE = 500
+
+FORMATS = {
+    'csv': 'text/csv',
+    'jsonl': 'application/x-ndjson',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+}
+
+
+def iter_batches(db_path, where, params):
+    """Yield lists of rows from a dedicated connection, BATCH_SIZE at a time."""
+    conn = db.connect(db_path)
+    try:
+        sql = f"SELECT {', '.join(EXPORT_COLUMNS)} FROM hackathon_registrations"
+        if where:
+            sql += ' WHERE ' + ' AND '.join(where)
+        sql += ' ORDER BY id'
+        cursor = conn.execute(sql, params)
+        while True:
+            rows = cursor.fetchmany(BATCH_SIZE)
+            if not rows:
+                break
+            yield rows
+    finally:
+        conn.close()
+
+
+def _csv_safe(value):
+    # Spreadsheet apps run cells starting with these as formulas; names come from a public form.
+    if isinstance(value, str) and value[:1] in ('=', '+', '-', '@'):
+        return "'" + value
+    return value
+
+
+def stream_csv(batches):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_COLUMNS)
+    for rows in batches:
+        writer.writerows(tuple(_csv_safe(value) for value in row) for row in rows)
+        yield buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode('utf-8')
+
+
+def stream_jsonl(batches):
+    for rows in batches:
+        yield ''.join(json.dumps(dict(row), ensure_ascii=False) + '\n' for row in rows).encode('utf-8')
+
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only file object that hands written bytes back to the generator.
+
+    It is not seekable, so zipfile writes data descriptors instead of
+    seeking back, which is what lets the workbook be streamed.
+    """
+
+    def __init__(self):
+        self.chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks.clear()
+        return data
+
+
+_XLSX_PARTS = {
+    '[Content_Types].xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        '</Types>'),
+    '_rels/.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Target="xl/workbook.xml" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument"/>'
+        '</Relationships>'),
+    'xl/workbook.xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+        'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+        '<sheets><sheet name="Registrations" sheetId="1" r:id="rId1"/></sheets></workbook>'),
+    'xl/_rels/workbook.xml.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Target="worksheets/sheet1.xml" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet"/>'
+        '</Relationships>'),
+}
+
+# Characters that are not allowed anywhere in XML 1.0.
+_XML_INVALID = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+
+def _xlsx_row(values):
+    cells = []
+    for value in values:
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            cells.append(f'<c t="n"><v>{value}</v></c>')
+        elif value is not None:
+            text = escape(_XML_INVALID.sub('', str(value)))
+            cells.append(f'<c t="inlineStr"><is><t xml:space="preserve">{text}</t></is></c>')
+        else:
+            cells.append('<c/>')
+    return '<row>' + ''.join(cells) + '</row>'
+
+
+def stream_xlsx(batches):
+    """Minimal single-sheet workbook using inline strings, written as a zip stream."""
+    sink = _ChunkSink()
+    with zipfile.ZipFile(sink, 'w', compression=zipfile.ZIP_DEFLATED) as workbook:
+        for name, content in _XLSX_PARTS.items():
+            workbook.writestr(name, content)
+        with workbook.open('xl/worksheets/sheet1.xml', 'w', force_zip64=True) as sheet:
+            sheet.write(b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                        b'<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>')
+            sheet.write(_xlsx_row(EXPORT_COLUMNS).encode('utf-8'))
+            for rows in batches:
+                sheet.write(''.join(_xlsx_row(tuple(row)) for row in rows).encode('utf-8'))
+                data = sink.drain()
+                if data:
+                    yield data
+            sheet.write(b'</sheetData></worksheet>')
+    yield sink.drain()
+
+
+STREAMERS = {'csv': stream_csv, 'jsonl': stream_jsonl, 'xlsx': stream_xlsx}
+
+
+def export_registrations(db_path, fmt, args):
+    """Return a generator of response chunks for the given format and filters."""
+    where, params = registrations.registration_filters(args)
+    return STREAMERS[fmt](iter_batches(db_path, where, params))
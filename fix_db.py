@@ -1,70 +1,23 @@
-import sqlite3
 import os
+import sqlite3
+
+import migrations
 
 def fix_database():
     """
-    Fix database by adding the missing feedback table.
-    This script is safe to run multiple times - it won't affect existing tables.
+    Bring the database schema up to date (this used to only add the feedback table).
+    This script is safe to run multiple times - migrations that already ran are skipped.
     """
+    db_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'database.db')
     try:
-        # Get the database path
-        db_path = os.path.join(os.path.dirname(__file__), 'database.db')
-        
-        print(f"Connecting to database: {db_path}")
-        
-        # Connect to the database
-        connection = sqlite3.connect(db_path)
-        cursor = connection.cursor()
-        
-        print("✓ Connected successfully")
-        
-        # Create the feedback table if it doesn't exist
-        print("Creating 'feedback' table...")
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS feedback (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                message TEXT NOT NULL,
-                timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
-        
-        # Commit the changes
-        connection.commit()
-        print("✓ Table 'feedback' created successfully")
-        
-        # Verify the table exists
-        cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='feedback'")
-        result = cursor.fetchone()
-        
-        if result:
-            print("✓ Verification passed: 'feedback' table exists")
-            
-            # Show table schema
-            cursor.execute("PRAGMA table_info(feedback)")
-            columns = cursor.fetchall()
-            print("\nTable schema:")
-            for col in columns:
-                print(f"  - {col[1]} ({col[2]})")
-        else:
-            print("✗ Warning: Table verification failed")
-        
-        # Close the connection
-        connection.close()
-        print("\n✅ Database fix completed successfully!")
-        print("You can now restart your Flask app and access the dashboard.")
-        
+        return migrations.run(db_path, check=True)
     except sqlite3.Error as e:
         print(f"\n❌ Database error: {e}")
         return False
-    except Exception as e:
-        print(f"\n❌ Unexpected error: {e}")
-        return False
-    
-    return True
 
 if __name__ == "__main__":
     print("=" * 60)
-    print("  Database Fix Script - Adding 'feedback' Table")
+    print("  Database Fix Script - Applying Schema Migrations")
     print("=" * 60)
     print()
     
@@ -0,0 +1,47 @@
+"""Prefork production profile.
+
+    flask db-migrate                     # once per deploy (on_starting below also does it)
+    flask build-assets                   # likewise
+    gunicorn -c gunicorn.conf.py         # serve wsgi:app
+
+Graceful reload: `kill -HUP <master>` starts fresh workers and lets the old
+ones finish their requests. Because the app is preloaded in the master, new
+code needs a full upgrade instead: `kill -USR2 <master>` then
+`kill -QUIT <old master>` once the new one is serving.
+"""
+import multiprocessing
+import os
+
+wsgi_app = 'wsgi:app'
+bind = os.environ.get('BIND', '0.0.0.0:8000')
+
+# Import the app once in the master and fork workers from it, so code and
+# templates are shared copy-on-write and each worker boots in milliseconds.
+preload_app = True
+
+# SQLite has one writer at a time, so extra processes mostly add read
+# capacity; the usual 2*CPU+1 is capped to keep memory predictable.
+workers = int(os.environ.get('WEB_CONCURRENCY', min(multiprocessing.cpu_count() * 2 + 1, 9)))
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+
+timeout = 60
+graceful_timeout = 30
+keepalive = 5
+# Recycle workers now and then so slow leaks cannot build up; jitter keeps
+# them from all restarting at once.
+max_requests = 5000
+max_requests_jitter = 500
+
+accesslog = '-'
+
+
+def on_starting(server):
+    # Runs once in the master before any worker exists, so migrations never
+    # race for the schema lock and workers start with zero DDL.
+    import assets
+    import migrations
+    # With preload_app the application is already built; this returns it.
+    app = server.app.wsgi()
+    migrations.run(app.config['DATABASE'])
+    assets.build(app.static_folder)
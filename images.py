@@ -0,0 +1,210 @@
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import click
+from flask import current_app, url_for
+from werkzeug.utils import secure_filename
+
+import db
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Pillow is optional; without it originals are served as-is.
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 64 * 1024
+VARIANT_FOLDER = 'variants'
+FORMATS = {'webp': ('WEBP', 'webp'), 'jpeg': ('JPEG', 'jpg')}
+
+
+def save_upload(file_storage, folder):
+    """Stream an upload to `folder` under a content-hashed name and return the name.
+
+    Identical files map to the same name, so a re-upload reuses the stored
+    copy, and two different files called "poster.jpg" no longer overwrite
+    each other.
+    """
+    ext = os.path.splitext(secure_filename(file_storage.filename))[1].lower() or '.jpg'
+    digest = hashlib.sha256()
+    fd, tmp_path = tempfile.mkstemp(dir=folder, suffix='.part')
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            for chunk in iter(lambda: file_storage.stream.read(CHUNK_SIZE), b''):
+                digest.update(chunk)
+                out.write(chunk)
+        filename = digest.hexdigest()[:20] + ext
+        final_path = os.path.join(folder, filename)
+        if os.path.exists(final_path):
+            os.remove(tmp_path)
+            # A fresh mtime keeps the upload garbage collector's grace period from covering a reused file.
+            os.utime(final_path)
+        else:
+            os.replace(tmp_path, final_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return filename
+
+
+def variant_name(filename, width, fmt):
+    stem = os.path.splitext(filename)[0]
+    return f"{stem}_w{width}.{FORMATS[fmt][1]}"
+
+
+class ImagePipeline:
+    """Builds resized, recompressed copies of uploaded images on a worker pool.
+
+    For every width in `widths` narrower than the original a WebP and a JPEG
+    copy are written to <upload folder>/variants/, so a variant's name and
+    srcset descriptor are always its real width. Templates pick them up
+    through image_srcset(); an image no wider than the smallest width has no
+    variants and is served as uploaded.
+    """
+
+    def __init__(self, upload_folder, widths=(320, 640, 1280), workers=2, quality=80):
+        self.upload_folder = upload_folder
+        self.variant_folder = os.path.join(upload_folder, VARIANT_FOLDER)
+        self.widths = tuple(sorted(widths))
+        self.workers = workers
+        self.quality = quality
+        self._lock = threading.Lock()
+        self._executor = None
+        self._pid = None
+        self._pending = set()
+        # Called with the filename once its variants are on disk.
+        self.on_complete = None
+
+    @property
+    def enabled(self):
+        return Image is not None
+
+    def _get_executor(self):
+        # Worker threads do not survive fork(), so each process gets its own pool.
+        with self._lock:
+            if self._executor is None or self._pid != os.getpid():
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='image-variants')
+                self._pid = os.getpid()
+            return self._executor
+
+    def submit(self, filename):
+        """Queue variant generation for an image already saved in the upload folder."""
+        if not self.enabled:
+            return None
+        executor = self._get_executor()
+        with self._lock:
+            # The same content uploaded twice shares one hashed name; build it once.
+            if filename in self._pending:
+                return None
+            self._pending.add(filename)
+        return executor.submit(self._build_logged, filename)
+
+    def _build_logged(self, filename):
+        try:
+            written = self.build_variants(filename)
+            if self.on_complete:
+                self.on_complete(filename)
+            return written
+        except Exception:
+            logger.exception('Could not build image variants for %s', filename)
+            return []
+        finally:
+            with self._lock:
+                self._pending.discard(filename)
+
+    def build_variants(self, filename):
+        os.makedirs(self.variant_folder, exist_ok=True)
+        written = []
+        with Image.open(os.path.join(self.upload_folder, filename)) as source:
+            image = ImageOps.exif_transpose(source)
+            has_alpha = image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info)
+            if image.mode not in ('RGB', 'RGBA'):
+                image = image.convert('RGBA' if has_alpha else 'RGB')
+            for width in self.widths:
+                if width >= image.width:
+                    # Built by an older version, which upscaled the name but not the image.
+                    for fmt in FORMATS:
+                        stale = os.path.join(self.variant_folder, variant_name(filename, width, fmt))
+                        if os.path.exists(stale):
+                            os.remove(stale)
+                    continue
+                height = max(1, round(image.height * width / image.width))
+                resized = image.resize((width, height), Image.LANCZOS)
+                for fmt, (pil_format, _) in FORMATS.items():
+                    frame = resized.convert('RGB') if pil_format == 'JPEG' else resized
+                    options = {'quality': self.quality}
+                    if pil_format == 'JPEG':
+                        options.update(optimize=True, progressive=True)
+                    else:
+                        options.update(method=4)
+                    path = os.path.join(self.variant_folder, variant_name(filename, width, fmt))
+                    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.part"
+                    frame.save(tmp_path, pil_format, **options)
+                    os.replace(tmp_path, path)
+                    written.append(path)
+        return written
+
+    def delete(self, filename):
+        """Remove an upload and every variant built from it."""
+        paths = [os.path.join(self.upload_folder, filename)]
+        paths += [os.path.join(self.variant_folder, variant_name(filename, w, fmt)) for w in self.widths for fmt in FORMATS]
+        for path in paths:
+            if os.path.exists(path):
+                os.remove(path)
+
+    def available_widths(self, filename):
+        return [w for w in self.widths
+                if os.path.exists(os.path.join(self.variant_folder, variant_name(filename, w, 'webp')))]
+
+
+def image_srcset(filename, fmt='webp'):
+    """srcset value listing the variants built so far ('' until the pool has run)."""
+    if not filename:
+        return ''
+    pipeline = current_app.extensions['image_pipeline']
+    return ', '.join(
+        f"{url_for('static', filename=f'uploads/{VARIANT_FOLDER}/' + variant_name(filename, w, fmt))} {w}w"
+        for w in pipeline.available_widths(filename))
+
+
+def image_url(filename, width=None):
+    """URL of the JPEG variant closest to `width`, falling back to the original upload."""
+    if not filename:
+        return ''
+    if width:
+        widths = current_app.extensions['image_pipeline'].available_widths(filename)
+        if widths:
+            best = next((w for w in widths if w >= width), widths[-1])
+            return url_for('static', filename=f'uploads/{VARIANT_FOLDER}/' + variant_name(filename, best, 'jpeg'))
+    return url_for('static', filename='uploads/' + filename)
+
+
+def init_app(app):
+    app.config.setdefault('IMAGE_VARIANT_WIDTHS', (320, 640, 1280))
+    app.config.setdefault('IMAGE_WORKERS', 2)
+    pipeline = ImagePipeline(app.config['UPLOAD_FOLDER'],
+                             widths=app.config['IMAGE_VARIANT_WIDTHS'],
+                             workers=app.config['IMAGE_WORKERS'])
+    app.extensions['image_pipeline'] = pipeline
+    app.add_template_global(image_srcset)
+    app.add_template_global(image_url)
+
+    @app.cli.command('build-image-variants')
+    def build_image_variants_command():
+        """Build missing variants for every gallery photo and event poster."""
+        if not pipeline.enabled:
+            raise click.ClickException('Pillow is not installed.')
+        conn = db.connect(app.config['DATABASE'])
+        rows = conn.execute("SELECT image_file FROM gallery UNION SELECT image_file FROM events WHERE image_file != ''")
+        futures = [pipeline.submit(row[0]) for row in rows if not pipeline.available_widths(row[0])]
+        conn.close()
+        futures = [future for future in futures if future is not None]
+        for future in futures:
+            future.result()
+        click.echo(f'Built variants for {len(futures)} image(s).')
@@ -0,0 +1,314 @@
+"""Live admin pages: new feedback, registrations and log entries pushed over Server-Sent Events.
+
+GET /admin/stream is an EventSource stream. Every new row is one event
+(`feedback`, `registration` or `log`) whose id is the cursor "f.r.l", the
+last feedback, registration and activity log id the client has been sent.
+The browser hands it back as Last-Event-ID when it reconnects, and the gap
+is replayed from the tables. Pages render the cursor they were built from
+into the stream URL as ?since=, so nothing committed between the page load
+and the stream opening is lost. Two more events:
+
+* `counts`: the table_counts rows, sent on connect and whenever one changes;
+* `reset`: the client is too far behind to replay (more than REPLAY_LIMIT
+  rows in a stream). Its id is the current cursor, so the stream carries on
+  from there and the page reloads what it shows instead.
+
+Change detection is shared: one ChangeHub thread per process polls
+PRAGMA data_version on its own connection (it moves whenever another
+connection, in any process, commits) and only then reads the new rows, once
+for all subscribers. With no subscribers the thread sleeps.
+
+Under WSGI an open stream holds a server thread, so each process keeps at
+most LIVE_MAX_STREAMS of them open and ends each after LIVE_STREAM_SECONDS
+(the browser reconnects at once with its Last-Event-ID). Past the cap the
+answer is 503 and the pages poll the same URL as JSON with ?since=. The
+ASGI entry point serves streams natively, without a thread per client.
+"""
+import json
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+from flask import current_app, jsonify, request
+
+import db
+
+logger = logging.getLogger(__name__)
+
+# Event name -> (table, columns sent to the browser). The order is the order of the cursor's parts.
+STREAMS = {
+    'feedback': ('feedback', 'id, message, timestamp'),
+    'registration': ('hackathon_registrations', 'id, event_id, ticket_id, full_name, email, phone_number, '
+                     'college_name, participation_type, payment_proof, registration_date'),
+    'log': ('activity_logs', 'id, action, timestamp'),
+}
+POLL_INTERVAL = 0.5
+HEARTBEAT = 15
+# A client further behind than this in any one stream gets a reset instead of a replay.
+REPLAY_LIMIT = 200
+# Rows the hub publishes per poll, and poll batches a subscriber may fall behind, before a reset.
+MAX_QUEUE = 1000
+RETRY_MS = 3000
+
+
+def parse_cursor(value):
+    """{stream: last id} from an "f.r.l" cursor, or None if it is missing or malformed."""
+    parts = (value or '').split('.')
+    if len(parts) != len(STREAMS) or not all(part.isdigit() for part in parts):
+        return None
+    return dict(zip(STREAMS, map(int, parts)))
+
+
+def format_cursor(cursor):
+    return '.'.join(str(cursor[name]) for name in STREAMS)
+
+
+def latest_cursor(conn):
+    # MAX(id) on an INTEGER PRIMARY KEY is a single b-tree seek.
+    return {name: conn.execute(f'SELECT COALESCE(MAX(id), 0) FROM {table}').fetchone()[0]
+            for name, (table, _) in STREAMS.items()}
+
+
+def current_cursor(conn):
+    """Cursor string for a page about to be rendered; read it before the page's own queries."""
+    return format_cursor(latest_cursor(conn))
+
+
+def table_counts(conn):
+    return {row['table_name']: row['row_count'] for row in conn.execute('SELECT * FROM table_counts')}
+
+
+def new_rows(conn, cursor, limit):
+    """[(event, row)] committed after `cursor`, in id order; None if a stream has more than `limit` new rows."""
+    events = []
+    for name, (table, columns) in STREAMS.items():
+        rows = conn.execute(f'SELECT {columns} FROM {table} WHERE id > ? ORDER BY id LIMIT ?',
+                            (cursor[name], limit + 1)).fetchall()
+        if len(rows) > limit:
+            return None
+        events.extend((name, dict(row)) for row in rows)
+    return events
+
+
+def sse_message(event, data, event_id=None):
+    lines = [f'id: {event_id}'] if event_id is not None else []
+    lines += [f'event: {event}', f'data: {json.dumps(data, separators=(",", ":"))}']
+    return '\n'.join(lines) + '\n\n'
+
+
+class Follower:
+    """One client's position in the streams.
+
+    Turns batches published by the hub (or read by catch_up) into
+    (event, data, id) messages, skipping rows the client has already been
+    sent, so replay and live delivery may overlap freely.
+    """
+
+    def __init__(self, cursor=None):
+        self.cursor = dict(cursor) if cursor else None
+        self.counts = None
+        # Set from the hub thread when this client's queue overflowed; the reader catches up from the tables.
+        self.behind = False
+
+    def catch_up(self, conn):
+        """Messages for everything committed since the cursor (or a reset), followed by the counts."""
+        self.behind = False
+        if self.cursor is None:
+            self.cursor = latest_cursor(conn)
+            batch = []
+        else:
+            batch = new_rows(conn, self.cursor, REPLAY_LIMIT)
+            if batch is None:
+                batch = [('reset', latest_cursor(conn))]
+        batch.append(('counts', table_counts(conn)))
+        return self.accept(batch)
+
+    def accept(self, batch):
+        messages = []
+        for event, data in batch:
+            if event in STREAMS:
+                if data['id'] <= self.cursor[event]:
+                    continue
+                self.cursor[event] = data['id']
+                messages.append((event, data, format_cursor(self.cursor)))
+            elif event == 'reset':
+                self.cursor = {name: max(self.cursor[name], data[name]) for name in STREAMS}
+                messages.append(('reset', {}, format_cursor(self.cursor)))
+            elif event == 'counts' and data != self.counts:
+                self.counts = data
+                messages.append((event, data, None))
+        return messages
+
+
+class ChangeHub:
+    """One change-detection loop per process, shared by every open stream.
+
+    subscribe(callback) registers a function the hub thread calls with each
+    batch of [(event, data)]: new rows in id order, then 'counts' if a row
+    count changed, or a single 'reset' when more than MAX_QUEUE rows arrived
+    at once. Callbacks run on the hub thread and must only hand the batch
+    over (queue.put_nowait, loop.call_soon_threadsafe).
+    """
+
+    def __init__(self, path, poll_interval=POLL_INTERVAL):
+        self.path = path
+        self.poll_interval = poll_interval
+        self._lock = threading.Lock()
+        self._cond = None
+        self._subscribers = set()
+        self._cursor = None
+        self._thread = None
+        self._pid = None
+
+    def _ensure_started(self):
+        # Threads do not survive fork(), so each worker process starts its own.
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid():
+                return
+            self._cond = threading.Condition()
+            self._subscribers = set()
+            self._cursor = None
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='live-hub', daemon=True)
+            self._thread.start()
+
+    def subscribe(self, callback, timeout=5.0):
+        """Register `callback`; returns once the hub has a position, so a catch-up read after this misses nothing."""
+        self._ensure_started()
+        with self._cond:
+            self._subscribers.add(callback)
+            self._cond.notify_all()
+            self._cond.wait_for(lambda: self._cursor is not None, timeout)
+
+    def unsubscribe(self, callback):
+        if self._cond is None:
+            return
+        with self._cond:
+            self._subscribers.discard(callback)
+
+    def _run(self):
+        conn = db.connect(self.path)
+        version = counts = None
+        while True:
+            with self._cond:
+                if not self._subscribers:
+                    # Idle: forget the position, so the next subscriber is not sent a backlog.
+                    self._cursor = None
+                    self._cond.wait_for(lambda: self._subscribers)
+            try:
+                # Read before the rows: a commit landing in between is picked up again next time.
+                current = conn.execute('PRAGMA data_version').fetchone()[0]
+                if self._cursor is None:
+                    cursor, counts, version = latest_cursor(conn), table_counts(conn), current
+                    with self._cond:
+                        self._cursor = cursor
+                        self._cond.notify_all()
+                elif current != version:
+                    version = current
+                    counts = self._publish(conn, counts)
+            except sqlite3.Error:
+                logger.exception('Live update poll failed')
+            time.sleep(self.poll_interval)
+
+    def _publish(self, conn, counts):
+        """Send the rows committed since the last poll to every subscriber; returns the current counts."""
+        batch = new_rows(conn, self._cursor, MAX_QUEUE)
+        if batch is None:
+            self._cursor = latest_cursor(conn)
+            batch = [('reset', dict(self._cursor))]
+        else:
+            for event, row in batch:
+                self._cursor[event] = row['id']
+        latest = table_counts(conn)
+        if latest != counts:
+            batch.append(('counts', latest))
+        if batch:
+            with self._cond:
+                subscribers = list(self._subscribers)
+            for callback in subscribers:
+                callback(batch)
+        return latest
+
+
+def event_stream(hub, path, cursor, max_seconds=None):
+    """Generator of SSE text for one client, starting after `cursor` (or from now if None)."""
+    follower = Follower(cursor)
+    inbox = queue.Queue(maxsize=MAX_QUEUE)
+
+    def deliver(batch):
+        try:
+            inbox.put_nowait(batch)
+        except queue.Full:
+            follower.behind = True
+
+    hub.subscribe(deliver)
+    try:
+        yield f'retry: {RETRY_MS}\n\n'
+        deadline = time.monotonic() + max_seconds if max_seconds else None
+        behind = True
+        while deadline is None or time.monotonic() < deadline:
+            if behind:
+                while not inbox.empty():
+                    inbox.get_nowait()
+                conn = db.connect(path)
+                try:
+                    messages = follower.catch_up(conn)
+                finally:
+                    conn.close()
+            else:
+                wait = min(HEARTBEAT, deadline - time.monotonic()) if deadline else HEARTBEAT
+                try:
+                    messages = follower.accept(inbox.get(timeout=max(wait, 0)))
+                except queue.Empty:
+                    # Keeps proxies from timing out an idle stream and notices a closed socket.
+                    yield ': keepalive\n\n'
+                    continue
+            if messages:
+                yield ''.join(sse_message(*message) for message in messages)
+            behind = follower.behind
+    finally:
+        hub.unsubscribe(deliver)
+
+
+def stream_response(cursor):
+    """The /admin/stream response: an event stream, or 503 when this process has enough of them open."""
+    app = current_app._get_current_object()
+    headers = {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    if request.method == 'HEAD':
+        # No body will be read, so no stream is opened and no slot taken.
+        return app.response_class(mimetype='text/event-stream', headers=headers)
+    hub = app.extensions['live_hub']
+    limiter = app.extensions['live_streams']
+    if not limiter.acquire(blocking=False):
+        response = jsonify({'error': 'Too many live streams; poll with Accept: application/json'})
+        response.status_code = 503
+        response.headers['Retry-After'] = str(app.config['LIVE_POLL_SECONDS'])
+        return response
+    # The generator outlives the request context, so it only gets plain values.
+    body = event_stream(hub, app.config['DATABASE'], cursor, max_seconds=app.config['LIVE_STREAM_SECONDS'])
+    response = app.response_class(body, mimetype='text/event-stream', headers=headers)
+    # The server closes the response however it ends, even a HEAD whose body is never iterated.
+    response.call_on_close(limiter.release)
+    return response
+
+
+def poll(conn, cursor):
+    """JSON body for since-id polling: the same events the stream would send, and the cursor to pass next time."""
+    follower = Follower(cursor)
+    messages = follower.catch_up(conn)
+    return {'events': [{'event': event, 'data': data, 'id': event_id} for event, data, event_id in messages],
+            'cursor': format_cursor(follower.cursor),
+            'poll_seconds': current_app.config['LIVE_POLL_SECONDS']}
+
+
+def init_app(app):
+    app.config.setdefault('LIVE_MAX_STREAMS', 2)
+    app.config.setdefault('LIVE_STREAM_SECONDS', 300)
+    app.config.setdefault('LIVE_POLL_SECONDS', 5)
+    app.extensions['live_hub'] = ChangeHub(app.config['DATABASE'])
+    app.extensions['live_streams'] = threading.BoundedSemaphore(app.config['LIVE_MAX_STREAMS'])
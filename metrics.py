@@ -0,0 +1,275 @@
+"""Request and SQL instrumentation, exposed in Prometheus text format on /metrics.
+
+Every request records its latency and status per endpoint. Request
+connections are TracedConnection instances, which time each statement and
+attribute it to the current request. Requests that are slow, run a slow
+statement, or repeat one statement many times (an N+1 loop) are written
+to the `metrics.slow` logger as one JSON object per line.
+
+The first time a SELECT is seen, its EXPLAIN QUERY PLAN is checked once and
+remembered; statements that scan a whole table without an index are counted
+in sqlite_full_scans_total.
+
+Metrics are kept per process. Under the prefork server, scrape each worker
+or read them as a sample of the whole.
+"""
+import bisect
+import hmac
+import json
+import logging
+import re
+import sqlite3
+import threading
+import time
+from collections import Counter
+
+from flask import Response, current_app, g, has_request_context, request, session
+
+slow_log = logging.getLogger('metrics.slow')
+
+REQUEST_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0)
+COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 500)
+
+# "SCAN events" is a full scan; "SCAN events USING INDEX ..." walks an index.
+_FULL_SCAN = re.compile(r'^SCAN (\w+)$')
+_PLAN_CACHE_SIZE = 2000
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Metrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.started = time.time()
+        self.in_progress = 0
+        self.requests = Counter()          # (endpoint, method, status)
+        self.request_seconds = {}          # (endpoint, method) -> Histogram
+        self.query_seconds = {}            # (endpoint,) -> Histogram, one sample per statement
+        self.queries_per_request = {}      # (endpoint,) -> Histogram
+        self.slow_queries = Counter()      # (endpoint,)
+        self.full_scans = Counter()        # (endpoint, table)
+
+    def _observe(self, table, key, buckets, value):
+        histogram = table.get(key)
+        if histogram is None:
+            histogram = table[key] = Histogram(buckets)
+        histogram.observe(value)
+
+    def request_started(self):
+        with self._lock:
+            self.in_progress += 1
+
+    def record_request(self, endpoint, method, status, seconds, trace):
+        with self._lock:
+            self.in_progress -= 1
+            self.requests[(endpoint, method, str(status))] += 1
+            self._observe(self.request_seconds, (endpoint, method), REQUEST_BUCKETS, seconds)
+            self._observe(self.queries_per_request, (endpoint,), COUNT_BUCKETS, trace.count)
+            for duration in trace.durations:
+                self._observe(self.query_seconds, (endpoint,), QUERY_BUCKETS, duration)
+            if trace.slow:
+                self.slow_queries[(endpoint,)] += len(trace.slow)
+            for table in trace.full_scans:
+                self.full_scans[(endpoint, table)] += 1
+
+    def render(self):
+        lines = []
+
+        def header(name, kind, text):
+            lines.append(f'# HELP {name} {text}')
+            lines.append(f'# TYPE {name} {kind}')
+
+        def labels(names, values, extra=''):
+            pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+            if extra:
+                pairs.append(extra)
+            return '{' + ','.join(pairs) + '}' if pairs else ''
+
+        def histograms(name, text, label_names, table):
+            header(name, 'histogram', text)
+            for key, histogram in sorted(table.items()):
+                cumulative = 0
+                for bound, count in zip(histogram.buckets, histogram.counts):
+                    cumulative += count
+                    le = 'le="%s"' % bound
+                    lines.append(f'{name}_bucket{labels(label_names, key, le)} {cumulative}')
+                le = 'le="+Inf"'
+                lines.append(f'{name}_bucket{labels(label_names, key, le)} {histogram.count}')
+                lines.append(f'{name}_sum{labels(label_names, key)} {histogram.sum:.6f}')
+                lines.append(f'{name}_count{labels(label_names, key)} {histogram.count}')
+
+        def counters(name, text, label_names, table):
+            header(name, 'counter', text)
+            for key, value in sorted(table.items()):
+                lines.append(f'{name}{labels(label_names, key)} {value}')
+
+        with self._lock:
+            header('process_start_time_seconds', 'gauge', 'Start time of this worker process.')
+            lines.append(f'process_start_time_seconds {self.started:.0f}')
+            header('http_requests_in_progress', 'gauge', 'Requests currently being handled by this process.')
+            lines.append(f'http_requests_in_progress {self.in_progress}')
+            counters('http_requests_total', 'Requests by endpoint, method and status.',
+                     ('endpoint', 'method', 'status'), self.requests)
+            histograms('http_request_duration_seconds', 'Time to build the response (streamed bodies excluded).',
+                       ('endpoint', 'method'), self.request_seconds)
+            histograms('sqlite_query_duration_seconds', 'Time to execute each SQL statement (to its first row).',
+                       ('endpoint',), self.query_seconds)
+            histograms('sqlite_queries_per_request', 'SQL statements run by one request.',
+                       ('endpoint',), self.queries_per_request)
+            counters('sqlite_slow_queries_total', 'Statements slower than SLOW_QUERY_MS.',
+                     ('endpoint',), self.slow_queries)
+            counters('sqlite_full_scans_total', 'Statements whose plan scans a whole table without an index.',
+                     ('endpoint', 'table'), self.full_scans)
+        return '\n'.join(lines) + '\n'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class RequestTrace:
+    """SQL activity of one request."""
+
+    def __init__(self, slow_seconds):
+        self.slow_seconds = slow_seconds
+        self.count = 0
+        self.durations = []
+        self.statements = Counter()
+        self.slow = []
+        self.full_scans = []
+
+    def add(self, sql, seconds, full_scans):
+        self.count += 1
+        self.durations.append(seconds)
+        self.statements[sql] += 1
+        if seconds >= self.slow_seconds:
+            self.slow.append({'sql': ' '.join(sql.split()), 'ms': round(seconds * 1000, 2)})
+        self.full_scans.extend(full_scans)
+
+
+_plans = {}
+_plans_lock = threading.Lock()
+
+
+class TracedConnection(sqlite3.Connection):
+    """sqlite3 connection that times each statement for the request using it.
+
+    Outside a request (worker threads, CLI commands) it behaves exactly like
+    a plain connection.
+    """
+
+    def execute(self, sql, parameters=()):
+        started = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            self._trace(sql, parameters, time.perf_counter() - started)
+
+    def executemany(self, sql, seq_of_parameters):
+        started = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            self._trace(sql, None, time.perf_counter() - started)
+
+    def commit(self):
+        started = time.perf_counter()
+        try:
+            return super().commit()
+        finally:
+            self._trace('COMMIT', None, time.perf_counter() - started)
+
+    def _trace(self, sql, parameters, seconds):
+        trace = g.get('sql_trace') if has_request_context() else None
+        if trace is None:
+            return
+        full_scans = self._full_scans(sql, parameters) if parameters is not None else ()
+        trace.add(sql, seconds, full_scans)
+
+    def _full_scans(self, sql, parameters):
+        """Tables the statement scans without an index, from a cached EXPLAIN QUERY PLAN."""
+        scans = _plans.get(sql)
+        if scans is not None:
+            return scans
+        if not sql.lstrip()[:6].upper() == 'SELECT' or len(_plans) >= _PLAN_CACHE_SIZE:
+            return ()
+        try:
+            plan = sqlite3.Connection.execute(self, 'EXPLAIN QUERY PLAN ' + sql, parameters).fetchall()
+            scans = tuple(m.group(1) for m in (_FULL_SCAN.match(row[-1]) for row in plan) if m)
+        except sqlite3.Error:
+            scans = ()
+        with _plans_lock:
+            _plans[sql] = scans
+        return scans
+
+
+def _before_request():
+    g.metrics_started = time.perf_counter()
+    g.sql_trace = RequestTrace(current_app.config['SLOW_QUERY_MS'] / 1000)
+    current_app.extensions['metrics'].request_started()
+
+
+def _after_request(response):
+    g.metrics_status = response.status_code
+    return response
+
+
+def _teardown_request(exc=None):
+    started = g.pop('metrics_started', None)
+    if started is None:
+        return
+    seconds = time.perf_counter() - started
+    trace = g.pop('sql_trace')
+    status = g.pop('metrics_status', 500)
+    endpoint = request.endpoint or 'unmatched'
+    current_app.extensions['metrics'].record_request(endpoint, request.method, status, seconds, trace)
+
+    config = current_app.config
+    repeated = {' '.join(sql.split()): n for sql, n in trace.statements.items()
+                if n >= config['N_PLUS_ONE_THRESHOLD']}
+    if seconds * 1000 >= config['SLOW_REQUEST_MS'] or trace.slow or repeated:
+        slow_log.warning(json.dumps({
+            'endpoint': endpoint, 'method': request.method, 'path': request.full_path.rstrip('?'),
+            'status': status, 'ms': round(seconds * 1000, 2), 'queries': trace.count,
+            'sql_ms': round(sum(trace.durations) * 1000, 2), 'slow_queries': trace.slow,
+            'repeated': repeated, 'full_scans': sorted(set(trace.full_scans)),
+        }))
+
+
+def metrics_view():
+    token = current_app.config['METRICS_TOKEN']
+    authorized = session.get('admin') or (
+        token and hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'))
+    if not authorized:
+        return "Unauthorized", 403
+    return Response(current_app.extensions['metrics'].render(), mimetype='text/plain; version=0.0.4')
+
+
+def init_app(app):
+    app.config.setdefault('METRICS_ENABLED', True)
+    # Lets a Prometheus scraper read /metrics with "Authorization: Bearer <token>" instead of a session.
+    app.config.setdefault('METRICS_TOKEN', None)
+    app.config.setdefault('SLOW_QUERY_MS', 100)
+    app.config.setdefault('SLOW_REQUEST_MS', 500)
+    # The same statement this many times in one request is logged as a likely N+1 loop.
+    app.config.setdefault('N_PLUS_ONE_THRESHOLD', 10)
+    if not app.config['METRICS_ENABLED']:
+        return
+    app.extensions['metrics'] = Metrics()
+    app.config['DB_CONNECTION_FACTORY'] = TracedConnection
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+    app.teardown_request(_teardown_request)
+    app.add_url_rule('/metrics', 'metrics', metrics_view)
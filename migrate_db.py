@@ -1,22 +1,12 @@
-import sqlite3
 import os
 
+import migrations
+
 DB_PATH = os.path.join(os.getcwd(), 'database.db')
 
 def migrate_db():
-    conn = sqlite3.connect(DB_PATH)
-    try:
-        print("Attempting to add 'participation_type' column...")
-        conn.execute('ALTER TABLE hackathon_registrations ADD COLUMN participation_type TEXT DEFAULT "Solo"')
-        conn.commit()
-        print("Column added successfully.")
-    except sqlite3.OperationalError as e:
-        if "duplicate column" in str(e):
-            print("Column 'participation_type' already exists.")
-        else:
-            print(f"Error: {e}")
-    finally:
-        conn.close()
+    # 'participation_type' is now added by migration 2 in migrations.py.
+    migrations.run(DB_PATH)
 
 if __name__ == '__main__':
     migrate_db()
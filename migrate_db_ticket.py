@@ -1,22 +1,12 @@
-import sqlite3
 import os
 
+import migrations
+
 DB_PATH = os.path.join(os.getcwd(), 'database.db')
 
 def migrate_db():
-    conn = sqlite3.connect(DB_PATH)
-    try:
-        print("Attempting to add 'ticket_id' column...")
-        conn.execute('ALTER TABLE hackathon_registrations ADD COLUMN ticket_id TEXT')
-        conn.commit()
-        print("Column added successfully.")
-    except sqlite3.OperationalError as e:
-        if "duplicate column" in str(e):
-            print("Column 'ticket_id' already exists.")
-        else:
-            print(f"Error: {e}")
-    finally:
-        conn.close()
+    # 'ticket_id' (with its unique index) is now added by migration 2 in migrations.py.
+    migrations.run(DB_PATH)
 
 if __name__ == '__main__':
     migrate_db()
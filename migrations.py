@@ -0,0 +1,471 @@
+"""Versioned schema migrations.
+
+The schema version lives in SQLite's user_version header field. Each
+migration runs in its own BEGIN IMMEDIATE transaction together with the
+user_version bump, so a failed migration leaves the database at the last
+good version, and several workers starting at once apply each step only
+once. Migrations are append-only: never edit one that has shipped, add a
+new one instead.
+
+    python migrations.py             # apply pending migrations
+    python migrations.py --dry-run   # print the SQL that would run, change nothing
+    python migrations.py --check     # verify list queries are index-backed
+"""
+import argparse
+import os
+import sqlite3
+import sys
+from urllib.parse import quote
+
+import click
+
+import cache
+import db
+import registrations
+import search
+import upload_gc
+
+MIGRATIONS = []
+
+
+def migration(version, description):
+    def decorator(apply):
+        MIGRATIONS.append((version, description, apply))
+        MIGRATIONS.sort(key=lambda m: m[0])
+        return apply
+    return decorator
+
+
+def add_column(conn, table, column, definition):
+    """ALTER TABLE ... ADD COLUMN, skipped when an older script already added it."""
+    columns = {row[1] for row in conn.execute(f'PRAGMA table_info({table})')}
+    if column not in columns:
+        conn.execute(f'ALTER TABLE {table} ADD COLUMN {column} {definition}')
+
+
+@migration(1, 'base tables')
+def base_tables(conn):
+    # IF NOT EXISTS: databases created by setup_database.py/fix_db.py predate user_version.
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT UNIQUE NOT NULL,
+            password TEXT NOT NULL
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS events (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            title TEXT NOT NULL,
+            description TEXT,
+            event_date TEXT NOT NULL,
+            event_manager TEXT,
+            contact_number TEXT,
+            image_file TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS gallery (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            image_file TEXT NOT NULL,
+            caption TEXT,
+            upload_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS materials (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            title TEXT NOT NULL,
+            subject TEXT NOT NULL,
+            target_year TEXT NOT NULL,
+            semester INTEGER NOT NULL,
+            file_link TEXT NOT NULL,
+            upload_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS activity_logs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            action TEXT NOT NULL,
+            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS feedback (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            message TEXT NOT NULL,
+            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS event_registrations (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            event_id INTEGER NOT NULL,
+            name TEXT NOT NULL,
+            dept_no TEXT NOT NULL,
+            class_section TEXT NOT NULL,
+            phone TEXT,
+            registration_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (event_id) REFERENCES events (id)
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS hackathon_registrations (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            full_name TEXT NOT NULL,
+            email TEXT NOT NULL,
+            phone_number TEXT NOT NULL,
+            college_name TEXT NOT NULL,
+            payment_proof TEXT NOT NULL,
+            participation_type TEXT DEFAULT 'Solo',
+            registration_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            ticket_id TEXT,
+            idempotency_key TEXT
+        )
+    ''')
+
+
+@migration(2, 'hackathon registration columns and unique tickets')
+def registration_columns(conn):
+    # Older databases got these from migrate_db.py / migrate_db_ticket.py, or not at all.
+    add_column(conn, 'hackathon_registrations', 'participation_type', "TEXT DEFAULT 'Solo'")
+    add_column(conn, 'hackathon_registrations', 'ticket_id', 'TEXT')
+    add_column(conn, 'hackathon_registrations', 'idempotency_key', 'TEXT')
+    registrations.reissue_duplicate_tickets(conn)
+    conn.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_hackathon_ticket_id ON hackathon_registrations (ticket_id)')
+    conn.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_hackathon_idempotency_key '
+                 'ON hackathon_registrations (idempotency_key)')
+
+
+# Lists are read newest-first by (date column, id), one page at a time;
+# the rest back the lookups named next to them.
+INDEXES = {
+    'idx_activity_logs_timestamp': ('activity_logs', 'timestamp, id'),
+    'idx_events_event_date': ('events', 'event_date, id'),
+    'idx_gallery_upload_date': ('gallery', 'upload_date, id'),
+    'idx_materials_upload_date': ('materials', 'upload_date, id'),
+    'idx_feedback_timestamp': ('feedback', 'timestamp, id'),
+    'idx_hackathon_registration_date': ('hackathon_registrations', 'registration_date, id'),
+    # Materials page filtered by year.
+    'idx_materials_year_upload_date': ('materials', 'target_year, upload_date, id'),
+    # Whether another registration shares a (deduplicated) proof file.
+    'idx_hackathon_payment_proof': ('hackathon_registrations', 'payment_proof'),
+    # Deleting an event deletes its registrations.
+    'idx_event_registrations_event_id': ('event_registrations', 'event_id'),
+}
+
+
+@migration(3, 'list and lookup indexes')
+def list_indexes(conn):
+    for name, (table, columns) in INDEXES.items():
+        conn.execute(f'CREATE INDEX IF NOT EXISTS {name} ON {table} ({columns})')
+
+
+# Row counts shown on the dashboard, kept current by triggers so the
+# dashboard never has to COUNT(*) a whole table.
+COUNTED_TABLES = ('events', 'gallery', 'materials', 'feedback', 'hackathon_registrations')
+
+
+@migration(4, 'trigger-maintained table_counts')
+def table_counts(conn):
+    conn.execute('CREATE TABLE IF NOT EXISTS table_counts (table_name TEXT PRIMARY KEY, row_count INTEGER NOT NULL)')
+    for table in COUNTED_TABLES:
+        conn.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_{table}_count_insert AFTER INSERT ON {table}
+            BEGIN UPDATE table_counts SET row_count = row_count + 1 WHERE table_name = '{table}'; END
+        ''')
+        conn.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_{table}_count_delete AFTER DELETE ON {table}
+            BEGIN UPDATE table_counts SET row_count = row_count - 1 WHERE table_name = '{table}'; END
+        ''')
+        conn.execute(f'INSERT OR IGNORE INTO table_counts (table_name, row_count) SELECT ?, COUNT(*) FROM {table}',
+                     (table,))
+
+
+@migration(5, 'page cache versions')
+def cache_versions(conn):
+    cache.init_schema(conn)
+
+
+@migration(6, 'full-text search index')
+def search_index(conn):
+    search.init_schema(conn)
+
+
+# The admin registrations list: one index per sort column, and one per
+# equality filter that keeps the default newest-first order.
+REGISTRATION_INDEXES = {
+    'idx_hackathon_full_name': ('hackathon_registrations', 'full_name, id'),
+    'idx_hackathon_college_date': ('hackathon_registrations', 'college_name, registration_date, id'),
+    'idx_hackathon_type_date': ('hackathon_registrations', 'participation_type, registration_date, id'),
+}
+
+
+@migration(7, 'registration list sort and filter indexes')
+def registration_indexes(conn):
+    for name, (table, columns) in REGISTRATION_INDEXES.items():
+        conn.execute(f'CREATE INDEX IF NOT EXISTS {name} ON {table} ({columns})')
+
+
+# Whether an uploaded file is still referenced (upload GC, bulk deletes).
+UPLOAD_INDEXES = {
+    'idx_gallery_image_file': ('gallery', 'image_file'),
+    'idx_events_image_file': ('events', 'image_file'),
+}
+
+
+@migration(8, 'upload garbage collection')
+def upload_gc_schema(conn):
+    for name, (table, columns) in UPLOAD_INDEXES.items():
+        conn.execute(f'CREATE INDEX IF NOT EXISTS {name} ON {table} ({columns})')
+    upload_gc.init_schema(conn)
+
+
+# One row per (event, college, participation type). Summing it gives an
+# event's total, its solo/team split or its colleges without touching
+# hackathon_registrations. Rows that reach zero are kept; they cost nothing.
+_STATS_ADD = '''
+    INSERT OR IGNORE INTO event_registration_stats (event_id, college_name, participation_type, registrations)
+    VALUES ({row}.event_id, {row}.college_name, COALESCE({row}.participation_type, ''), 0);
+    UPDATE event_registration_stats SET registrations = registrations + 1
+    WHERE event_id = {row}.event_id AND college_name = {row}.college_name
+      AND participation_type = COALESCE({row}.participation_type, '');
+'''
+_STATS_REMOVE = '''
+    UPDATE event_registration_stats SET registrations = registrations - 1
+    WHERE event_id = {row}.event_id AND college_name = {row}.college_name
+      AND participation_type = COALESCE({row}.participation_type, '');
+'''
+
+
+@migration(9, 'per-event registrations and trigger-maintained event stats')
+def per_event_registrations(conn):
+    add_column(conn, 'hackathon_registrations', 'event_id', 'INTEGER REFERENCES events (id)')
+    # Existing registrations were made before they recorded an event. Only when
+    # there is a single event is it certainly theirs; otherwise they are left
+    # NULL rather than guessed from dates. They still appear on the
+    # all-registrations page, just under no event.
+    conn.execute('''
+        UPDATE hackathon_registrations SET event_id = (SELECT MIN(id) FROM events)
+        WHERE event_id IS NULL AND (SELECT COUNT(*) FROM events) = 1
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_hackathon_event_date '
+                 'ON hackathon_registrations (event_id, registration_date, id)')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS event_registration_stats (
+            event_id INTEGER NOT NULL,
+            college_name TEXT NOT NULL,
+            participation_type TEXT NOT NULL,
+            registrations INTEGER NOT NULL,
+            PRIMARY KEY (event_id, college_name, participation_type)
+        ) WITHOUT ROWID
+    ''')
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_event_stats_insert AFTER INSERT ON hackathon_registrations
+        WHEN new.event_id IS NOT NULL
+        BEGIN {_STATS_ADD.format(row='new')} END
+    ''')
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_event_stats_delete AFTER DELETE ON hackathon_registrations
+        WHEN old.event_id IS NOT NULL
+        BEGIN {_STATS_REMOVE.format(row='old')} END
+    ''')
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_event_stats_update_old
+        AFTER UPDATE OF event_id, college_name, participation_type ON hackathon_registrations
+        WHEN old.event_id IS NOT NULL
+        BEGIN {_STATS_REMOVE.format(row='old')} END
+    ''')
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_event_stats_update_new
+        AFTER UPDATE OF event_id, college_name, participation_type ON hackathon_registrations
+        WHEN new.event_id IS NOT NULL
+        BEGIN {_STATS_ADD.format(row='new')} END
+    ''')
+    conn.execute('DELETE FROM event_registration_stats')
+    conn.execute('''
+        INSERT INTO event_registration_stats (event_id, college_name, participation_type, registrations)
+        SELECT event_id, college_name, COALESCE(participation_type, ''), COUNT(*)
+        FROM hackathon_registrations WHERE event_id IS NOT NULL
+        GROUP BY event_id, college_name, COALESCE(participation_type, '')
+    ''')
+
+
+def current_version(conn):
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+
+def latest_version():
+    return MIGRATIONS[-1][0] if MIGRATIONS else 0
+
+
+def pending(conn):
+    version = current_version(conn)
+    return [m for m in MIGRATIONS if m[0] > version]
+
+
+def migrate(conn, dry_run=False, echo=None):
+    """Apply pending migrations in order and return the (version, description) pairs applied.
+
+    A dry run applies every pending migration inside one transaction (later
+    steps can depend on earlier ones), reports the SQL through `echo`, and
+    rolls it all back.
+    """
+    applied = []
+    if echo:
+        conn.set_trace_callback(echo)
+    try:
+        if dry_run:
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                for version, description, apply in pending(conn):
+                    apply(conn)
+                    applied.append((version, description))
+            finally:
+                conn.rollback()
+            return applied
+
+        for version, description, apply in MIGRATIONS:
+            if version <= current_version(conn):
+                continue
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                # Another process may have applied it while we waited for the lock.
+                if version <= current_version(conn):
+                    conn.rollback()
+                    continue
+                apply(conn)
+                conn.execute(f'PRAGMA user_version = {int(version)}')
+                conn.commit()
+            except BaseException:
+                conn.rollback()
+                raise
+            applied.append((version, description))
+    finally:
+        if echo:
+            conn.set_trace_callback(None)
+    return applied
+
+
+# (description, query, index the plan must use). Each query must be answered
+# from the index without a temporary sort.
+QUERY_PLAN_CHECKS = (
+    ('events newest first', 'SELECT * FROM events ORDER BY event_date DESC, id DESC LIMIT 20',
+     'idx_events_event_date'),
+    ('gallery newest first', 'SELECT * FROM gallery ORDER BY upload_date DESC, id DESC LIMIT 20',
+     'idx_gallery_upload_date'),
+    ('materials newest first', 'SELECT * FROM materials ORDER BY upload_date DESC, id DESC LIMIT 20',
+     'idx_materials_upload_date'),
+    ('materials for one year',
+     "SELECT * FROM materials WHERE target_year = '1st Year' ORDER BY upload_date DESC, id DESC LIMIT 20",
+     'idx_materials_year_upload_date'),
+    ('feedback inbox', 'SELECT * FROM feedback ORDER BY timestamp DESC, id DESC LIMIT 20',
+     'idx_feedback_timestamp'),
+    ('activity log page', 'SELECT id, action, timestamp FROM activity_logs ORDER BY timestamp DESC, id DESC LIMIT 50',
+     'idx_activity_logs_timestamp'),
+    ('log archiving', "SELECT id FROM activity_logs WHERE timestamp < '2000-01-01' ORDER BY timestamp LIMIT 1000",
+     'idx_activity_logs_timestamp'),
+    ('registrations newest first',
+     'SELECT * FROM hackathon_registrations ORDER BY registration_date DESC, id DESC LIMIT 50',
+     'idx_hackathon_registration_date'),
+    ('registrations by name',
+     'SELECT * FROM hackathon_registrations ORDER BY full_name, id LIMIT 50',
+     'idx_hackathon_full_name'),
+    ('registrations from one college',
+     "SELECT * FROM hackathon_registrations WHERE college_name = 'x' ORDER BY registration_date DESC, id DESC LIMIT 50",
+     'idx_hackathon_college_date'),
+    ('registrations of one type',
+     "SELECT * FROM hackathon_registrations WHERE participation_type = 'Team' "
+     "ORDER BY registration_date DESC, id DESC LIMIT 50",
+     'idx_hackathon_type_date'),
+    ('ticket prefix search',
+     "SELECT * FROM hackathon_registrations WHERE ticket_id >= 'HT-12' AND ticket_id < 'HT-13'",
+     'idx_hackathon_ticket_id'),
+    ('shared proof lookup', "SELECT 1 FROM hackathon_registrations WHERE payment_proof = 'x' LIMIT 1",
+     'idx_hackathon_payment_proof'),
+    ('idempotent resubmit', "SELECT id FROM hackathon_registrations WHERE idempotency_key = 'x'",
+     'idx_hackathon_idempotency_key'),
+    ('event registrations', 'SELECT id FROM event_registrations WHERE event_id = 1',
+     'idx_event_registrations_event_id'),
+    ("one event's registrations",
+     'SELECT * FROM hackathon_registrations WHERE event_id = 1 ORDER BY registration_date DESC, id DESC LIMIT 50',
+     'idx_hackathon_event_date'),
+    ('event registration counts', 'SELECT SUM(registrations) FROM event_registration_stats WHERE event_id = 1',
+     'PRIMARY KEY'),
+    ('gallery photo still used', "SELECT 1 FROM gallery WHERE image_file = 'x' LIMIT 1",
+     'idx_gallery_image_file'),
+    ('variant source still used', "SELECT 1 FROM events WHERE image_file >= 'x.' AND image_file < 'x/' LIMIT 1",
+     'idx_events_image_file'),
+)
+
+
+def check_query_plans(conn):
+    """Run EXPLAIN QUERY PLAN for every check and return a list of problems (empty when all pass)."""
+    problems = []
+    for description, sql, index in QUERY_PLAN_CHECKS:
+        plan = ' | '.join(row[-1] for row in conn.execute('EXPLAIN QUERY PLAN ' + sql))
+        if index not in plan:
+            problems.append(f'{description}: expected {index}, got: {plan}')
+        elif 'USE TEMP B-TREE' in plan:
+            problems.append(f'{description}: sorts in a temp b-tree: {plan}')
+    return problems
+
+
+def dry_run_copy(db_path):
+    """In-memory copy of the database, read through a read-only connection.
+
+    db.connect() would switch the file to WAL (journal_mode is stored in the
+    file), so a dry run must not use it; the copy takes the SQL instead.
+    """
+    source = sqlite3.connect(f'file:{quote(os.path.abspath(db_path))}?mode=ro', uri=True)
+    conn = sqlite3.connect(':memory:')
+    conn.row_factory = sqlite3.Row
+    try:
+        source.backup(conn)
+    finally:
+        source.close()
+    return conn
+
+
+def run(db_path, dry_run=False, check=False):
+    """Shared entry point for the CLI, `flask db-migrate` and the legacy setup scripts."""
+    conn = dry_run_copy(db_path) if dry_run else db.connect(db_path)
+    try:
+        before = current_version(conn)
+        print(f"Database: {db_path} (schema version {before}, latest {latest_version()})")
+        applied = migrate(conn, dry_run=dry_run, echo=(lambda sql: print(f"    {sql.strip()}")) if dry_run else None)
+        for version, description in applied:
+            print(f"{'Would apply' if dry_run else 'Applied'} {version}: {description}")
+        if not applied:
+            print("Schema is up to date.")
+        ok = True
+        if check and not dry_run:
+            problems = check_query_plans(conn)
+            for problem in problems:
+                print(f"Query plan check failed - {problem}")
+            if not problems:
+                print(f"All {len(QUERY_PLAN_CHECKS)} query plan checks use their index.")
+            ok = not problems
+        return ok
+    finally:
+        conn.close()
+
+
+def init_app(app):
+    @app.cli.command('db-migrate')
+    @click.option('--dry-run', is_flag=True, help='Print the SQL that would run and roll it back.')
+    @click.option('--check/--no-check', default=True, help='Verify list queries against EXPLAIN QUERY PLAN.')
+    def db_migrate_command(dry_run, check):
+        """Apply pending schema migrations."""
+        if not run(app.config['DATABASE'], dry_run=dry_run, check=check):
+            raise click.ClickException('Some queries are not index-backed.')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--db', default=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'database.db'))
+    parser.add_argument('--dry-run', action='store_true', help='print the SQL that would run and roll it back')
+    parser.add_argument('--check', action='store_true', help='verify list queries are index-backed')
+    args = parser.parse_args()
+    sys.exit(0 if run(args.db, dry_run=args.dry_run, check=args.check) else 1)
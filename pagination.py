@@ -0,0 +1,79 @@
+"""Keyset (cursor) pagination shared by the admin list pages and JSON endpoints.
+
+A cursor is the sort value and id of the last row on the previous page, so
+the next page is a range scan on a (sort_column, id) index instead of an
+OFFSET that has to walk every skipped row.
+
+NULL sort values are legal (upload_date and registration_date have no NOT
+NULL). SQLite sorts them before every value, so they end a descending list
+and start an ascending one; a row-value comparison against NULL is never
+true, so the rows on either side of that boundary are read by separate
+range scans, each still on the index.
+"""
+
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 100
+
+
+def encode_cursor(sort_value, row_id):
+    # A NULL sort value is the bare id, so it cannot be mistaken for the string "None" or "".
+    if sort_value is None:
+        return str(row_id)
+    return f"{sort_value}|{row_id}"
+
+
+def decode_cursor(cursor):
+    try:
+        if '|' not in cursor:
+            return None, int(cursor)
+        sort_value, row_id = cursor.rsplit('|', 1)
+        return sort_value, int(row_id)
+    except (TypeError, ValueError):
+        return None
+
+
+def _ranges_after(sort_column, position, descending):
+    """[(condition, params)] covering every row after `position`, in page order."""
+    sort_value, row_id = position
+    after = '<' if descending else '>'
+    if sort_value is None:
+        ranges = [(f'{sort_column} IS NULL AND id {after} ?', [row_id])]
+        return ranges if descending else ranges + [(f'{sort_column} IS NOT NULL', [])]
+    ranges = [(f'({sort_column}, id) {after} (?, ?)', [sort_value, row_id])]
+    return ranges + [(f'{sort_column} IS NULL', [])] if descending else ranges
+
+
+def clamp_limit(value, default=DEFAULT_LIMIT, maximum=MAX_LIMIT):
+    try:
+        return max(1, min(int(value), maximum))
+    except (TypeError, ValueError):
+        return default
+
+
+def fetch_page(conn, table, columns, sort_column, cursor=None, limit=DEFAULT_LIMIT,
+               where=(), params=(), descending=True):
+    """Return (rows, next_cursor) for one page of `table` ordered by sort_column, id.
+
+    `table`, `columns` and `sort_column` come from code, never from the request.
+    Extra filters are passed as SQL fragments in `where` with their `params`.
+    """
+    position = decode_cursor(cursor) if cursor else None
+    ranges = _ranges_after(sort_column, position, descending) if position else [(None, [])]
+
+    order = 'DESC' if descending else 'ASC'
+    rows = []
+    # The NULL range is only read when the page runs past the end of the values (or the other way round).
+    for condition, range_params in ranges:
+        conditions = list(where) + ([condition] if condition else [])
+        sql = f'SELECT {columns} FROM {table}'
+        if conditions:
+            sql += ' WHERE ' + ' AND '.join(conditions)
+        sql += f' ORDER BY {sort_column} {order}, id {order} LIMIT ?'
+        rows += conn.execute(sql, [*params, *range_params, limit + 1 - len(rows)]).fetchall()
+        if len(rows) > limit:
+            break
+    next_cursor = None
+    if len(rows) > limit:
+        last = rows[limit - 1]
+        next_cursor = encode_cursor(last[sort_column], last['id'])
+    return rows[:limit], next_cursor
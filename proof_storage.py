@@ -0,0 +1,298 @@
+"""Content-addressed storage for hackathon payment proofs.
+
+Uploads are streamed to a temp file in chunks while being hashed and
+size-checked, then moved to <root>/<aa>/<bb>/<sha256>.<ext>. Uploading the
+same screenshot again reuses the stored file. Decoding, verification and
+normalization of the image happen later on a small worker pool, which also
+writes a small JPEG review thumbnail to <root>/thumbs/.
+
+send_proof() serves a stored file to an admin. The login check always runs
+in Flask; with PROOF_SENDFILE set, the bytes are then sent by the front
+server instead of a Python worker:
+
+    PROOF_SENDFILE = 'x-accel'      # nginx, with PROOF_ACCEL_PREFIX pointing at:
+        location /_protected/payment_proofs/ {
+            internal;
+            alias /path/to/static/uploads/payment_proofs/;
+        }
+    PROOF_SENDFILE = 'x-sendfile'   # Apache mod_xsendfile, lighttpd
+
+Either way ETag, Last-Modified and Range requests are handled; without it
+werkzeug answers them itself. The proofs live under static/, so direct
+/static/ URLs to them are refused; a front server that serves /static/
+itself must deny that path too.
+"""
+import hashlib
+import logging
+import mimetypes
+import os
+import posixpath
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import abort, current_app, redirect, request, url_for
+from werkzeug.utils import send_file
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Pillow is optional; proofs are then stored untouched.
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 64 * 1024
+THUMB_FOLDER = 'thumbs'
+THUMB_SIZE = 320
+SENDFILE_MODES = (None, 'x-accel', 'x-sendfile')
+
+
+class ProofRejected(Exception):
+    """The upload is too large or is not an image; the message is shown to the student."""
+
+
+def sniff_image_type(head):
+    """Return the file extension for the image format in the first bytes, or None."""
+    if head.startswith(b'\xff\xd8\xff'):
+        return 'jpg'
+    if head.startswith(b'\x89PNG\r\n\x1a\n'):
+        return 'png'
+    if head[:6] in (b'GIF87a', b'GIF89a'):
+        return 'gif'
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return 'webp'
+    if head[4:8] == b'ftyp' and head[8:12] in (b'heic', b'heix', b'mif1', b'msf1'):
+        return 'heic'
+    return None
+
+
+def shard_path(digest, ext):
+    # Stored in the database and used in URLs, so always '/'-separated.
+    return f"{digest[:2]}/{digest[2:4]}/{digest}.{ext}"
+
+
+def thumbnail_path(relative_path):
+    """Relative path of the review thumbnail for a stored proof."""
+    return f"{THUMB_FOLDER}/{os.path.splitext(relative_path)[0]}.jpg"
+
+
+class ProofStore:
+    def __init__(self, root, max_bytes=5 * 1024 * 1024, workers=2, max_dimension=2000):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.workers = workers
+        self.max_dimension = max_dimension
+        self._lock = threading.Lock()
+        self._executor = None
+        self._pid = None
+
+    def save(self, file_storage):
+        """Store an upload and return (relative path, created).
+
+        `created` is False when an identical file was already stored, so the
+        caller knows not to delete it if its own database write fails.
+        """
+        stream = file_storage.stream
+        head = stream.read(CHUNK_SIZE)
+        ext = sniff_image_type(head)
+        if ext is None:
+            raise ProofRejected('Payment proof must be an image (JPG, PNG, GIF, WEBP or HEIC).')
+
+        tmp_dir = os.path.join(self.root, 'tmp')
+        os.makedirs(tmp_dir, exist_ok=True)
+        digest = hashlib.sha256()
+        size = 0
+        fd, tmp_path = tempfile.mkstemp(dir=tmp_dir, suffix='.part')
+        try:
+            with os.fdopen(fd, 'wb') as out:
+                chunk = head
+                while chunk:
+                    size += len(chunk)
+                    if size > self.max_bytes:
+                        raise ProofRejected(f'Payment proof must be smaller than {self.max_bytes // (1024 * 1024)} MB.')
+                    digest.update(chunk)
+                    out.write(chunk)
+                    chunk = stream.read(CHUNK_SIZE)
+
+            relative_path = shard_path(digest.hexdigest(), ext)
+            final_path = os.path.join(self.root, relative_path)
+            if os.path.exists(final_path):
+                os.remove(tmp_path)
+                # A fresh mtime keeps the upload garbage collector's grace period from covering a reused file.
+                os.utime(final_path)
+                return relative_path, False
+            os.makedirs(os.path.dirname(final_path), exist_ok=True)
+            os.replace(tmp_path, final_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+        self._submit(relative_path)
+        return relative_path, True
+
+    def delete(self, relative_path):
+        for path in (self.path_for(relative_path), self.path_for(thumbnail_path(relative_path))):
+            if path and os.path.exists(path):
+                os.remove(path)
+
+    def path_for(self, relative_path):
+        """Absolute path for a stored proof, or None if it would escape the root."""
+        path = os.path.realpath(os.path.join(self.root, relative_path))
+        if not path.startswith(os.path.realpath(self.root) + os.sep):
+            return None
+        return path
+
+    def _submit(self, relative_path):
+        if Image is None:
+            return None
+        # Worker threads do not survive fork(), so each process gets its own pool.
+        with self._lock:
+            if self._executor is None or self._pid != os.getpid():
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='proof-normalize')
+                self._pid = os.getpid()
+        return self._executor.submit(self._normalize_logged, relative_path)
+
+    def _normalize_logged(self, relative_path):
+        try:
+            self.normalize(relative_path)
+            self.thumbnail(relative_path)
+        except Exception:
+            logger.exception('Could not normalize payment proof %s', relative_path)
+
+    def normalize(self, relative_path):
+        """Fully decode the image, fix its orientation, strip metadata and cap its size.
+
+        The file keeps its name (the hash of what the student uploaded), so a
+        later identical upload still dedupes onto it.
+        """
+        path = self.path_for(relative_path)
+        if path is None or not path.endswith(('.jpg', '.png', '.webp')):
+            return
+        try:
+            with Image.open(path) as probe:
+                probe.verify()
+        except FileNotFoundError:
+            # The registration failed or was a duplicate and its file was already removed.
+            return
+        except Exception:
+            logger.warning('Payment proof %s is not a readable image', relative_path)
+            return
+
+        with Image.open(path) as source:
+            image = ImageOps.exif_transpose(source)
+            image.thumbnail((self.max_dimension, self.max_dimension))
+            fmt = source.format
+            if fmt == 'JPEG' and image.mode not in ('RGB', 'L'):
+                image = image.convert('RGB')
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.part"
+            options = {'quality': 85, 'optimize': True} if fmt in ('JPEG', 'WEBP') else {'optimize': True}
+            image.save(tmp_path, fmt, **options)
+        os.replace(tmp_path, path)
+        # A thumbnail made from the upload before normalization may be rotated wrongly.
+        thumb = self.path_for(thumbnail_path(relative_path))
+        if thumb and os.path.exists(thumb):
+            os.remove(thumb)
+
+    def thumbnail(self, relative_path):
+        """Relative path of the proof's review thumbnail, made on first use.
+
+        Returns None if it cannot be made (no Pillow, HEIC, a broken file);
+        callers then fall back to the full image.
+        """
+        relative_thumb = thumbnail_path(relative_path)
+        thumb = self.path_for(relative_thumb)
+        path = self.path_for(relative_path)
+        if thumb is None or path is None:
+            return None
+        if os.path.exists(thumb):
+            return relative_thumb
+        if Image is None or not os.path.exists(path):
+            return None
+        try:
+            with Image.open(path) as source:
+                # JPEG can decode straight to a reduced size, which is far cheaper than a full decode.
+                source.draft('RGB', (THUMB_SIZE, THUMB_SIZE))
+                image = ImageOps.exif_transpose(source)
+                image.thumbnail((THUMB_SIZE, THUMB_SIZE))
+                if image.mode != 'RGB':
+                    image = image.convert('RGB')
+                os.makedirs(os.path.dirname(thumb), exist_ok=True)
+                tmp_path = f"{thumb}.{os.getpid()}.{threading.get_ident()}.part"
+                image.save(tmp_path, 'JPEG', quality=70, optimize=True)
+        except Exception:
+            logger.warning('Could not make a thumbnail for payment proof %s', relative_path)
+            return None
+        os.replace(tmp_path, thumb)
+        return relative_thumb
+
+
+def send_proof(relative_path, thumbnail=False):
+    """Response for an admin viewing a stored proof (or its thumbnail)."""
+    store = current_app.extensions['proof_store']
+    path = store.path_for(relative_path)
+    if path is None or not os.path.isfile(path):
+        abort(404)
+    if thumbnail:
+        relative_thumb = store.thumbnail(relative_path)
+        if relative_thumb is None:
+            return redirect(url_for('main.serve_payment_proof', filename=relative_path))
+        relative_path, path = relative_thumb, store.path_for(relative_thumb)
+
+    config = current_app.config
+    mimetype = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+    if config['PROOF_SENDFILE'] == 'x-accel':
+        # nginx reads the file from its internal location and answers
+        # conditional and Range requests from it itself.
+        response = current_app.response_class(mimetype=mimetype)
+        response.headers['X-Accel-Redirect'] = config['PROOF_ACCEL_PREFIX'].rstrip('/') + '/' + relative_path
+    else:
+        response = send_file(path, request.environ, mimetype=mimetype, conditional=True,
+                             use_x_sendfile=config['PROOF_SENDFILE'] == 'x-sendfile',
+                             response_class=current_app.response_class, max_age=config['PROOF_MAX_AGE'])
+    # Proofs contain personal data: the admin's browser may keep them, shared caches may not.
+    # They are rewritten once by normalize(), so revalidate rather than mark them immutable.
+    response.headers['Cache-Control'] = f"private, max-age={config['PROOF_MAX_AGE']}"
+    response.headers['X-Content-Type-Options'] = 'nosniff'
+    return response
+
+
+def limit_request():
+    """Cap this request's body at PROOF_MAX_REQUEST_BYTES, below the app-wide MAX_CONTENT_LENGTH.
+
+    Call it before request.form or request.files is touched; a larger
+    Content-Length is then refused with 413 before the body is read.
+    """
+    request.max_content_length = current_app.config['PROOF_MAX_REQUEST_BYTES']
+
+
+def _refuse_static_proofs():
+    if request.endpoint == 'static':
+        prefix = current_app.extensions['proof_static_prefix']
+        filename = posixpath.normpath(request.view_args.get('filename', '').replace('\\', '/'))
+        if prefix and (filename + '/').startswith(prefix):
+            abort(404)
+
+
+def init_app(app):
+    app.config.setdefault('PROOF_MAX_BYTES', 5 * 1024 * 1024)
+    app.config.setdefault('PROOF_WORKERS', 2)
+    app.config.setdefault('PROOF_SENDFILE', None)
+    app.config.setdefault('PROOF_ACCEL_PREFIX', '/_protected/payment_proofs/')
+    app.config.setdefault('PROOF_MAX_AGE', 3600)
+    if app.config['PROOF_SENDFILE'] not in SENDFILE_MODES:
+        raise ValueError(f"PROOF_SENDFILE must be one of {SENDFILE_MODES}")
+    # The proof plus the form fields around it; see limit_request().
+    app.config.setdefault('PROOF_MAX_REQUEST_BYTES', app.config['PROOF_MAX_BYTES'] + 1024 * 1024)
+    app.extensions['proof_store'] = ProofStore(app.config['PAYMENT_PROOF_FOLDER'],
+                                               max_bytes=app.config['PROOF_MAX_BYTES'],
+                                               workers=app.config['PROOF_WORKERS'])
+
+    # Proofs stored under the static folder would otherwise be public at /static/...
+    folder = os.path.realpath(app.config['PAYMENT_PROOF_FOLDER'])
+    static = os.path.realpath(app.static_folder)
+    prefix = None
+    if folder.startswith(static + os.sep):
+        prefix = os.path.relpath(folder, static).replace(os.sep, '/') + '/'
+    app.extensions['proof_static_prefix'] = prefix
+    app.before_request(_refuse_static_proofs)
@@ -0,0 +1,252 @@
+"""Hackathon registrations: writes and the admin list query.
+
+Every registration is inserted inside BEGIN IMMEDIATE, so the idempotency
+check, the ticket allocation and the insert happen under one write lock.
+A unique index on ticket_id makes a duplicate ticket impossible, and one
+on idempotency_key makes a double-submitted form land on the same row.
+
+The admin pages, their JSON endpoint and the exports all filter through
+registration_filters(); lists are keyset-paginated on an indexed sort
+column, and the total is exact only when it is cheap.
+
+Each registration belongs to one event. Legacy rows made before events were
+recorded keep event_id NULL unless there was only one event they could be
+for. Per-event totals, the solo/team split and the college breakdown are
+read from event_registration_stats, which triggers keep in step with every
+insert, update and delete.
+"""
+import secrets
+import sqlite3
+import string
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+import db
+import pagination
+
+TICKET_PREFIX = 'HT-'
+TICKET_DIGITS = 6
+# A collision only costs one more INSERT under the same lock; with a million
+# possible tickets, ten misses in a row means the space is nearly full.
+TICKET_ATTEMPTS = 10
+
+REGISTRATION_FIELDS = ('event_id', 'full_name', 'email', 'phone_number', 'college_name', 'payment_proof', 'participation_type')
+
+LIST_COLUMNS = ('id, event_id, ticket_id, full_name, email, phone_number, college_name, participation_type, '
+                'payment_proof, registration_date')
+# ?sort= value -> (column, descending). Each column has a (column, id) index,
+# and college/type filters have their own (filter, registration_date, id) ones.
+SORTS = {
+    'newest': ('registration_date', True),
+    'oldest': ('registration_date', False),
+    'name': ('full_name', False),
+}
+DEFAULT_SORT = 'newest'
+PAGE_SIZE = 50
+# A filtered total counts at most this many rows; beyond it the page shows "10,000+".
+COUNT_CAP = 10000
+# Colleges listed in an event's breakdown; the rest are summed as "other".
+TOP_COLLEGES = 10
+EVENT_FILTER = 'event_id = ?'
+# Conditions event_registration_stats can answer on its own.
+STATS_FILTERS = {EVENT_FILTER, 'college_name = ?', 'participation_type = ?'}
+
+class EventHasRegistrations(Exception):
+    """delete_event() was asked to delete an event that still has registrations (args[0] is how many)."""
+
+
+RegistrationPage = namedtuple('RegistrationPage', 'rows next_cursor total exact sort')
+EventStats = namedtuple('EventStats', 'total by_type colleges other_colleges')
+
+
+def new_ticket_id():
+    return TICKET_PREFIX + ''.join(secrets.choice(string.digits) for _ in range(TICKET_DIGITS))
+
+
+def new_idempotency_key():
+    """Token embedded in the registration form; one form submission = one registration."""
+    return secrets.token_urlsafe(16)
+
+
+def reissue_duplicate_tickets(conn):
+    """Give a fresh ticket to every registration whose ticket an older one already has.
+
+    Tickets issued before ticket_id had a unique index may collide; the
+    oldest registration keeps its ticket.
+    """
+    duplicates = conn.execute('''
+        SELECT id FROM hackathon_registrations r
+        WHERE ticket_id IS NOT NULL
+          AND EXISTS (SELECT 1 FROM hackathon_registrations o WHERE o.ticket_id = r.ticket_id AND o.id < r.id)
+    ''').fetchall()
+    for row in duplicates:
+        _assign_ticket(conn, 'UPDATE hackathon_registrations SET ticket_id = ? WHERE id = ?', (row['id'],))
+
+
+def _assign_ticket(conn, sql, params):
+    """Execute `sql` with a fresh ticket as its first parameter, retrying on collisions."""
+    for _ in range(TICKET_ATTEMPTS):
+        try:
+            return conn.execute(sql, (new_ticket_id(),) + tuple(params))
+        except sqlite3.IntegrityError as e:
+            if 'ticket_id' not in str(e):
+                raise
+    raise RuntimeError('Could not allocate a unique ticket ID')
+
+
+def create_registration(conn, fields, idempotency_key=None):
+    """Insert a registration and return (id, created).
+
+    If a registration with the same idempotency key already exists, its id
+    is returned with created=False and nothing is written.
+    """
+    def work():
+        if idempotency_key:
+            existing = conn.execute('SELECT id FROM hackathon_registrations WHERE idempotency_key = ?',
+                                    (idempotency_key,)).fetchone()
+            if existing:
+                return existing['id'], False
+        cursor = _assign_ticket(
+            conn,
+            f"INSERT INTO hackathon_registrations (ticket_id, {', '.join(REGISTRATION_FIELDS)}, idempotency_key) "
+            f"VALUES (?, {', '.join('?' * len(REGISTRATION_FIELDS))}, ?)",
+            tuple(fields[name] for name in REGISTRATION_FIELDS) + (idempotency_key,))
+        return cursor.lastrowid, True
+
+    return db.write_transaction(conn, work)
+
+
+def proof_in_use(conn, filename):
+    """True if any registration still points at this stored proof (identical uploads share one file)."""
+    return conn.execute('SELECT 1 FROM hackathon_registrations WHERE payment_proof = ? LIMIT 1',
+                        (filename,)).fetchone() is not None
+
+
+def delete_registration(conn, reg_id):
+    """Delete a registration and return (deleted, proof file no other row uses or None)."""
+    def work():
+        reg = conn.execute('SELECT payment_proof FROM hackathon_registrations WHERE id = ?', (reg_id,)).fetchone()
+        if reg is None:
+            return False, None
+        conn.execute('DELETE FROM hackathon_registrations WHERE id = ?', (reg_id,))
+        return True, None if proof_in_use(conn, reg['payment_proof']) else reg['payment_proof']
+
+    return db.write_transaction(conn, work)
+
+
+def delete_event(conn, event_id):
+    """Delete an event that has no registrations; return (deleted, poster file).
+
+    Raises EventHasRegistrations otherwise: registrations and their proofs
+    are only ever deleted one by one or in a bulk delete, never with their event.
+    """
+    def work():
+        event = conn.execute('SELECT image_file FROM events WHERE id = ?', (event_id,)).fetchone()
+        if event is None:
+            return False, None
+        # Checked under the write lock, so a registration arriving meanwhile cannot be orphaned.
+        if conn.execute('SELECT 1 FROM hackathon_registrations WHERE event_id = ? LIMIT 1', (event_id,)).fetchone():
+            raise EventHasRegistrations(event_totals(conn, [event_id])[event_id])
+        conn.execute('DELETE FROM event_registrations WHERE event_id = ?', (event_id,))
+        conn.execute('DELETE FROM event_registration_stats WHERE event_id = ?', (event_id,))
+        conn.execute('DELETE FROM events WHERE id = ?', (event_id,))
+        return True, event['image_file']
+
+    return db.write_transaction(conn, work)
+
+
+def event_totals(conn, event_ids):
+    """{event_id: registrations} for the given events, read from the stats table."""
+    event_ids = list(event_ids)
+    if not event_ids:
+        return {}
+    totals = dict.fromkeys(event_ids, 0)
+    placeholders = ','.join('?' * len(event_ids))
+    totals.update(conn.execute(f'SELECT event_id, SUM(registrations) FROM event_registration_stats '
+                               f'WHERE event_id IN ({placeholders}) GROUP BY event_id', event_ids).fetchall())
+    return totals
+
+
+def event_stats(conn, event_id):
+    """Total, per-participation-type and per-college counts for one event."""
+    by_type, colleges = {}, {}
+    for row in conn.execute('SELECT college_name, participation_type, registrations FROM event_registration_stats '
+                            'WHERE event_id = ? AND registrations > 0', (event_id,)):
+        kind = row['participation_type'] or 'unspecified'
+        by_type[kind] = by_type.get(kind, 0) + row['registrations']
+        colleges[row['college_name']] = colleges.get(row['college_name'], 0) + row['registrations']
+    ranked = sorted(colleges.items(), key=lambda item: (-item[1], item[0]))
+    return EventStats(sum(by_type.values()), by_type, ranked[:TOP_COLLEGES],
+                      sum(count for _, count in ranked[TOP_COLLEGES:]))
+
+
+def normalize_ticket_prefix(value):
+    """'12', 'ht-12' and 'HT-12' all mean tickets starting with HT-12."""
+    value = (value or '').strip().upper()
+    if value and not value.startswith(TICKET_PREFIX[:len(value)]):
+        value = TICKET_PREFIX + value
+    return value
+
+
+def registration_filters(args):
+    """Build WHERE fragments and params from ?event=&college=&type=&from=&to=&ticket= query args."""
+    where, params = [], []
+    try:
+        event_id = int(args.get('event') or 0)
+    except (TypeError, ValueError):
+        event_id = 0
+    if event_id:
+        where.append(EVENT_FILTER)
+        params.append(event_id)
+    if args.get('college'):
+        where.append('college_name = ?')
+        params.append(args['college'])
+    if args.get('type'):
+        where.append('participation_type = ?')
+        params.append(args['type'])
+    if args.get('from'):
+        where.append('registration_date >= ?')
+        params.append(args['from'])
+    if args.get('to'):
+        # Inclusive end date: everything before the start of the next day.
+        try:
+            end = datetime.strptime(args['to'], '%Y-%m-%d') + timedelta(days=1)
+            where.append('registration_date < ?')
+            params.append(end.strftime('%Y-%m-%d'))
+        except ValueError:
+            pass
+    prefix = normalize_ticket_prefix(args.get('ticket'))
+    if prefix:
+        # A range rather than LIKE, so it is always a seek on the ticket_id index.
+        where.append('ticket_id >= ? AND ticket_id < ?')
+        params.extend((prefix, prefix[:-1] + chr(ord(prefix[-1]) + 1)))
+    return where, params
+
+
+def count_registrations(conn, where=(), params=()):
+    """Return (total, exact). Unfiltered and per-event totals are read from counter tables; others are capped."""
+    if EVENT_FILTER in where and set(where) <= STATS_FILTERS:
+        # The stats table has the same column names, so the same conditions sum it exactly.
+        total = conn.execute(f"SELECT SUM(registrations) FROM event_registration_stats "
+                             f"WHERE {' AND '.join(where)}", params).fetchone()[0]
+        return total or 0, True
+    if not where:
+        row = conn.execute("SELECT row_count FROM table_counts WHERE table_name = 'hackathon_registrations'").fetchone()
+        return (row[0] if row else 0), True
+    total = conn.execute(f"SELECT COUNT(*) FROM (SELECT 1 FROM hackathon_registrations "
+                         f"WHERE {' AND '.join(where)} LIMIT ?)", (*params, COUNT_CAP + 1)).fetchone()[0]
+    return min(total, COUNT_CAP), total <= COUNT_CAP
+
+
+def list_registrations(conn, args, limit=PAGE_SIZE, event_id=None):
+    """One page of registrations (of one event, if given) for the filters, ?sort= and ?cursor= in `args`."""
+    if event_id is not None:
+        args = dict(args.items(), event=event_id)
+    where, params = registration_filters(args)
+    sort = args.get('sort') if args.get('sort') in SORTS else DEFAULT_SORT
+    column, descending = SORTS[sort]
+    rows, next_cursor = pagination.fetch_page(conn, 'hackathon_registrations', LIST_COLUMNS, column,
+                                              cursor=args.get('cursor'), limit=limit,
+                                              where=where, params=params, descending=descending)
+    total, exact = count_registrations(conn, where, params)
+    return RegistrationPage(rows, next_cursor, total, exact, sort)
@@ -0,0 +1,138 @@
+"""Site-wide full-text search over materials, events and gallery captions.
+
+One FTS5 table holds every searchable row. Its rowid encodes the source
+(ref_id * 4 + kind code) so triggers can update or delete a single entry
+without scanning the index.
+"""
+import re
+
+from flask import url_for
+
+import images
+import pagination
+
+KINDS = {'material': 1, 'event': 2, 'photo': 3}
+
+# kind -> (source table, title expression, body expression); {row} becomes
+# "new." inside triggers and "" when backfilling from the table itself.
+SOURCES = {
+    'material': ('materials', '{row}title',
+                 "{row}subject || ' ' || {row}target_year || ' Semester ' || {row}semester"),
+    'event': ('events', '{row}title',
+              "coalesce({row}description, '') || ' ' || coalesce({row}event_manager, '')"),
+    'photo': ('gallery', "coalesce({row}caption, '')", "''"),
+}
+
+MATERIAL_COLUMNS = 'id, title, subject, target_year, semester, file_link, upload_date'
+# Ranked results are paged by offset; deeper pages are not offered (and a huge
+# offset would overflow SQLite's 64-bit integer).
+MAX_OFFSET = 1000
+
+
+def init_schema(conn):
+    exists = conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'search_index'").fetchone()
+    conn.execute('''
+        CREATE VIRTUAL TABLE IF NOT EXISTS search_index
+        USING fts5(kind UNINDEXED, ref_id UNINDEXED, title, body,
+                   tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')
+    ''')
+    for kind, (table, title_sql, body_sql) in SOURCES.items():
+        code = KINDS[kind]
+        new_title, new_body = title_sql.format(row='new.'), body_sql.format(row='new.')
+        conn.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_{table}_search_insert AFTER INSERT ON {table} BEGIN
+                INSERT INTO search_index (rowid, kind, ref_id, title, body)
+                VALUES (new.id * 4 + {code}, '{kind}', new.id, {new_title}, {new_body});
+            END
+        ''')
+        conn.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_{table}_search_update AFTER UPDATE ON {table} BEGIN
+                DELETE FROM search_index WHERE rowid = old.id * 4 + {code};
+                INSERT INTO search_index (rowid, kind, ref_id, title, body)
+                VALUES (new.id * 4 + {code}, '{kind}', new.id, {new_title}, {new_body});
+            END
+        ''')
+        conn.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_{table}_search_delete AFTER DELETE ON {table} BEGIN
+                DELETE FROM search_index WHERE rowid = old.id * 4 + {code};
+            END
+        ''')
+        if not exists:
+            conn.execute(f'''
+                INSERT INTO search_index (rowid, kind, ref_id, title, body)
+                SELECT id * 4 + {code}, '{kind}', id, {title_sql.format(row='')}, {body_sql.format(row='')}
+                FROM {table}
+            ''')
+
+
+def to_match_query(text):
+    """Turn free text into a safe FTS5 query: every word must match, as a prefix.
+
+    The index is not stemmed, so a partly typed word still matches.
+    """
+    words = re.findall(r'\w+', text or '')
+    return ' '.join(f'"{word}"*' for word in words[:10])
+
+
+def parse_offset(cursor):
+    """Offset from a search cursor; anything malformed or past MAX_OFFSET starts again at 0."""
+    if cursor and cursor.isdigit() and len(cursor) <= len(str(MAX_OFFSET)) and int(cursor) <= MAX_OFFSET:
+        return int(cursor)
+    return 0
+
+
+def search(conn, text, kind=None, year=None, offset=0, limit=20):
+    """Ranked (bm25) matches as dicts, one page at a time, plus a has_more flag."""
+    match = to_match_query(text)
+    if not match:
+        return [], False
+
+    sql = 'SELECT s.kind, s.ref_id FROM search_index s'
+    where = ['search_index MATCH ?']
+    params = [match]
+    if kind in KINDS:
+        where.append('s.kind = ?')
+        params.append(kind)
+    if year:
+        sql += " JOIN materials m ON s.kind = 'material' AND m.id = s.ref_id"
+        where.append('m.target_year = ?')
+        params.append(year)
+    sql += ' WHERE ' + ' AND '.join(where) + ' ORDER BY rank LIMIT ? OFFSET ?'
+    params.extend([limit + 1, offset])
+
+    # Not cached: every distinct query would take a slot in the shared page cache and evict real pages.
+    hits = conn.execute(sql, params).fetchall()
+    has_more = len(hits) > limit
+    hits = hits[:limit]
+    return _load_rows(conn, hits), has_more
+
+
+def _load_rows(conn, hits):
+    """Fetch the source rows for a page of hits, keeping the ranked order."""
+    ids = {kind: [hit['ref_id'] for hit in hits if hit['kind'] == kind] for kind in KINDS}
+    rows = {}
+    if ids['material']:
+        for row in _rows_by_id(conn, 'materials', MATERIAL_COLUMNS, ids['material']):
+            rows[('material', row['id'])] = dict(row, type='material')
+    if ids['event']:
+        for row in _rows_by_id(conn, 'events', 'id, title, event_date, description', ids['event']):
+            rows[('event', row['id'])] = dict(row, type='event', url=url_for('main.register_event', event_id=row['id']))
+    if ids['photo']:
+        for row in _rows_by_id(conn, 'gallery', 'id, image_file, caption, upload_date', ids['photo']):
+            rows[('photo', row['id'])] = dict(row, type='photo', url=images.image_url(row['image_file'], 640))
+    return [rows[(hit['kind'], hit['ref_id'])] for hit in hits if (hit['kind'], hit['ref_id']) in rows]
+
+
+def _rows_by_id(conn, table, columns, ids):
+    return conn.execute(f"SELECT {columns} FROM {table} WHERE id IN ({','.join('?' * len(ids))})", ids)
+
+
+def browse_materials(conn, year=None, cursor=None, limit=24):
+    """Newest materials, optionally for one year, keyset-paginated (used when there is no query)."""
+    where, params = [], []
+    if year:
+        where.append('target_year = ?')
+        params.append(year)
+    rows, next_cursor = pagination.fetch_page(conn, 'materials', MATERIAL_COLUMNS, 'upload_date',
+                                              cursor=cursor, limit=limit, where=where, params=params)
+    return [dict(row, type='material') for row in rows], next_cursor
@@ -0,0 +1,203 @@
+AOS.init({ once: true, offset: 50, duration: 800 });
+
+// ========== DARK MODE ==========
+function toggleTheme() {
+    const html = document.documentElement;
+    const currentTheme = html.getAttribute('data-theme');
+    const newTheme = currentTheme === 'dark' ? 'light' : 'dark';
+    html.setAttribute('data-theme', newTheme);
+    localStorage.setItem('theme', newTheme);
+    updateThemeIcons(newTheme);
+}
+
+function updateThemeIcons(theme) {
+    const icons = document.querySelectorAll('#themeIconDesktop, #themeIconMobile');
+    icons.forEach(icon => {
+        icon.className = theme === 'dark' ? 'bi bi-sun-fill' : 'bi bi-moon-fill';
+    });
+}
+
+// Load saved theme
+document.addEventListener('DOMContentLoaded', function () {
+    const savedTheme = localStorage.getItem('theme') || 'light';
+    document.documentElement.setAttribute('data-theme', savedTheme);
+    updateThemeIcons(savedTheme);
+});
+
+// ========== MOBILE MENU ==========
+function toggleMobileMenu() {
+    const nav = document.getElementById('navbarNav');
+    const overlay = document.getElementById('mobileOverlay');
+    nav.classList.toggle('show');
+    overlay.classList.toggle('show');
+    document.body.style.overflow = nav.classList.contains('show') ? 'hidden' : '';
+}
+
+document.getElementById('mobileOverlay').addEventListener('click', toggleMobileMenu);
+
+// ========== TOAST NOTIFICATIONS ==========
+function showToast(message, type = 'info', duration = 4000) {
+    const container = document.getElementById('toastContainer');
+    const toast = document.createElement('div');
+    toast.className = `custom-toast ${type}`;
+
+    const icons = {
+        success: 'bi-check-circle-fill text-success',
+        error: 'bi-x-circle-fill text-danger',
+        warning: 'bi-exclamation-triangle-fill text-warning',
+        info: 'bi-info-circle-fill text-info'
+    };
+
+    toast.innerHTML = `
+        <i class="bi ${icons[type]} fs-4"></i>
+        <span>${message}</span>
+        <button onclick="this.parentElement.remove()" class="btn-close ms-auto" style="font-size: 0.7rem;"></button>
+    `;
+
+    container.appendChild(toast);
+
+    setTimeout(() => {
+        toast.style.animation = 'slideOut 0.4s ease forwards';
+        setTimeout(() => toast.remove(), 400);
+    }, duration);
+}
+
+// ========== LOADING OVERLAY ==========
+function showLoading() {
+    document.getElementById('loadingOverlay').classList.add('show');
+}
+
+function hideLoading() {
+    document.getElementById('loadingOverlay').classList.remove('show');
+}
+
+// Auto-show loading on form submit (excluding AJAX forms)
+document.querySelectorAll('form').forEach(form => {
+    // Skip the feedback form as it uses AJAX
+    if (form.id === 'feedbackForm') return;
+
+    form.addEventListener('submit', function () {
+        showLoading();
+    });
+});
+
+// ========== GALLERY MODAL NAVIGATION ==========
+let galleryPhotos = [];
+let currentPhotoIndex = 0;
+
+document.addEventListener("DOMContentLoaded", function () {
+    // Collect all gallery photos
+    const photoCards = document.querySelectorAll('[data-bs-target="#photoModal"]');
+    galleryPhotos = Array.from(photoCards).map(card => ({
+        src: card.getAttribute('data-src'),
+        caption: card.querySelector('.card-title, .fw-bold, p')?.textContent || ''
+    }));
+
+    var photoModal = document.getElementById('photoModal');
+    if (photoModal) {
+        photoModal.addEventListener('show.bs.modal', function (event) {
+            var button = event.relatedTarget;
+            var imageSrc = button.getAttribute('data-src');
+            document.getElementById('modalImage').src = imageSrc;
+
+            // Find current index
+            currentPhotoIndex = galleryPhotos.findIndex(p => p.src === imageSrc);
+            updatePhotoNavigation();
+        });
+    }
+});
+
+function navigatePhoto(direction) {
+    currentPhotoIndex += direction;
+    if (currentPhotoIndex < 0) currentPhotoIndex = galleryPhotos.length - 1;
+    if (currentPhotoIndex >= galleryPhotos.length) currentPhotoIndex = 0;
+
+    const photo = galleryPhotos[currentPhotoIndex];
+    document.getElementById('modalImage').src = photo.src;
+    document.getElementById('modalCaption').textContent = photo.caption;
+    updatePhotoNavigation();
+}
+
+function updatePhotoNavigation() {
+    const prevBtn = document.getElementById('prevPhoto');
+    const nextBtn = document.getElementById('nextPhoto');
+    if (prevBtn && nextBtn) {
+        prevBtn.style.display = galleryPhotos.length > 1 ? 'block' : 'none';
+        nextBtn.style.display = galleryPhotos.length > 1 ? 'block' : 'none';
+    }
+}
+
+// Keyboard navigation
+document.addEventListener('keydown', function (e) {
+    const modal = document.getElementById('photoModal');
+    if (modal && modal.classList.contains('show')) {
+        if (e.key === 'ArrowLeft') navigatePhoto(-1);
+        if (e.key === 'ArrowRight') navigatePhoto(1);
+    }
+});
+
+// ========== FEEDBACK WIDGET ==========
+function toggleFeedbackWidget() {
+    const popup = document.getElementById('feedbackPopup');
+    popup.classList.toggle('show');
+}
+
+// Close widget when clicking outside
+document.addEventListener('click', function (e) {
+    const widget = document.querySelector('.feedback-widget');
+    const popup = document.getElementById('feedbackPopup');
+    if (widget && !widget.contains(e.target) && popup.classList.contains('show')) {
+        popup.classList.remove('show');
+    }
+});
+
+// Handle feedback form submission with AJAX
+document.addEventListener('DOMContentLoaded', function () {
+    const feedbackForm = document.getElementById('feedbackForm');
+    if (feedbackForm) {
+        feedbackForm.addEventListener('submit', function (e) {
+            e.preventDefault();
+
+            const formData = new FormData(this);
+            const submitBtn = this.querySelector('button[type="submit"]');
+            const originalText = submitBtn.innerHTML;
+
+            // Disable button and show loading
+            submitBtn.disabled = true;
+            submitBtn.innerHTML = '<span class="spinner-border spinner-border-sm me-2"></span>Sending...';
+
+            fetch(this.action, {
+                method: 'POST',
+                body: formData,
+                headers: {
+                    'X-Requested-With': 'XMLHttpRequest'
+                }
+            })
+                .then(response => {
+                    // Parse JSON response
+                    return response.json().then(data => ({
+                        ok: response.ok,
+                        status: response.status,
+                        data: data
+                    }));
+                })
+                .then(result => {
+                    if (result.ok && result.data.success) {
+                        showToast('Thank you! Your feedback has been submitted anonymously.', 'success');
+                        this.reset();
+                        setTimeout(() => toggleFeedbackWidget(), 1000);
+                    } else {
+                        showToast(result.data.message || 'Something went wrong. Please try again.', 'error');
+                    }
+                })
+                .catch(error => {
+                    console.error('Fetch error:', error);
+                    showToast('Network error. Please check your connection.', 'error');
+                })
+                .finally(() => {
+                    submitBtn.disabled = false;
+                    submitBtn.innerHTML = originalText;
+                });
+        });
+    }
+});
@@ -0,0 +1,41 @@
+// ========== LIVE ADMIN UPDATES ==========
+// Listens to /admin/stream (see live.py) and calls handlers[event](data) for
+// 'feedback', 'registration', 'log', 'counts' and 'reset'. `url` carries the
+// ?since= cursor the page was rendered from. If the server turns the stream
+// down (503: too many open in that process) or EventSource is missing, the
+// same URL is polled as JSON instead.
+function liveUpdates(url, handlers) {
+    const EVENTS = ['feedback', 'registration', 'log', 'counts', 'reset'];
+
+    function dispatch(event, data) {
+        if (handlers[event]) handlers[event](data);
+    }
+
+    function poll(since) {
+        const next = new URL(url, window.location.href);
+        if (since) next.searchParams.set('since', since);
+        fetch(next, { headers: { 'Accept': 'application/json' } })
+            .then(r => r.ok ? r.json() : Promise.reject(r))
+            .then(body => {
+                body.events.forEach(e => dispatch(e.event, e.data));
+                setTimeout(() => poll(body.cursor), body.poll_seconds * 1000);
+            })
+            .catch(() => setTimeout(() => poll(since), 30000));
+    }
+
+    if (!window.EventSource) {
+        poll(null);
+        return;
+    }
+    // The id lives on each MessageEvent (EventSource itself has none); polling resumes from it.
+    let lastEventId = null;
+    const source = new EventSource(url);
+    EVENTS.forEach(name => source.addEventListener(name, e => {
+        if (e.lastEventId) lastEventId = e.lastEventId;
+        dispatch(name, JSON.parse(e.data));
+    }));
+    source.onerror = function () {
+        // Network errors reconnect by themselves; an error status closes the source for good.
+        if (source.readyState === EventSource.CLOSED) poll(lastEventId);
+    };
+}
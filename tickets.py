@@ -0,0 +1,292 @@
+"""Printable ticket passes with a QR code, built off the request path.
+
+When a registration is created its pass is queued on a small worker pool:
+a QR code of the ticket ID (a scanner at the door types it straight into
+the admin ticket filter) next to the event, name and college, saved as
+<TICKET_FOLDER>/<last two digits>/<ticket>.png and .pdf. Files are built
+once per ticket and served with a year-long immutable Cache-Control. Their
+URLs carry an HMAC of the ticket ID, because ticket numbers are short
+enough to guess and a pass shows the student's name. For the same reason
+the success page only shows the ticket and its pass URLs to the browser
+session that made the registration, not to anyone who tries its ?reg_id=.
+
+A pass that is not on disk yet (still queued, or lost with a restarted
+worker) is queued on request and answered with 202, so the success page
+never waits for it. With MAIL_SERVER set, the worker then mails the
+registrant a confirmation with the PDF attached; for local testing any SMTP
+stand-in will do, e.g. `python -m aiosmtpd -n -l localhost:1025` with
+MAIL_PORT = 1025.
+
+segno draws the QR code and Pillow lays out the pass; without segno no
+passes are built, and without Pillow the pass is the bare QR code as PNG.
+"""
+import hashlib
+import hmac
+import io
+import logging
+import os
+import smtplib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from email.message import EmailMessage
+
+import click
+from flask import abort, current_app, request, session
+from werkzeug.utils import send_file
+
+import db
+
+try:
+    import segno
+except ImportError:  # segno is optional; without it only the ticket number is shown.
+    segno = None
+
+try:
+    from PIL import Image, ImageDraw, ImageFont
+except ImportError:
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+FORMATS = {'png': 'image/png', 'pdf': 'application/pdf'}
+PASS_SIZE = (1000, 420)
+QR_SCALE = 10
+TOKEN_LENGTH = 16
+MAX_AGE = 365 * 24 * 3600
+# Registrations remembered per browser session (a student may register for a few events).
+OWNED_REGISTRATIONS = 5
+DETAIL_COLUMNS = ('r.ticket_id, r.full_name, r.email, r.college_name, r.participation_type, '
+                  'e.title AS event_title, e.event_date')
+
+
+def ticket_details(conn, ticket_id):
+    """Everything a pass shows for one ticket, or None if no registration has it."""
+    row = conn.execute(f'SELECT {DETAIL_COLUMNS} FROM hackathon_registrations r '
+                       f'LEFT JOIN events e ON e.id = r.event_id WHERE r.ticket_id = ?', (ticket_id,)).fetchone()
+    return dict(row) if row else None
+
+
+def ticket_token(secret, ticket_id):
+    return hmac.new(secret.encode('utf-8'), ticket_id.encode('utf-8'), hashlib.sha256).hexdigest()[:TOKEN_LENGTH]
+
+
+def _font(size):
+    try:
+        return ImageFont.load_default(size=size)
+    except (TypeError, ImportError, OSError):  # Pillow < 10.1 or no FreeType: fixed-size bitmap font.
+        return ImageFont.load_default()
+
+
+class TicketArtifacts:
+    """Builds, caches and mails ticket passes on a worker pool."""
+
+    def __init__(self, folder, workers=2, mail=None):
+        self.folder = folder
+        self.workers = workers
+        # SMTP settings (server, port, use_tls, username, password, sender, timeout) or None.
+        self.mail = mail
+        self._lock = threading.Lock()
+        self._executor = None
+        self._pid = None
+        self._pending = set()
+
+    @property
+    def enabled(self):
+        return segno is not None
+
+    def formats(self):
+        return tuple(FORMATS) if Image is not None else ('png',)
+
+    def path_for(self, ticket_id, fmt):
+        # Tickets are random, so their last two digits spread the files over 100 folders.
+        return os.path.join(self.folder, ticket_id[-2:], f'{ticket_id}.{fmt}')
+
+    def ready(self, ticket_id):
+        return self.enabled and all(os.path.exists(self.path_for(ticket_id, fmt)) for fmt in self.formats())
+
+    def _get_executor(self):
+        # Worker threads do not survive fork(), so each process gets its own pool.
+        with self._lock:
+            if self._executor is None or self._pid != os.getpid():
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='ticket-passes')
+                self._pid = os.getpid()
+            return self._executor
+
+    def submit(self, details, mail_to=None, pass_url=None):
+        """Queue the pass for `details` (see ticket_details) and, if given, the confirmation mail."""
+        if not self.enabled:
+            return None
+        executor = self._get_executor()
+        with self._lock:
+            if details['ticket_id'] in self._pending:
+                return None
+            self._pending.add(details['ticket_id'])
+        return executor.submit(self._build_logged, details, mail_to, pass_url)
+
+    def _build_logged(self, details, mail_to, pass_url):
+        try:
+            if not self.ready(details['ticket_id']):
+                self.build(details)
+            if mail_to and self.mail:
+                send_confirmation(self.mail, mail_to, details, pass_url, self.path_for(details['ticket_id'], 'pdf'))
+        except Exception:
+            logger.exception('Could not build or mail the pass for ticket %s', details['ticket_id'])
+        finally:
+            with self._lock:
+                self._pending.discard(details['ticket_id'])
+
+    def build(self, details):
+        """Write the pass files for one ticket and return their paths."""
+        ticket_id = details['ticket_id']
+        os.makedirs(os.path.dirname(self.path_for(ticket_id, 'png')), exist_ok=True)
+        qr = segno.make(ticket_id, error='m')
+        if Image is None:
+            images = {'png': None}
+        else:
+            # Whole pixels per module, as large as the pass allows, so scanners get crisp edges.
+            scale = (PASS_SIZE[1] - 60) // qr.symbol_size(scale=1, border=2)[0]
+            buffer = io.BytesIO()
+            qr.save(buffer, kind='png', scale=scale, border=2)
+            buffer.seek(0)
+            image = self.render(details, Image.open(buffer).convert('RGB'))
+            images = {'png': image, 'pdf': image}
+        written = []
+        for fmt, image in images.items():
+            path = self.path_for(ticket_id, fmt)
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.part"
+            if image is None:
+                qr.save(tmp_path, kind='png', scale=QR_SCALE, border=2)
+            elif fmt == 'pdf':
+                image.save(tmp_path, 'PDF', resolution=150)
+            else:
+                image.save(tmp_path, 'PNG', optimize=True)
+            os.replace(tmp_path, path)
+            written.append(path)
+        return written
+
+    @staticmethod
+    def render(details, qr_image):
+        width, height = PASS_SIZE
+        card = Image.new('RGB', PASS_SIZE, 'white')
+        draw = ImageDraw.Draw(card)
+        draw.rectangle((0, 0, width, 16), fill=(37, 117, 252))
+        card.paste(qr_image, (30, 40))
+        x = qr_image.width + 70
+        lines = (
+            (details.get('event_title') or 'Event', 34, (33, 37, 41)),
+            (details.get('event_date') or '', 22, (108, 117, 125)),
+            (details['full_name'], 30, (33, 37, 41)),
+            (details['college_name'], 22, (108, 117, 125)),
+            (details.get('participation_type') or '', 22, (108, 117, 125)),
+            (f"TICKET #{details['ticket_id']}", 40, (106, 17, 203)),
+        )
+        y = 50
+        for text, size, colour in lines:
+            if text:
+                draw.text((x, y), str(text)[:40], font=_font(size), fill=colour)
+            y += size + 22
+        return card
+
+
+def send_confirmation(mail, to, details, pass_url=None, attachment=None):
+    """Mail a registration confirmation, with the PDF pass attached if it exists."""
+    message = EmailMessage()
+    message['Subject'] = f"Your ticket {details['ticket_id']} for {details.get('event_title') or 'the event'}"
+    message['From'] = mail['sender']
+    message['To'] = to
+    body = (f"Hi {details['full_name']},\n\n"
+            f"Your registration for {details.get('event_title') or 'the event'} is confirmed.\n"
+            f"Ticket: {details['ticket_id']}\n")
+    if pass_url:
+        body += f"Your pass: {pass_url}\n"
+    message.set_content(body + "\nShow the QR code on your pass at the entrance.\n")
+    if attachment and os.path.exists(attachment):
+        with open(attachment, 'rb') as f:
+            message.add_attachment(f.read(), maintype='application', subtype='pdf',
+                                   filename=f"ticket-{details['ticket_id']}.pdf")
+    with smtplib.SMTP(mail['server'], mail['port'], timeout=mail['timeout']) as smtp:
+        if mail['use_tls']:
+            smtp.starttls()
+        if mail['username']:
+            smtp.login(mail['username'], mail['password'])
+        smtp.send_message(message)
+
+
+def remember_registration(reg_id):
+    """Mark `reg_id` as made by this session, so its success page may show the pass."""
+    owned = [owned_id for owned_id in session.get('registrations', []) if owned_id != reg_id]
+    session['registrations'] = owned[-(OWNED_REGISTRATIONS - 1):] + [reg_id]
+
+
+def owns_registration(reg_id):
+    return reg_id in session.get('registrations', ())
+
+
+def pass_token(ticket_id):
+    return ticket_token(current_app.secret_key, ticket_id)
+
+
+def queue_pass(conn, ticket_id, mail_to=None, pass_url=None):
+    """Queue the pass for a ticket; returns False if there is no such registration."""
+    details = ticket_details(conn, ticket_id)
+    if details is None:
+        return False
+    current_app.extensions['ticket_artifacts'].submit(details, mail_to=mail_to, pass_url=pass_url)
+    return True
+
+
+def send_pass(conn, ticket_id, token, fmt):
+    """Response for a pass file: the cached file, or 202 while it is being built."""
+    artifacts = current_app.extensions['ticket_artifacts']
+    if (not artifacts.enabled or fmt not in artifacts.formats()
+            or not hmac.compare_digest(token, pass_token(ticket_id))):
+        abort(404)
+    path = artifacts.path_for(ticket_id, fmt)
+    if not os.path.isfile(path):
+        if not queue_pass(conn, ticket_id):
+            abort(404)
+        response = current_app.response_class('The pass is being prepared.', status=202, mimetype='text/plain')
+        response.headers['Retry-After'] = '1'
+        response.headers['Cache-Control'] = 'no-store'
+        return response
+    response = send_file(path, request.environ, mimetype=FORMATS[fmt], conditional=True,
+                         response_class=current_app.response_class, max_age=current_app.config['TICKET_MAX_AGE'],
+                         download_name=f'ticket-{ticket_id}.{fmt}', as_attachment=fmt == 'pdf')
+    # A pass never changes once written, but it shows a name: browsers only.
+    response.headers['Cache-Control'] = f"private, max-age={current_app.config['TICKET_MAX_AGE']}, immutable"
+    return response
+
+
+def init_app(app):
+    app.config.setdefault('TICKET_FOLDER', os.path.join(app.root_path, 'tickets'))
+    app.config.setdefault('TICKET_WORKERS', 2)
+    app.config.setdefault('TICKET_MAX_AGE', MAX_AGE)
+    # Confirmation mails are only sent when MAIL_SERVER is set.
+    app.config.setdefault('MAIL_SERVER', None)
+    app.config.setdefault('MAIL_PORT', 25)
+    app.config.setdefault('MAIL_USE_TLS', False)
+    app.config.setdefault('MAIL_USERNAME', None)
+    app.config.setdefault('MAIL_PASSWORD', None)
+    app.config.setdefault('MAIL_SENDER', 'no-reply@localhost')
+    app.config.setdefault('MAIL_TIMEOUT', 10)
+    mail = None
+    if app.config['MAIL_SERVER']:
+        mail = {key.lower(): app.config['MAIL_' + key.upper()]
+                for key in ('server', 'port', 'use_tls', 'username', 'password', 'sender', 'timeout')}
+    artifacts = TicketArtifacts(app.config['TICKET_FOLDER'], workers=app.config['TICKET_WORKERS'], mail=mail)
+    app.extensions['ticket_artifacts'] = artifacts
+
+    @app.cli.command('build-tickets')
+    def build_tickets_command():
+        """Build missing passes for every registration."""
+        if not artifacts.enabled:
+            raise click.ClickException('segno is not installed.')
+        conn = db.connect(app.config['DATABASE'])
+        rows = conn.execute(f'SELECT {DETAIL_COLUMNS} FROM hackathon_registrations r '
+                            f'LEFT JOIN events e ON e.id = r.event_id WHERE r.ticket_id IS NOT NULL')
+        futures = [artifacts.submit(dict(row)) for row in rows if not artifacts.ready(row['ticket_id'])]
+        conn.close()
+        futures = [future for future in futures if future is not None]
+        for future in futures:
+            future.result()
+        click.echo(f'Built passes for {len(futures)} ticket(s).')
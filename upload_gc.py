@@ -0,0 +1,259 @@
+"""Incremental garbage collection of orphaned uploads.
+
+    flask gc-uploads [--dry-run] [--batch 500] [--grace-hours 24] [--all]
+
+Walks the upload, payment proof and ticket pass folders in path order, a
+batch of files per run, and deletes files that nothing refers to any more:
+
+* uploads/<name>                 no gallery photo or event poster uses it and
+                                 no template links it (favicon, logos);
+* uploads/variants/<stem>_w*     the image it was resized from is unused;
+* payment_proofs/<path>          no registration points at it;
+* payment_proofs/thumbs/<stem>   the proof it was made from is unused;
+* tickets/<nn>/<ticket>.*        no registration has that ticket any more;
+* *.part, payment_proofs/tmp/    uploads that were interrupted.
+
+Where each walk stopped is kept in the gc_cursors table, so a cron job can
+run a small batch every few minutes; a finished pass starts over from the
+beginning. A batch bounds the lookups and deletions per run, not the
+listing: resuming in path order means each run scans and sorts every
+directory it enters. Payment proofs and ticket passes are sharded into
+small folders, but uploads/ is one flat folder, so every run lists it
+whole and holds the names after the cursor in memory. Files modified
+within the grace period are never deleted, which covers an upload whose row
+is not committed yet and a stored file that a new upload has just reused
+(saving an identical file refreshes its mtime).
+"""
+import os
+import re
+import time
+
+import click
+
+import db
+
+BATCH_SIZE = 500
+GRACE_SECONDS = 24 * 3600
+TEMP_SUFFIX = '.part'
+VARIANT_FOLDER = 'variants'
+THUMB_FOLDER = 'thumbs'
+PROOF_TMP_FOLDER = 'tmp'
+
+_VARIANT = re.compile(r'^(.+)_w\d+\.\w+$')
+# uploads/<name> inside a quoted or url(...) reference, e.g. url_for('static', filename='uploads/church.jpg').
+_LINKED_UPLOAD = re.compile(r"""uploads/([^'"()\s][^'"()]*)['")]""")
+
+
+def linked_uploads(folders):
+    """Upload names that templates, CSS or JS link to directly; those are never collected."""
+    names = set()
+    for folder in folders:
+        for dirpath, _, filenames in os.walk(folder):
+            for filename in filenames:
+                if filename.endswith(('.html', '.css', '.js')):
+                    with open(os.path.join(dirpath, filename), encoding='utf-8', errors='replace') as f:
+                        names.update(_LINKED_UPLOAD.findall(f.read()))
+    return names
+
+
+def iter_files(root, after='', skip=()):
+    """Yield (relative path, DirEntry) for files under `root` whose path sorts after `after`.
+
+    Entries are visited in the same order their '/'-joined paths sort in, so
+    a walk can resume from a saved path. Each directory entered is listed in
+    full and its entries after the resume point are sorted in memory.
+    """
+    def before_resume_point(entry, rel):
+        if entry.is_dir(follow_symlinks=False):
+            # A subtree lying wholly before the resume point.
+            return after > rel + '/' and not after.startswith(rel + '/')
+        return rel <= after
+
+    def walk(path, prefix):
+        try:
+            with os.scandir(path) as it:
+                entries = [e for e in it if not (after and before_resume_point(e, prefix + e.name))
+                           and os.path.realpath(e.path) not in skip]
+        except FileNotFoundError:
+            return
+        # A directory sorts as "name/" so the order matches the full paths.
+        entries.sort(key=lambda e: e.name + '/' if e.is_dir(follow_symlinks=False) else e.name)
+        for entry in entries:
+            rel = prefix + entry.name
+            if entry.is_dir(follow_symlinks=False):
+                yield from walk(entry.path, rel + '/')
+            elif entry.is_file(follow_symlinks=False):
+                yield rel, entry
+
+    yield from walk(root, '')
+
+
+def _stem_in_use(conn, table, column, stem):
+    # Every name stem.<ext> sorts between "stem." and "stem/", so this is a seek on the column's index.
+    return conn.execute(f'SELECT 1 FROM {table} WHERE {column} >= ? AND {column} < ? LIMIT 1',
+                        (stem + '.', stem + '/')).fetchone() is not None
+
+
+def _name_in_use(conn, table, column, name):
+    return conn.execute(f'SELECT 1 FROM {table} WHERE {column} = ? LIMIT 1', (name,)).fetchone() is not None
+
+
+def upload_in_use(conn, rel, keep):
+    """Whether a file in the upload folder is still needed (True for anything not recognised)."""
+    if rel.startswith(VARIANT_FOLDER + '/'):
+        match = _VARIANT.match(rel[len(VARIANT_FOLDER) + 1:])
+        if not match:
+            return True
+        return any(_stem_in_use(conn, table, 'image_file', match.group(1)) for table in ('gallery', 'events'))
+    if '/' in rel:
+        return True
+    return rel in keep or any(_name_in_use(conn, table, 'image_file', rel) for table in ('gallery', 'events'))
+
+
+def proof_in_use(conn, rel, keep):
+    if rel.startswith(THUMB_FOLDER + '/'):
+        stem = os.path.splitext(rel[len(THUMB_FOLDER) + 1:])[0]
+        return _stem_in_use(conn, 'hackathon_registrations', 'payment_proof', stem)
+    return _name_in_use(conn, 'hackathon_registrations', 'payment_proof', rel)
+
+
+def ticket_in_use(conn, rel, keep):
+    ticket_id = os.path.splitext(os.path.basename(rel))[0]
+    return _name_in_use(conn, 'hackathon_registrations', 'ticket_id', ticket_id)
+
+
+def _is_temporary(root_name, rel):
+    return rel.endswith(TEMP_SUFFIX) or (root_name == 'proofs' and rel.startswith(PROOF_TMP_FOLDER + '/'))
+
+
+def load_cursor(conn, root_name):
+    row = conn.execute('SELECT cursor FROM gc_cursors WHERE root = ?', (root_name,)).fetchone()
+    return row[0] if row else ''
+
+
+def save_cursor(conn, root_name, cursor):
+    with conn:
+        conn.execute('INSERT INTO gc_cursors (root, cursor, updated_at) VALUES (?, ?, CURRENT_TIMESTAMP) '
+                     'ON CONFLICT (root) DO UPDATE SET cursor = excluded.cursor, updated_at = excluded.updated_at',
+                     (root_name, cursor))
+
+
+def collect(conn, root_name, root, in_use, keep=(), skip=(), batch=BATCH_SIZE, grace=GRACE_SECONDS,
+            dry_run=False, cursor=None):
+    """Examine up to `batch` files after the saved cursor and delete the orphaned ones.
+
+    Returns a report dict. A dry run deletes nothing and leaves the cursor alone.
+    """
+    after = load_cursor(conn, root_name) if cursor is None else cursor
+    cutoff = time.time() - grace
+    report = {'root': root_name, 'scanned': 0, 'orphaned': 0, 'bytes': 0, 'errors': [], 'files': [],
+              'finished_pass': False, 'cursor': after}
+    last = after
+    for rel, entry in iter_files(root, after, skip):
+        if report['scanned'] >= batch:
+            break
+        report['scanned'] += 1
+        last = rel
+        try:
+            info = entry.stat(follow_symlinks=False)
+        except FileNotFoundError:
+            continue
+        if info.st_mtime > cutoff:
+            continue
+        if not _is_temporary(root_name, rel) and in_use(conn, rel, keep):
+            continue
+        if not dry_run:
+            try:
+                os.remove(entry.path)
+            except FileNotFoundError:
+                continue
+            except OSError as e:
+                report['errors'].append({'file': rel, 'error': str(e)})
+                continue
+        report['orphaned'] += 1
+        report['bytes'] += info.st_size
+        report['files'].append(rel)
+    else:
+        # The walk ran out of files: the next run starts a new pass.
+        report['finished_pass'] = True
+        last = ''
+    report['cursor'] = last
+    if not dry_run:
+        save_cursor(conn, root_name, last)
+    return report
+
+
+def roots(config):
+    """(name, folder, in_use, folders to leave out) for every upload area."""
+    proofs = os.path.realpath(config['PAYMENT_PROOF_FOLDER'])
+    passes = os.path.realpath(config['TICKET_FOLDER'])
+    return (
+        ('uploads', config['UPLOAD_FOLDER'], upload_in_use, {proofs, passes}),
+        ('proofs', config['PAYMENT_PROOF_FOLDER'], proof_in_use, set()),
+        ('tickets', config['TICKET_FOLDER'], ticket_in_use, set()),
+    )
+
+
+def run(app, batch=BATCH_SIZE, grace=GRACE_SECONDS, dry_run=False, full=False):
+    """Run one batch per upload area (or whole passes with `full`) and return the reports."""
+    folders = [os.path.join(app.root_path, app.template_folder), app.static_folder]
+    keep = linked_uploads(folder for folder in folders if folder) | set(app.config['UPLOAD_GC_KEEP'])
+    conn = db.connect(app.config['DATABASE'])
+    reports = []
+    try:
+        for name, folder, in_use, skip in roots(app.config):
+            cursor = '' if full else None
+            total = None
+            while True:
+                report = collect(conn, name, folder, in_use, keep=keep, skip=skip, batch=batch, grace=grace,
+                                 dry_run=dry_run, cursor=cursor)
+                if total is None:
+                    total = report
+                else:
+                    for key in ('scanned', 'orphaned', 'bytes'):
+                        total[key] += report[key]
+                    total['errors'] += report['errors']
+                    total['files'] += report['files']
+                    total['finished_pass'], total['cursor'] = report['finished_pass'], report['cursor']
+                if not full or report['finished_pass']:
+                    break
+                cursor = report['cursor']
+            reports.append(total)
+    finally:
+        conn.close()
+    return reports
+
+
+def init_schema(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS gc_cursors (
+            root TEXT PRIMARY KEY,
+            cursor TEXT NOT NULL,
+            updated_at TIMESTAMP
+        )
+    ''')
+
+
+def init_app(app):
+    # Upload names to keep even though no row or template mentions them.
+    app.config.setdefault('UPLOAD_GC_KEEP', ())
+
+    @app.cli.command('gc-uploads')
+    @click.option('--dry-run', is_flag=True, help='Report what would be deleted without deleting it.')
+    @click.option('--batch', default=BATCH_SIZE, show_default=True, help='Files to examine per upload area.')
+    @click.option('--grace-hours', default=GRACE_SECONDS / 3600, show_default=True,
+                  help='Never delete files modified more recently than this.')
+    @click.option('--all', 'full', is_flag=True, help='Walk every file from the start instead of one batch.')
+    @click.option('--verbose', '-v', is_flag=True, help='List every orphaned file.')
+    def gc_uploads_command(dry_run, batch, grace_hours, full, verbose):
+        """Delete uploaded files that no database row refers to."""
+        for report in run(app, batch=batch, grace=grace_hours * 3600, dry_run=dry_run, full=full):
+            if verbose:
+                for rel in report['files']:
+                    click.echo(f"  {report['root']}/{rel}")
+            state = 'pass complete' if report['finished_pass'] else f"resumes after {report['cursor']}"
+            click.echo(f"{report['root']}: scanned {report['scanned']}, "
+                       f"{'would delete' if dry_run else 'deleted'} {report['orphaned']} "
+                       f"({report['bytes'] / 1024 / 1024:.1f} MB), {state}")
+            for error in report['errors']:
+                click.echo(f"  could not delete {error['file']}: {error['error']}")